@@ -0,0 +1,93 @@
+# 音量だけの無音検出(energy_vad)と inaSpeechSegmenter(CNN) の比較
+# 処理時間と、20msごとに「無音(noEnergy)かどうか」の判定がどれだけ一致するかを出す（ffmpeg、CNNの比較にはinaSpeechSegmenterが必要）
+#   py bench/energy_vad_bench.py 音声ファイル [音声ファイル...]
+import os
+import sys
+import time
+import subprocess
+
+files = sys.argv[1:]
+sys.argv = [sys.argv[0], "--files", "dummy"]  # commonが実行引数を読むので差し替える
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+import numpy as np
+import seg
+import segmenter
+import energy_vad
+
+WINDOW = seg.STREAM_WINDOW * energy_vad.SAMPLE_RATE // 1000  # 無音解析と同じ長さごとに判定する
+FRAME = 0.02
+
+
+# 16kHz monoにデコードする
+def decode(input_file):
+    args = ["ffmpeg", "-v", "error", "-i", input_file, "-vn", "-ac", "1", "-ar", "16000"]
+    args += ["-acodec", "pcm_s16le", "-f", "s16le", "-"]
+    return np.frombuffer(subprocess.run(args, stdout=subprocess.PIPE, check=True).stdout, dtype="<i2")
+
+
+# 区間ごとに解析して、かかった時間と結果を返す
+def run(func, samples):
+    start = time.perf_counter()
+    segmentation = []
+    for pos in range(0, len(samples), WINDOW):
+        segmentation += func(samples[pos : pos + WINDOW], pos / energy_vad.SAMPLE_RATE)
+    return time.perf_counter() - start, segmentation
+
+
+# 20msごとに音があるかどうか(noEnergy以外)の配列にする
+def toFrames(segmentation, frame_count):
+    frames = np.zeros(frame_count, dtype=bool)
+    for label, start, end in segmentation:
+        if label != "noEnergy":
+            frames[int(round(start / FRAME)) : int(round(end / FRAME))] = True
+    return frames
+
+
+def main():
+    if len(files) == 0:
+        print("音声ファイルを指定してください")
+        sys.exit(1)
+
+    use_cnn = seg.isStreamingSupported()
+    if use_cnn:
+        segmenter.release(segmenter.acquire())  # モデルの読み込みは計測に含めない
+        print("CNNモデル読み込み:{:.1f}sec".format(segmenter.getStats()["load_time"]))
+    else:
+        print("inaSpeechSegmenterがないため、CNNとの比較はしません")
+
+    for input_file in files:
+        samples = decode(input_file)
+        length = len(samples) / energy_vad.SAMPLE_RATE
+        frame_count = int(length / FRAME)
+        print("---- {} ({:.1f}min)".format(os.path.basename(input_file), length / 60))
+
+        energy_time, energy_seg = run(energy_vad.segment, samples)
+        energy_frames = toFrames(energy_seg, frame_count)
+        print(
+            "energy: {:>8.2f}sec (実時間の{:.0f}倍速) 音あり:{:.1f}%".format(
+                energy_time, length / max(energy_time, 1e-9), 100 * energy_frames.mean()
+            )
+        )
+        if not use_cnn:
+            continue
+
+        cnn_time, cnn_seg = run(seg.segmentSamples, samples)
+        cnn_frames = toFrames(cnn_seg, frame_count)
+        print(
+            "cnn   : {:>8.2f}sec (実時間の{:.0f}倍速) 音あり:{:.1f}%".format(
+                cnn_time, length / max(cnn_time, 1e-9), 100 * cnn_frames.mean()
+            )
+        )
+
+        both = (energy_frames & cnn_frames).sum()
+        print(
+            "一致率:{:.2f}%  CNNで音ありのうちenergyでも音あり:{:.2f}%  energyで音ありのうちCNNでも音あり:{:.2f}%".format(
+                100 * (energy_frames == cnn_frames).mean(),
+                100 * both / max(cnn_frames.sum(), 1),
+                100 * both / max(energy_frames.sum(), 1),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# 入力ファイルの指紋計算のベンチマーク
+# 1セグメント認識するごとにreadConfig/updateConfigが呼ばれたときの、1回あたりのコストを比較する
+#   py bench/fingerprint_bench.py [ファイルサイズ(MB)] [呼び出し回数]
+import os
+import sys
+import time
+import hashlib
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+import fingerprint
+
+
+# 従来の実装（ファイル全体をメモリに読んでhash）
+def legacyHash(input_file):
+    with open(input_file, "rb") as file:
+        return hashlib.sha3_256(file.read()).hexdigest()
+
+
+def measure(label, func, count):
+    start = time.perf_counter()
+    for i in range(count):
+        func()
+    elapsed = time.perf_counter() - start
+    print("{:<28} {:>10.3f} ms/call".format(label, elapsed / count * 1000))
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fingerprint.CACHE_FILE = os.path.join(tmpdir, "fingerprint_cache.json")
+        input_file = os.path.join(tmpdir, "input.bin")
+        with open(input_file, "wb") as f:
+            for i in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+
+        print("file size: {}MB, calls: {}".format(size_mb, count))
+
+        assert legacyHash(input_file) == fingerprint.getFingerprint(input_file)
+        fingerprint.memory_cache.clear()
+        os.remove(fingerprint.CACHE_FILE)
+        fingerprint.disk_cache = None
+
+        measure("legacy (read all + hash)", lambda: legacyHash(input_file), count)
+        measure("streaming full (no cache)", lambda: fingerprint.fullHash(input_file), count)
+        measure(
+            "sampled (no cache)",
+            lambda: fingerprint.sampledHash(input_file, os.path.getsize(input_file)),
+            count,
+        )
+
+        fingerprint.getFingerprint(input_file)  # キャッシュ作成
+        measure("cached (memory)", lambda: fingerprint.getFingerprint(input_file), count * 100)
+
+        def fromDisk():
+            fingerprint.memory_cache.clear()
+            fingerprint.disk_cache = None
+            fingerprint.getFingerprint(input_file)
+
+        measure("cached (disk, new process)", fromDisk, count * 10)
+
+
+if __name__ == "__main__":
+    main()
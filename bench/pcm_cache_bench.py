@@ -0,0 +1,108 @@
+# デコード結果キャッシュ(pcm_cache)のベンチマーク
+# 従来の処理（無音解析の区間ごとにフィルタ付きでデコード、分割ファイルごとに元の音声をシークしてデコード）と、
+# 1回だけデコードしてそこから切り出す処理で、ffmpegの合計CPU時間を比較する（ffmpegが必要）
+#   py bench/pcm_cache_bench.py [音声の長さ(分)] [分割ファイル数] [無音解析の区間の長さ(分)]
+import os
+import sys
+import tempfile
+
+minutes = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+cut_count = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+chunk_minutes = int(sys.argv[3]) if len(sys.argv) > 3 else 30
+
+sys.argv = [sys.argv[0], "--files", "dummy"]  # commonが実行引数を読むので差し替える
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+import ffmpegjob
+import pcm_cache
+
+FILTER_STRENGTH = 0.1
+
+
+def resetStats():
+    with ffmpegjob.lock:
+        ffmpegjob.stats.update({"count": 0, "wall_time": 0.0, "cpu_time": 0.0})
+
+
+def report(label):
+    stats = ffmpegjob.getStats()
+    print(
+        "{:<28} ffmpeg {:>5}回  CPU {:>8.1f}sec  実時間合計 {:>8.1f}sec".format(
+            label, stats["count"], stats["cpu_time"], stats["wall_time"]
+        )
+    )
+
+
+# 分割ファイルの切り出し範囲（ミリ秒）
+def cutRanges():
+    length = minutes * 60 * 1000 / cut_count
+    return [(i * length, i * length + min(length, 10 * 1000)) for i in range(cut_count)]
+
+
+# 従来の処理
+def legacy(input_file, workdir):
+    chunk_len = chunk_minutes * 60 * 1000
+    for start in range(0, minutes * 60 * 1000, chunk_len):
+        ffmpegjob.run(
+            ["ffmpeg", "-ss", str(start / 1000), "-t", str(chunk_len / 1000), "-i", input_file]
+            + ["-af", "anlmdn=s={}".format(FILTER_STRENGTH), "-vn", "-acodec", "flac", "-y"],
+            output_file=os.path.join(workdir, "tmp.flac"),
+        )
+
+    jobs = [
+        ffmpegjob.submit(
+            ["ffmpeg", "-ss", str(start / 1000), "-t", str((end - start) / 1000), "-i", input_file]
+            + ["-vn", "-acodec", "flac", "-y"],
+            output_file=os.path.join(workdir, "legacy_{}.flac".format(i)),
+        )
+        for i, (start, end) in enumerate(cutRanges())
+    ]
+    for job in jobs:
+        job.result()
+
+
+# デコード結果キャッシュを使う処理
+def cached(input_file, workdir):
+    pcm_cache.getPcmFile(input_file, FILTER_STRENGTH)
+    pcm_cache.getPcmFile(input_file)
+    source_file = pcm_cache.getFullRatePcmFile(input_file)
+
+    jobs = [
+        ffmpegjob.submit(
+            ["ffmpeg", "-ss", str(start / 1000), "-t", str((end - start) / 1000), "-i", source_file]
+            + ["-vn", "-acodec", "flac", "-y"],
+            output_file=os.path.join(workdir, "cached_{}.flac".format(i)),
+        )
+        for i, (start, end) in enumerate(cutRanges())
+    ]
+    for job in jobs:
+        job.result()
+
+    samples = pcm_cache.openPcm(input_file)
+    total = 0
+    for start, end in cutRanges():  # 音声認識に渡す範囲はviewで取り出すだけ
+        total += len(pcm_cache.slicePcm(samples, start, end))
+    print("16kHz PCMから切り出したサンプル数:{}".format(total))
+
+
+def main():
+    with tempfile.TemporaryDirectory() as workdir:
+        input_file = os.path.join(workdir, "input.m4a")
+        print("テスト音声作成中… {}分".format(minutes))
+        ffmpegjob.run(
+            ["ffmpeg", "-f", "lavfi", "-i", "anoisesrc=d={}:c=pink:r=48000:a=0.1".format(minutes * 60)]
+            + ["-ac", "2", "-c:a", "aac", "-y"],
+            output_file=input_file,
+        )
+        print("分割ファイル数:{} 無音解析の区間:{}分".format(cut_count, chunk_minutes))
+
+        resetStats()
+        legacy(input_file, workdir)
+        report("従来(区間・分割ごとにデコード)")
+
+        resetStats()
+        cached(input_file, workdir)
+        report("デコード結果キャッシュ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# プロジェクトDB(SQLite)と分割結果ファイル(_split.txt)の読み込みのベンチマーク
+# 10時間・20000セグメントのセッションを想定したダミーデータで比較する
+#   py bench/projectdb_bench.py [セグメント数] [時間(h)]
+import os
+import sys
+import time
+import codecs
+import random
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+import projectdb
+
+
+def measure(label, func, count):
+    start = time.perf_counter()
+    for i in range(count):
+        func()
+    elapsed = time.perf_counter() - start
+    print("{:<36} {:>10.3f} ms/call".format(label, elapsed / count * 1000))
+
+
+def main():
+    segments = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    hours = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = os.path.join(tmpdir, "speaker.flac")
+        split_result_file = os.path.join(tmpdir, "_speaker_split.txt")
+
+        # ダミーの分割結果
+        duration = hours * 60 * 60 * 1000
+        step = duration / segments
+        rows = list()
+        for i in range(segments):
+            start_time = i * step + random.random() * 100
+            end_time = start_time + step * 0.8
+            rows.append(
+                [i + 1, os.path.join(tmpdir, "speaker_{}.flac".format(i + 1)), start_time, end_time, end_time - start_time, start_time + 50, end_time - 50]
+            )
+
+        with open(split_result_file, "w", encoding="CP932") as f:
+            for row in rows:
+                f.write("\t".join([str(v) for v in row]) + "\n")
+
+        projectdb.openTrack(input_file, "dummy")
+        start = time.perf_counter()
+        projectdb.writeSplitPlan(input_file, rows)
+        print("segments: {}, duration: {}h".format(segments, hours))
+        print("{:<36} {:>10.3f} ms".format("db write (once)", (time.perf_counter() - start) * 1000))
+
+        def readText():
+            with codecs.open(split_result_file, "r", "CP932", "ignore") as f:
+                return [line.split("\t") for line in f.readlines()]
+
+        measure("text: parse whole split plan", readText, 20)
+        measure("db: read whole split plan", lambda: projectdb.readSplitPlan(input_file), 20)
+        measure("db: count", lambda: projectdb.countSplitPlan(input_file), 200)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# 起動時間のベンチマーク
+# 各モジュールのimportにかかる時間と、all.py を起動してから最初のログが出るまでの時間を測る
+#   py bench/startup_bench.py [試行回数]
+import os
+import re
+import sys
+import time
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SRC = os.path.join(ROOT, "src")
+MODULES = ["common", "seg", "split", "speech_rec", "speech_rec_wit", "speech_rec_whisper", "merge", "all"]
+
+
+# モジュールをimportしたときの時間（-X importtimeの累積時間、マイクロ秒）
+def importTime(module):
+    code = "import sys; sys.argv = ['x', '--files', 'x']; sys.path.insert(0, {!r}); import {}".format(SRC, module)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    for line in reversed(proc.stderr.splitlines()):
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s+" + re.escape(module) + "$", line)
+        if m:
+            return int(m.group(1))
+    return None  # importに失敗した（依存パッケージがないなど）
+
+
+# all.pyを起動して、最初のログ行が出るまでの時間（秒）
+def firstLogTime():
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(SRC, "all.py"), "--files", "__not_exist__.wav"],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    proc.stdout.readline()
+    elapsed = time.perf_counter() - start
+    proc.kill()
+    proc.wait()
+    return elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    for module in MODULES:
+        times = [importTime(module) for i in range(count)]
+        if None in times:
+            print("{:<22} import failed".format(module))
+            continue
+        print("{:<22} {:>10.1f} ms".format(module, min(times) / 1000))
+
+    times = [firstLogTime() for i in range(count)]
+    print("{:<22} {:>10.1f} ms".format("all.py first log", min(times) * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Whisperでセグメントをバッチで推論した場合(whisper_batch_size)と、1つずつ認識した場合のCPUでの比較
+# モデルごとに1秒あたりに認識できたセグメント数と、1つずつ認識した結果を正としたときの文字誤り率を出す（whisperが必要）
+# 音声分割設定まで終わっている(_x_split.txtがある)音声ファイルを指定する
+#   py bench/whisper_batch_bench.py モデル名(カンマ区切り) セグメント数 バッチサイズ(0なら自動) 音声ファイル [音声ファイル...]
+import os
+import sys
+import time
+
+os.environ["CUDA_VISIBLE_DEVICES"] = ""  # CPUで比較する
+
+modelnames = (sys.argv[1] if len(sys.argv) > 1 else "tiny,base,small").split(",")
+limit = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+files = sys.argv[4:]
+sys.argv = [sys.argv[0], "--files", "dummy"]  # commonが実行引数を読むので差し替える
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+import common
+import rec_input
+import speech_rec_whisper
+
+
+# 編集距離（文字単位）
+def editDistance(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+# セグメントを認識して、かかった時間とセグメントごとのテキストを返す
+def run(source, segments, language, size):
+    start = time.perf_counter()
+    texts = []
+    units = speech_rec_whisper.packSegments(segments, 0)
+    for unit, unit_texts in speech_rec_whisper.recognizeUnits(source, units, language, size):
+        texts += unit_texts
+    return time.perf_counter() - start, [text.strip() for text in texts]
+
+
+def main():
+    if len(files) == 0:
+        print("音声ファイルを指定してください")
+        sys.exit(1)
+
+    settings = common.getSettings()
+    inputs = []
+    for input_file in files:
+        prefix = common.getSplitAudioFilePrefix(input_file)
+        segments = [speech_rec_whisper.toSegment(row, prefix) for row in common.readSplitResult(input_file)][:limit]
+        inputs.append((input_file, rec_input.openSource(input_file), segments))
+
+    for modelname in modelnames:
+        speech_rec_whisper.model = speech_rec_whisper.loadModel(modelname)
+        size = batch_size
+        if size <= 0:
+            size = speech_rec_whisper.getBatchSize(settings._replace(whisper_model=modelname, whisper_batch_size=0))
+
+        for input_file, source, segments in inputs:
+            print("---- {} {} ({}セグメント バッチサイズ{})".format(modelname, os.path.basename(input_file), len(segments), size))
+            single_time, single_texts = run(source, segments, settings.whisper_language, 1)
+            batch_time, batch_texts = run(source, segments, settings.whisper_language, size)
+
+            print("1つずつ: {:>8.2f}sec {:.2f}セグメント/sec".format(single_time, len(segments) / single_time))
+            print(
+                "バッチ : {:>8.2f}sec {:.2f}セグメント/sec ({:.1f}倍)".format(
+                    batch_time, len(segments) / batch_time, single_time / batch_time
+                )
+            )
+            errors = sum(editDistance(a, b) for a, b in zip(single_texts, batch_texts))
+            chars = max(1, sum(len(text) for text in single_texts))
+            print("文字誤り率：{:.2f}%".format(100 * errors / chars))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# バイナリ版Whisper(whisper.cpp)と、PyTorch版Whisperの比較
+# 処理時間(実時間の何倍速か)と、PyTorch版の結果を正としたときの文字誤り率を出す（whisper、whisper.cppのmainとモデルが必要）
+# 音声分割設定まで終わっている(_x_split.txtがある)音声ファイルを指定する。DisNOTEのフォルダで実行すること
+#   py bench/whisper_binary_bench.py モデル名 音声ファイル [音声ファイル...]
+import os
+import sys
+import time
+
+modelname = sys.argv[1] if len(sys.argv) > 1 else "base"
+files = sys.argv[2:]
+sys.argv = [sys.argv[0], "--files", "dummy"]  # commonが実行引数を読むので差し替える
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+import common
+import rec_input
+import speech_rec_whisper
+import whisper_binary
+
+
+# 編集距離（文字単位）
+def editDistance(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def main():
+    if len(files) == 0:
+        print("音声ファイルを指定してください")
+        sys.exit(1)
+
+    reason = whisper_binary.reasonUnavailable(modelname)
+    if reason is not None:
+        print(reason)
+        sys.exit(1)
+
+    settings = common.getSettings()._replace(whisper_model=modelname)
+    speech_rec_whisper.model = speech_rec_whisper.loadModel(modelname)
+
+    for input_file in files:
+        prefix = common.getSplitAudioFilePrefix(input_file)
+        segments = [speech_rec_whisper.toSegment(row, prefix) for row in common.readSplitResult(input_file)]
+        source = rec_input.openSource(input_file)
+        duration = int(common.getDuration(input_file))
+        print("---- {} ({}セグメント {:.1f}min)".format(os.path.basename(input_file), len(segments), duration / 60000))
+
+        start = time.perf_counter()
+        torch_texts = []
+        for unit, texts in speech_rec_whisper.recognizeUnits(source, [[segment] for segment in segments], settings.whisper_language, 1):
+            torch_texts += [text.strip() for text in texts]
+        torch_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rows = []
+        for window_start in range(0, duration, settings.whisper_binary_duration):
+            window_end = min(window_start + settings.whisper_binary_duration, duration)
+            rows += whisper_binary.runWindow(input_file, settings, window_start, window_end)
+        texts = whisper_binary.alignSegments(sorted(segments, key=lambda segment: segment["start_time"]), rows)
+        binary_texts = [texts[segment["id"]].strip() for segment in segments]
+        binary_time = time.perf_counter() - start
+
+        for name, elapsed in [("PyTorch ", torch_time), ("whisper.cpp", binary_time)]:
+            print("{}: {:>8.2f}sec (実時間の{:.1f}倍速)".format(name, elapsed, duration / 1000 / max(elapsed, 1e-9)))
+
+        errors = sum(editDistance(a, b) for a, b in zip(torch_texts, binary_texts))
+        chars = max(1, sum(len(text) for text in torch_texts))
+        joined = editDistance("".join(torch_texts), "".join(binary_texts))
+        print("文字誤り率: セグメントごと {:.2f}%  全体 {:.2f}%".format(100 * errors / chars, 100 * joined / chars))
+
+
+if __name__ == "__main__":
+    main()
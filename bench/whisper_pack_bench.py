@@ -0,0 +1,77 @@
+# Whisperで短いセグメントをまとめて認識した場合(whisper_pack_length)と、セグメントごとに認識した場合の比較
+# 1秒あたりに認識できたセグメント数と、セグメントごとに認識した結果を正としたときの文字誤り率を出す（whisperが必要）
+# 音声分割設定まで終わっている(_x_split.txtがある)音声ファイルを指定する
+#   py bench/whisper_pack_bench.py モデル名 セグメント数 音声ファイル [音声ファイル...]
+import os
+import sys
+import time
+
+modelname = sys.argv[1] if len(sys.argv) > 1 else "base"
+limit = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+files = sys.argv[3:]
+sys.argv = [sys.argv[0], "--files", "dummy"]  # commonが実行引数を読むので差し替える
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+import common
+import rec_input
+import speech_rec_whisper
+
+PACK_LENGTH = 30 * 1000
+
+
+# セグメントをまとめて(pack_length=0なら1つずつ)認識して、かかった時間とセグメントごとのテキストを返す
+def run(source, segments, pack_length, language):
+    start = time.perf_counter()
+    texts = []
+    for unit in speech_rec_whisper.packSegments(segments, pack_length):
+        texts += speech_rec_whisper.transcribeUnit(source, unit, language)
+    return time.perf_counter() - start, [text.strip() for text in texts]
+
+
+# 編集距離（文字単位）
+def editDistance(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def main():
+    if len(files) == 0:
+        print("音声ファイルを指定してください")
+        sys.exit(1)
+
+    language = common.getSettings().whisper_language
+    speech_rec_whisper.model = speech_rec_whisper.loadModel(modelname)
+
+    for input_file in files:
+        prefix = common.getSplitAudioFilePrefix(input_file)
+        segments = [speech_rec_whisper.toSegment(row, prefix) for row in common.readSplitResult(input_file)][:limit]
+        source = rec_input.openSource(input_file)
+        audio_time = sum(segment["end_time"] - segment["start_time"] for segment in segments) / 1000
+        print("---- {} ({}セグメント 音声{:.1f}sec)".format(os.path.basename(input_file), len(segments), audio_time))
+
+        single_time, single_texts = run(source, segments, 0, language)
+        packed_time, packed_texts = run(source, segments, PACK_LENGTH, language)
+        units = len(speech_rec_whisper.packSegments(segments, PACK_LENGTH))
+
+        print("セグメントごと: {:>8.2f}sec {:.2f}セグメント/sec".format(single_time, len(segments) / single_time))
+        print(
+            "まとめて({}回): {:>8.2f}sec {:.2f}セグメント/sec ({:.1f}倍)".format(
+                units, packed_time, len(segments) / packed_time, single_time / packed_time
+            )
+        )
+
+        # セグメントごとの結果を正としたときの文字誤り率（セグメントの振り分けの誤りも含む）と、全体をつなげたときの文字誤り率
+        errors = sum(editDistance(a, b) for a, b in zip(single_texts, packed_texts))
+        chars = max(1, sum(len(text) for text in single_texts))
+        joined = editDistance("".join(single_texts), "".join(packed_texts))
+        print("文字誤り率: セグメントごと {:.2f}%  全体 {:.2f}%".format(100 * errors / chars, 100 * joined / chars))
+        moved = sum(1 for a, b in zip(single_texts, packed_texts) if len(a) > 0 and len(b) == 0)
+        print("まとめたことでテキストが空になったセグメント：{}".format(moved))
+
+
+if __name__ == "__main__":
+    main()
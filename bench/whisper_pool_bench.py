@@ -0,0 +1,83 @@
+# Whisperを複数のワーカープロセスで認識した場合(whisper_workers)の、プロセス数ごとのCPUでの比較
+# プロセス数ごとに1秒あたりに認識できたセグメント数と、1プロセスでの結果を正としたときの文字誤り率を出す（whisperが必要）
+# 音声分割設定まで終わっている(_x_split.txtがある)音声ファイルを指定する
+#   py bench/whisper_pool_bench.py モデル名 プロセス数(カンマ区切り) 音声ファイル [音声ファイル...]
+import os
+import sys
+import time
+
+os.environ["CUDA_VISIBLE_DEVICES"] = ""  # CPUで比較する
+
+modelname = sys.argv[1] if len(sys.argv) > 1 else "base"
+workers_list = [int(workers) for workers in (sys.argv[2] if len(sys.argv) > 2 else "1,2,4").split(",")]
+files = sys.argv[3:]
+sys.argv = [sys.argv[0], "--files", "dummy"]  # commonが実行引数を読むので差し替える
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+import common
+import rec_input
+import speech_rec_whisper
+import whisper_pool
+
+
+# 編集距離（文字単位）
+def editDistance(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+# セグメントをworkersプロセスで認識して、かかった時間とセグメントごとのテキスト(key=id)を返す（モデルの読み込みは含めない）
+def run(input_file, segments, settings, workers):
+    units = [[segment] for segment in segments]
+    if workers > 1:
+        whisper_pool.start(settings.whisper_model, workers)
+        list(whisper_pool.recognizeUnits(input_file, units[:workers], settings, workers, 1))  # 全プロセスのモデル読み込みを待つ
+        start = time.perf_counter()
+        results = list(whisper_pool.recognizeUnits(input_file, units, settings, workers, 1))
+    else:
+        start = time.perf_counter()
+        results = list(speech_rec_whisper.recognizeUnits(rec_input.openSource(input_file), units, settings.whisper_language, 1))
+    elapsed = time.perf_counter() - start
+
+    texts = {}
+    for unit, unit_texts in results:
+        for segment, text in zip(unit, unit_texts):
+            texts[segment["id"]] = text.strip()
+    return elapsed, texts
+
+
+def main():
+    if len(files) == 0:
+        print("音声ファイルを指定してください")
+        sys.exit(1)
+
+    settings = common.getSettings()._replace(whisper_model=modelname)
+    speech_rec_whisper.model = speech_rec_whisper.loadModel(modelname)
+
+    for input_file in files:
+        prefix = common.getSplitAudioFilePrefix(input_file)
+        segments = [speech_rec_whisper.toSegment(row, prefix) for row in common.readSplitResult(input_file)]
+        print("---- {} ({}セグメント)".format(os.path.basename(input_file), len(segments)))
+
+        base_time, base_texts = run(input_file, segments, settings, 1)
+        print("1プロセス: {:>8.2f}sec {:.2f}セグメント/sec".format(base_time, len(segments) / base_time))
+        for workers in workers_list:
+            if workers <= 1:
+                continue
+            elapsed, texts = run(input_file, segments, settings, workers)
+            errors = sum(editDistance(base_texts[id], texts.get(id, "")) for id in base_texts)
+            chars = max(1, sum(len(text) for text in base_texts.values()))
+            print(
+                "{}プロセス: {:>8.2f}sec {:.2f}セグメント/sec ({:.1f}倍) 文字誤り率：{:.2f}%".format(
+                    workers, elapsed, len(segments) / elapsed, base_time / elapsed, 100 * errors / chars
+                )
+            )
+        whisper_pool.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -452,6 +452,9 @@ ipcMain.handle('recognizeProject', (event, projectId, isusewitai, witaitoken, wh
   args.push("--whispermodel", whispermodel);
   config.whispermodel = whispermodel;
 
+  // 進捗はfd3にJSON Linesで受け取る（標準出力のログから [PROGRESS] を探さなくてよいように）
+  args.push("--progressfd", "3");
+
   // キャンセルファイルのpath
   args.push("--cancelfilepath", cancelFilePath);
   try {
@@ -464,7 +467,7 @@ ipcMain.handle('recognizeProject', (event, projectId, isusewitai, witaitoken, wh
   project.recognize_options = { "witai": isusewitai, "whispermodel": whispermodel }
   writeProjects(); // 更新したのでプロジェクトリスト出力
 
-  childProcess = spawn(env.engine, args, { encoding: env.encoding }); // エンジンのサブプロセスを起動
+  childProcess = spawn(env.engine, args, { encoding: env.encoding, stdio: ['pipe', 'pipe', 'pipe', 'pipe'] }); // エンジンのサブプロセスを起動（fd3は進捗用）
   let recfiles = [];
   let multitracks = false;
 
@@ -488,6 +491,20 @@ ipcMain.handle('recognizeProject', (event, projectId, isusewitai, witaitoken, wh
     }
   });
 
+  // サブプロセスの進捗出力読み込み（1行1json。fd3を開けなかった場合は従来通り標準出力に出てくる）
+  let progressBuffer = '';
+  childProcess.stdio[3].setEncoding('utf8');
+  childProcess.stdio[3].on('data', function (data) {
+    const lines = (progressBuffer + data).split("\n");
+    progressBuffer = lines.pop(); // 改行で終わっていない部分は次回に回す
+    for (const line of lines) {
+      const logbody = line.trim();
+      if (logbody.length > 0) {
+        multitracks = updateProgress(project, logbody, recfiles, multitracks);
+      }
+    }
+  });
+
   // サブプロセスの標準エラー出力読み込み
   let stderrBuffer = '';
   childProcess.stderr.on('data', function (data) {
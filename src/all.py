@@ -1,103 +1,159 @@
+import multiprocessing
+
+multiprocessing.freeze_support()  # exe化した場合、Whisperのワーカープロセスとして起動されたらワーカーの処理だけを行って終わる
+
 import sys
 import os
 import seg
+import segmenter
+import cpu_budget
 import split
 import split_audio
 import speech_rec
 import speech_rec_wit
 import speech_rec_whisper
+import whisper_pool
 import conv_audio
 import common
 import merge
+import ffmpegjob
+import pcm_cache
 import traceback
-import requests
-import json
 import copy
 import time
 import thread
+import threading
 from concurrent.futures import ThreadPoolExecutor, wait
 from urllib.error import HTTPError
 import socket
 
 logger = common.getLogger(__file__)
 
-logger.info("----------------------------------------")
-logger.info("             DisNOTE {}".format(common.getVersion()))
-logger.info("----------------------------------------")
+if __name__ == "__main__":  # Whisperのワーカープロセスが読み込んだ場合(__mp_main__)は出さない
+    logger.info("----------------------------------------")
+    logger.info("             DisNOTE {}".format(common.getVersion()))
+    logger.info("----------------------------------------")
 
 
-# 認識準備を行うスレッド
-def prepare(input_files):
-    global logger
+# 認識準備を行うスレッド（トラックごとに並列に準備し、準備ができたものから音声認識スレッドに渡す）
+def prepare(input_files, settings):
     try:
-        for index, input_file in enumerate(input_files):
-            if common.isErrorOccurred():  # 他のスレッドでエラーが起きていたら強制終了する
-                return
+        # 短いトラックから準備する（早く音声認識を始められるように）
+        ordered_files = sorted(input_files, key=getPrepareOrder)
+        cpu_budget.addDemand(cpu_budget.SEG, len(ordered_files))  # 無音解析が終わるまでは、無音解析にもコアを割り当てる
+        max_workers = getPrepareMaxWorkers(settings)
+        logger.info("認識準備の同時実行数：{}".format(max_workers))
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prepare") as executor:
+            futures = [
+                executor.submit(prepareTrack, input_file, index, len(ordered_files), settings)
+                for index, input_file in enumerate(ordered_files)
+            ]
+            for future in futures:
+                future.result()
+    except Exception as e:
+        common.errorOccurred()
+        raise
 
-            basename = os.path.basename(input_file)
 
-            logger.info(
-                "認識準備開始：{} ({}/{})".format(basename, index + 1, len(input_files))
-            )
+# 認識準備の同時実行数（prepare_max_workers、0ならCPUのコア数の半分）
+def getPrepareMaxWorkers(settings):
+    if settings.prepare_max_workers > 0:
+        return settings.prepare_max_workers
+    return max(1, (os.cpu_count() or 1) // 2)
 
-            # フォーマット確認
-            try:
-                common.getFileFormat(input_file)
-            except Exception as e:
-                logger.error("処理を中断します。")
-                raise
 
-            # 無音解析
-            try:
-                seg.main(input_file)
-                common.logForGui(logger, "seg", input_file, progress=1, max=1)
-            except Exception as e:
-                tb = sys.exc_info()[2]
-                logger.error(traceback.format_exc())
-                logger.error(
-                    "{} の無音解析(1)に失敗しました({})。".format(input_file, e.with_traceback(tb))
-                )
-                raise
+# 認識準備の順番（音声の長さ。取れなければファイルサイズ）
+def getPrepareOrder(input_file):
+    try:
+        return common.getDuration(input_file)
+    except Exception:
+        return os.path.getsize(input_file)
 
-            # 音声分割設定
-            try:
-                split.main(input_file)
-                common.logForGui(logger, "split", input_file, progress=1, max=1)
-            except Exception as e:
-                tb = sys.exc_info()[2]
-                logger.error(traceback.format_exc())
-                logger.error(
-                    "{} の音声分割設定(2-1)に失敗しました({})。".format(
-                        input_file, e.with_traceback(tb)
-                    )
-                )
-                raise
 
-            # 音声分割
-            try:
-                split_audio.main(input_file)
-                common.logForGui(logger, "split_audio", input_file, progress=1, max=1)
-            except Exception as e:
-                tb = sys.exc_info()[2]
-                logger.error(traceback.format_exc())
-                logger.error(
-                    "{} の音声分割(2-2)に失敗しました({})。".format(input_file, e.with_traceback(tb))
-                )
-                raise
+# 1つのトラックの認識準備
+def prepareTrack(input_file, index, count, settings):
+    global logger
+    try:
+        if common.isErrorOccurred():  # 他のスレッドでエラーが起きていたら強制終了する
+            return
 
-            # 音声認識スレッドに登録
-            thread.pushReadyRecognizeList(input_file)
+        basename = os.path.basename(input_file)
 
-            logger.info(
-                "認識準備終了：{} ({}/{})".format(basename, index + 1, len(input_files))
+        logger.info("認識準備開始：{} ({}/{})".format(basename, index + 1, count))
+        common.logForGui(logger, "seg", input_file, progress=0, max=1)  # 準備を始めたことを知らせる
+
+        # フォーマット確認
+        try:
+            common.getFileFormat(input_file)
+        except Exception as e:
+            logger.error("処理を中断します。")
+            raise
+
+        # 無音解析
+        try:
+            seg.main(input_file, settings)
+            common.logForGui(logger, "seg", input_file, progress=1, max=1)
+        except Exception as e:
+            tb = sys.exc_info()[2]
+            logger.error(traceback.format_exc())
+            logger.error(
+                "{} の無音解析(1)に失敗しました({})。".format(input_file, e.with_traceback(tb))
             )
-            common.logForGui(logger, "prepare", input_file, progress=1, max=1)
+            raise
+        finally:
+            cpu_budget.addDemand(cpu_budget.SEG, -1)
+
+        # 音声分割設定
+        try:
+            split.main(input_file, settings)
+            common.logForGui(logger, "split", input_file, progress=1, max=1)
+        except Exception as e:
+            tb = sys.exc_info()[2]
+            logger.error(traceback.format_exc())
+            logger.error(
+                "{} の音声分割設定(2-1)に失敗しました({})。".format(
+                    input_file, e.with_traceback(tb)
+                )
+            )
+            raise
+
+        # 音声分割
+        try:
+            split_audio.main(input_file, settings)
+            common.logForGui(logger, "split_audio", input_file, progress=1, max=1)
+        except Exception as e:
+            tb = sys.exc_info()[2]
+            logger.error(traceback.format_exc())
+            logger.error(
+                "{} の音声分割(2-2)に失敗しました({})。".format(input_file, e.with_traceback(tb))
+            )
+            raise
+
+        # 音声認識用のデコード（音声認識スレッドは分割した音声ファイルではなく、これを読む）
+        # 全部認識済みならデコードしない（再実行のたびにデコードし直さないため。必要になったら認識時に開く）
+        if any(
+            module.reasonNotToRecognize(input_file, settings) is None
+            for module in [speech_rec, speech_rec_wit, speech_rec_whisper]
+        ):
+            pcm_cache.getPcmFile(input_file)
+
+        # 音声認識スレッドに登録
+        if settings.whisper_model != common.WHISPER_MODEL_NONE:  # Whisperにもコアを割り当てる（認識が終わるまで）
+            cpu_budget.addDemand(cpu_budget.WHISPER, 1)
+        thread.pushReadyRecognizeList(input_file)
+
+        logger.info("認識準備終了：{} ({}/{})".format(basename, index + 1, count))
+        common.logForGui(logger, "prepare", input_file, progress=1, max=1)
     except Exception as e:
-        common.errorOccurred()
+        common.errorOccurred()  # 他のトラックの準備も止める
         raise
+    finally:
+        common.closeProjectDb()  # このスレッドのDBの接続を閉じる（準備のスレッドは他のトラックでも使い回す）
+
 
 # 音声認識を行うスレッド(Google音声認識)
-def speechRecognizeGoogle(prepareThread):
+def speechRecognizeGoogle(prepareThread, settings):
     global logger
 
     try:
@@ -105,21 +161,21 @@ def speechRecognizeGoogle(prepareThread):
             if common.isErrorOccurred():  # 他のスレッドでエラーが起きていたら強制終了する
                 return
 
-            time.sleep(1)
-            logger.debug("スレッド待機中(speechRecognizeGoogle)")
-
+            prepare_done = prepareThread.done()  # 取り出す前に確認する（確認後に積まれたものを取りこぼさないため）
             input_file = thread.popReadyRecognizeListGoogle()
             if input_file is None:
                 if (
-                    prepareThread.done()
+                    prepare_done
                 ):  # 仕事リストが空＆prepareThreadが終了していたら、もうリストに追加されることはないので終了する
                     logger.info("全ファイル音声認識終了(Google)")
                     return
+                logger.debug("スレッド待機中(speechRecognizeGoogle)")
+                thread.waitForUpdate(1)  # キューに積まれるまで待つ
                 continue
 
             # 音声認識
             common.logForGui(logger, "rec", input_file, progress=0, max=1)
-            speech_rec.main(input_file)
+            speech_rec.main(input_file, settings)
             thread.pushReadyConvertListGoogle(input_file)
             common.logForGui(logger, "rec", input_file, progress=1, max=1,info={"engine":"google"})
     except Exception as e:
@@ -128,10 +184,12 @@ def speechRecognizeGoogle(prepareThread):
         logger.error(traceback.format_exc())
         logger.error("{} の音声認識(3)に失敗しました({})。".format(input_file, e.with_traceback(tb)))
         raise
+    finally:
+        common.closeProjectDb()  # このスレッドのDBの接続を閉じる
 
 
 # 音声認識を行うスレッド(wit.ai音声認識)
-def speechRecognizeWitAI(prepareThread):
+def speechRecognizeWitAI(prepareThread, settings):
     global logger
 
     try:
@@ -139,16 +197,16 @@ def speechRecognizeWitAI(prepareThread):
             if common.isErrorOccurred():  # 他のスレッドでエラーが起きていたら強制終了する
                 return
 
-            time.sleep(1)
-            logger.debug("スレッド待機中(speechRecognizeWitAI)")
-
+            prepare_done = prepareThread.done()  # 取り出す前に確認する（確認後に積まれたものを取りこぼさないため）
             input_file = thread.popReadyRecognizeListWitAI()
             if input_file is None:
                 if (
-                    prepareThread.done()
+                    prepare_done
                 ):  # 仕事リストが空＆prepareThreadが終了していたら、もうリストに追加されることはないので終了する
                     logger.info("全ファイル音声認識終了(wit.ai)")
                     return
+                logger.debug("スレッド待機中(speechRecognizeWitAI)")
+                thread.waitForUpdate(1)  # キューに積まれるまで待つ
                 continue
 
             # 音声認識
@@ -157,7 +215,7 @@ def speechRecognizeWitAI(prepareThread):
                 retry = False
                 try:
                     common.logForGui(logger, "rec", input_file, progress=0, max=1)  
-                    speech_rec_wit.main(input_file)
+                    speech_rec_wit.main(input_file, settings)
                 except HTTPError as e:  # タイムアウトエラーの場合はリトライする
                     if e.code == 408:
                         retry = True
@@ -191,10 +249,12 @@ def speechRecognizeWitAI(prepareThread):
         logger.error(traceback.format_exc())
         logger.error("{} の音声認識(3)に失敗しました({})。".format(input_file, e.with_traceback(tb)))
         raise
+    finally:
+        common.closeProjectDb()  # このスレッドのDBの接続を閉じる
 
 
 # 音声認識を行うスレッド(whisper音声認識)
-def speechRecognizeWhisper(prepareThread):
+def speechRecognizeWhisper(prepareThread, settings):
     global logger
 
     try:
@@ -202,25 +262,26 @@ def speechRecognizeWhisper(prepareThread):
             if common.isErrorOccurred():  # 他のスレッドでエラーが起きていたら強制終了する
                 return
 
-            time.sleep(1)
-            logger.debug("スレッド待機中(speechRecognizeWhisper)")
-
-            # 無音検出とWhisperは両方クライアントのリソースを使うので、並列では行わない
-            if not prepareThread.done():
-                continue
-
+            # 無音検出とWhisperは両方クライアントのCPUを使うが、コアを分け合って(cpu_budget)並列に行う
+            prepare_done = prepareThread.done()  # 取り出す前に確認する（確認後に積まれたものを取りこぼさないため）
             input_file = thread.popReadyRecognizeListWhisper()
             if input_file is None:
                 if (
-                    prepareThread.done()
+                    prepare_done
                 ):  # 仕事リストが空＆prepareThreadが終了していたら、もうリストに追加されることはないので終了する
                     logger.info("全ファイル音声認識終了(Whisper)")
                     return
+                logger.debug("スレッド待機中(speechRecognizeWhisper)")
+                thread.waitForUpdate(1)  # キューに積まれるまで待つ
                 continue
 
             # 音声認識
             common.logForGui(logger, "rec", input_file, progress=0, max=1)
-            speech_rec_whisper.main(input_file)
+            try:
+                speech_rec_whisper.main(input_file, settings)
+            finally:
+                if settings.whisper_model != common.WHISPER_MODEL_NONE:
+                    cpu_budget.addDemand(cpu_budget.WHISPER, -1)
             thread.pushReadyConvertListWhisper(input_file)
             common.logForGui(logger, "rec", input_file, progress=1, max=1,info={"engine":"whisper"})
     except Exception as e:
@@ -229,34 +290,35 @@ def speechRecognizeWhisper(prepareThread):
         logger.error(traceback.format_exc())
         logger.error("{} の音声認識(3)に失敗しました({})。".format(input_file, e.with_traceback(tb)))
         raise
+    finally:
+        whisper_pool.stop()  # ワーカープロセスを止めて、モデルのメモリを解放する
+        common.closeProjectDb()  # このスレッドのDBの接続を閉じる
 
 
 # mp3への変換を行うスレッド
-def convert(recognizeThreads):
+def convert(recognizeThreads, settings):
     global logger
     try:
         while True:
             if common.isErrorOccurred():  # 他のスレッドでエラーが起きていたら強制終了する
                 return
 
-            time.sleep(1)
-
             recognize_done = True
             for t in recognizeThreads:
                 recognize_done &= t.done()  # 音声認識スレッドがすべて終了しているかどうか
 
-            logger.debug("スレッド待機中(convert) 音声認識全て終了：{}".format(recognize_done))
-
             input_file = thread.popReadyConvertList(
                 pop_and=(not recognize_done)
             )  # 音声認識スレッドが終了していなかったらandを取る。終了していたらorで妥協する（何らかの原因でandが空だった場合に永遠に終了しないため）。
             if input_file is None:
                 if recognize_done:  # 音声認識が終了していたら、もうリストに追加されることはないので終了する
                     return
+                logger.debug("スレッド待機中(convert) 音声認識全て終了：{}".format(recognize_done))
+                thread.waitForUpdate(1)  # キューに積まれるまで待つ
                 continue
 
             # 音声変換
-            conv_audio.main(input_file)
+            conv_audio.main(input_file, settings)
             common.logForGui(logger, "conv_audio", input_file, progress=1, max=1)
 
     except Exception as e:
@@ -265,11 +327,19 @@ def convert(recognizeThreads):
         logger.error(traceback.format_exc())
         logger.error("{} の音声変換(4)に失敗しました({})。".format(input_file, e.with_traceback(tb)))
         raise
+    finally:
+        common.closeProjectDb()  # このスレッドのDBの接続を閉じる
 
 
-# 新しいバージョンがあったら表示する
-def announceNewVersion():
+new_version = None  # 公開されている新しいバージョン（なければNone）
+
+
+# 公開されている最新バージョンを確認する（バックグラウンドのスレッドで実行する）
+def checkNewVersion():
+    global new_version
     try:
+        import requests
+
         r = requests.get(
             "https://roji3.jpn.org/disnote/version.cgi", timeout=1
         )  # 公開されている最新のzipファイルのファイル名が返る(例：DisNOTE_1.2.3.zip)
@@ -281,10 +351,8 @@ def announceNewVersion():
 
             for i in range(3):  # メジャー、マイナー、パッチ の順で数字で比較
                 if int(zipVersion[i]) > int(thisVersion[i]):  # 公開されているzipの方が新しい
-                    print("----------------------------------------------------")
-                    print("  新しいDisNOTE({}) が公開されているようです".format(version))
-                    print("  https://roji3.jpn.org/disnote/")
-                    print("----------------------------------------------------")
+                    new_version = version
+                    announceNewVersion()
                     break
                 if int(zipVersion[i]) < int(thisVersion[i]):  # 公開されているzipの方が古い（普通は無いはず）
                     break
@@ -298,196 +366,235 @@ def announceNewVersion():
         pass  # 何が起きても無視
 
 
-# ここからメイン処理
-try:
-    announceNewVersion()
-    common.writeDefaultSysConfig()  # とりあえず設定ファイルを読んで未設定の値を書き込こむ
-    args = common.getSysArgs()  # 引数取得
-
-    if len(args.files) < 1:
-        logger.error("ファイルが指定されていません。")
-        sys.exit(1)
+# 新しいバージョンがあったら表示する
+def announceNewVersion():
+    if new_version is None:
+        return
+    print("----------------------------------------------------")
+    print("  新しいDisNOTE({}) が公開されているようです".format(new_version))
+    print("  https://roji3.jpn.org/disnote/")
+    print("----------------------------------------------------")
 
-    # ffmpeg起動確認
-    try:
-        common.runSubprocess("ffmpeg -h")
-        logger.info("ffmpeg 実行確認OK")
-    except FileNotFoundError as e:
-        logger.error(e)
-        logger.error("ffmpegが見つかりません。ffmpegがDisNOTEと同じフォルダにあるか確認してください。")
-        sys.exit(1)
-    except Exception as e:
-        logger.error(e)
-        logger.error("ffmpegを実行できません。ffmpegがDisNOTEと同じフォルダにあるか確認してください。")
-        sys.exit(1)
 
-    # ffprobe起動確認
+# ここからメイン処理（Whisperのワーカープロセスが読み込んだ場合(__mp_main__)は行わない）
+if __name__ == "__main__":
+    versionThread = threading.Thread(target=checkNewVersion, daemon=True)
     try:
-        common.runSubprocess("ffprobe -h")
-        logger.info("ffprobe 実行確認OK")
-    except FileNotFoundError as e:
-        logger.error(e)
-        logger.error("ffprobeが見つかりません。ffprobeがDisNOTEと同じフォルダにあるか確認してください。")
-        sys.exit(1)
-    except Exception as e:
-        logger.error(e)
-        logger.error("ffprobeを実行できません。ffprobeがDisNOTEと同じフォルダにあるか確認してください。")
-        sys.exit(1)
+        versionThread.start()  # 待たずに処理を始める
+        common.writeDefaultSysConfig()  # とりあえず設定ファイルを読んで未設定の値を書き込こむ
+        settings = common.getSettings()  # 以降はこの設定を各処理に渡す
+        args = common.getSysArgs()  # 引数取得
 
-    logger.info("キャンセルファイル：{}".format(common.getCancelFilePath()))
-
-
-
-    # 入力ファイル一覧
-    arg_files = copy.copy(args.files)
-    arg_files.sort()  # ファイル名をソート（引数の順番だけ違う場合にファイル名を揃えるため）
+        if len(args.files) < 1:
+            logger.error("ファイルが指定されていません。")
+            sys.exit(1)
 
-    # すべてのトラックを認識するため、最初のトラックは元のファイルを、それ以降のトラックはffmpegで抜き出して認識対象に追加する
-    input_files = []
-    for arg_index, arg_file in enumerate(arg_files):
-        logger.info(
-            "---- トラック抜き出し開始：{} ({}/{}) ----".format(
-                os.path.basename(arg_file), arg_index + 1, len(arg_files)
-            )
-        )
+        # ffmpeg起動確認
+        try:
+            common.runSubprocess("ffmpeg -version")
+            logger.info("ffmpeg 実行確認OK")
+        except FileNotFoundError as e:
+            logger.error(e)
+            logger.error("ffmpegが見つかりません。ffmpegがDisNOTEと同じフォルダにあるか確認してください。")
+            sys.exit(1)
+        except Exception as e:
+            logger.error(e)
+            logger.error("ffmpegを実行できません。ffmpegがDisNOTEと同じフォルダにあるか確認してください。")
+            sys.exit(1)
 
-        # トラック情報取得
+        # ffprobe起動確認
         try:
-            ffprobe_result = common.getFileFormat(arg_file)
+            common.runSubprocess("ffprobe -version")
+            logger.info("ffprobe 実行確認OK")
+        except FileNotFoundError as e:
+            logger.error(e)
+            logger.error("ffprobeが見つかりません。ffprobeがDisNOTEと同じフォルダにあるか確認してください。")
+            sys.exit(1)
         except Exception as e:
-            logger.error("処理を中断します。")
+            logger.error(e)
+            logger.error("ffprobeを実行できません。ffprobeがDisNOTEと同じフォルダにあるか確認してください。")
             sys.exit(1)
 
-        streams = json.loads(ffprobe_result)
+        logger.info("キャンセルファイル：{}".format(common.getCancelFilePath()))
+
+        # 入力ファイル一覧
+        arg_files = copy.copy(args.files)
+        arg_files.sort()  # ファイル名をソート（引数の順番だけ違う場合にファイル名を揃えるため）
 
-        # トラックごとに音声ファイルで出力する
-        first_audio = True
-        for stream_index, stream in enumerate(streams["streams"]):
+        # すべてのトラックを認識するため、最初のトラックは元のファイルを、それ以降のトラックはffmpegで抜き出して認識対象に追加する
+        input_files = []
+        for arg_index, arg_file in enumerate(arg_files):
             logger.info(
-                "トラック {}/{} {}({})".format(
-                    stream_index + 1,
-                    len(streams["streams"]),
-                    stream["codec_type"],
-                    stream["codec_name"],
+                "---- トラック抜き出し開始：{} ({}/{}) ----".format(
+                    os.path.basename(arg_file), arg_index + 1, len(arg_files)
                 )
             )
-            if stream["codec_type"] != "audio":
-                continue
-
-            if first_audio:  # 最初のトラックは抜き出さずに、元のファイルをinput_filesに入れる
-                first_audio = False
-                input_files.append(arg_file)
-                common.setAudioFileInfo(arg_file, arg_file, stream["index"])
-                continue
 
-            # トラックごとに音声を分解する
-            basedir = os.path.dirname(arg_file)  # 入力音声ファイルの置いてあるディレクトリ
-            base = common.getFileNameWithoutExtension(arg_file)  # 入力音声ファイルの置いてあるディレクトリ
-            # なければmkdir
+            # トラック情報取得
             try:
-                os.mkdir(os.path.join(basedir, base))
-            except FileExistsError:
-                pass
-
-            # フォーマットは変更したくなかったが、aacで出力すると変なことになることがあるのでflacに固定する
-            track_filename = os.path.join(
-                basedir, base, "{}_Track{}.{}".format(base, stream["index"], "flac")
-            )
+                streams = common.getFileFormat(arg_file)
+            except Exception as e:
+                logger.error("処理を中断します。")
+                sys.exit(1)
 
-            if os.path.exists(track_filename) == False:
-                common.runSubprocess(
-                    'ffmpeg -i "{}" -map 0:{} -vn  -acodec flac "{}"'.format(
-                        arg_file, stream["index"], track_filename
+            # トラックごとに音声ファイルで出力する
+            first_audio = True
+            for stream_index, stream in enumerate(streams["streams"]):
+                logger.info(
+                    "トラック {}/{} {}({})".format(
+                        stream_index + 1,
+                        len(streams["streams"]),
+                        stream["codec_type"],
+                        stream["codec_name"],
                     )
                 )
-                logger.info("トラック出力：{}".format(os.path.basename(track_filename)))
+                if stream["codec_type"] != "audio":
+                    continue
+
+                if first_audio:  # 最初のトラックは抜き出さずに、元のファイルをinput_filesに入れる
+                    first_audio = False
+                    input_files.append(arg_file)
+                    common.setAudioFileInfo(arg_file, arg_file, stream["index"])
+                    continue
+
+                # トラックごとに音声を分解する
+                basedir = os.path.dirname(arg_file)  # 入力音声ファイルの置いてあるディレクトリ
+                base = common.getFileNameWithoutExtension(arg_file)  # 入力音声ファイルの置いてあるディレクトリ
+                # なければmkdir
+                try:
+                    os.mkdir(os.path.join(basedir, base))
+                except FileExistsError:
+                    pass
 
-            input_files.append(track_filename)
-            common.setAudioFileInfo(arg_file, track_filename, stream["index"])
+                # フォーマットは変更したくなかったが、aacで出力すると変なことになることがあるのでflacに固定する
+                track_filename = os.path.join(
+                    basedir, base, "{}_Track{}.{}".format(base, stream["index"], "flac")
+                )
 
-        if first_audio:  # 音声トラックがないファイルだった
-            logger.error("{}は音声ファイルではないようです。処理を中断します。".format(arg_file))
-            sys.exit(1)
+                if os.path.exists(track_filename) == False:
+                    common.runSubprocess(
+                        'ffmpeg -i "{}" -map 0:{} -vn  -acodec flac "{}"'.format(
+                            arg_file, stream["index"], track_filename
+                        )
+                    )
+                    logger.info("トラック出力：{}".format(os.path.basename(track_filename)))
+
+                input_files.append(track_filename)
+                common.setAudioFileInfo(arg_file, track_filename, stream["index"])
+
+            if first_audio:  # 音声トラックがないファイルだった
+                logger.error("{}は音声ファイルではないようです。処理を中断します。".format(arg_file))
+                sys.exit(1)
 
-        logger.info(
-            "---- トラック抜き出し終了：{} ({}/{}) ----".format(
-                os.path.basename(arg_file), arg_index + 1, len(arg_files)
+            logger.info(
+                "---- トラック抜き出し終了：{} ({}/{}) ----".format(
+                    os.path.basename(arg_file), arg_index + 1, len(arg_files)
+                )
             )
-        )
 
-    common.logForGui(logger, "checkedAudioFiles")
+        # 無音解析のモデルを使うなら、認識準備を始める前に読み込み始めておく（抜き出したトラックごとに完了済みか確認する）
+        if seg.getEngine(settings) != common.SEG_ENGINE_ENERGY and any(
+            not seg.isDone(input_file, settings) for input_file in input_files
+        ):
+            segmenter.prewarm()
 
-    # ファイルそれぞれに対して音声認識
-    with ThreadPoolExecutor() as executor:
-        threadList = list()
+        common.logForGui(logger, "checkedAudioFiles")
 
-        try:
-            prepareThread = executor.submit(prepare, input_files)  # 認識準備スレッド
-            threadList.append(prepareThread)
-
-            recognizeThreads = list()
-            recognizeThreads.append(
-                executor.submit(speechRecognizeGoogle, prepareThread)
-            )  # 音声認識スレッド(Google)
-            recognizeThreads.append(
-                executor.submit(speechRecognizeWitAI, prepareThread)
-            )  # 音声認識スレッド(wit.ai)
-            recognizeThreads.append(
-                executor.submit(
-                    speechRecognizeWhisper,
-                    prepareThread
-                )
-            )  # 音声認識スレッド(Whisper)
-            threadList.extend(recognizeThreads)
+        # ファイルそれぞれに対して音声認識
+        with ThreadPoolExecutor() as executor:
+            threadList = list()
 
-            e = prepareThread.exception()  # 認識準備スレッド終了待ち
-            if e is not None:
-                raise e
-            logger.info("全ファイル認識準備終了")
+            try:
+                prepareThread = executor.submit(prepare, input_files, settings)  # 認識準備スレッド
+                prepareThread.add_done_callback(thread.notifyUpdate)  # 待っているスレッドを起こす
+                threadList.append(prepareThread)
+
+                recognizeThreads = list()
+                recognizeThreads.append(
+                    executor.submit(speechRecognizeGoogle, prepareThread, settings)
+                )  # 音声認識スレッド(Google)
+                recognizeThreads.append(
+                    executor.submit(speechRecognizeWitAI, prepareThread, settings)
+                )  # 音声認識スレッド(wit.ai)
+                recognizeThreads.append(
+                    executor.submit(
+                        speechRecognizeWhisper,
+                        prepareThread,
+                        settings,
+                    )
+                )  # 音声認識スレッド(Whisper)
+                threadList.extend(recognizeThreads)
+                for t in recognizeThreads:
+                    t.add_done_callback(thread.notifyUpdate)  # 待っているスレッドを起こす
+
+                e = prepareThread.exception()  # 認識準備スレッド終了待ち
+                if e is not None:
+                    raise e
+                logger.info("全ファイル認識準備終了")
+
+                convertThread = executor.submit(convert, recognizeThreads, settings)  # mp3変換スレッド
+                threadList.append(convertThread)
 
-            convertThread = executor.submit(convert, recognizeThreads)  # mp3変換スレッド
-            threadList.append(convertThread)
+                for t in recognizeThreads:  # 音声認識スレッド終了待ち
+                    e = t.exception()
+                    if e is not None:
+                        raise e
 
-            for t in recognizeThreads:  # 音声認識スレッド終了待ち
-                e = t.exception()
+                e = convertThread.exception()  # mp3変換スレッド終了待ち
                 if e is not None:
                     raise e
+                logger.info("全ファイル音声変換終了")
 
-            e = convertThread.exception()  # mp3変換スレッド終了待ち
-            if e is not None:
-                raise e
-            logger.info("全ファイル音声変換終了")
+                ffmpeg_stats = ffmpegjob.getStats()
+                logger.info(
+                    "ffmpeg実行：{}回 (実時間合計:{:.1f}sec, CPU時間合計:{:.1f}sec)".format(
+                        ffmpeg_stats["count"], ffmpeg_stats["wall_time"], ffmpeg_stats["cpu_time"]
+                    )
+                )
+                segmenter_stats = segmenter.getStats()
+                logger.info(
+                    "無音解析：モデル読み込み:{:.1f}sec 推論:{}回 {:.1f}sec".format(
+                        segmenter_stats["load_time"],
+                        segmenter_stats["inference_count"],
+                        segmenter_stats["inference_time"],
+                    )
+                )
 
-        except Exception as e:  # 例外が起きたら、すべてのスレッドの終了を待ってからログを出力して終了する
-            common.errorOccurred()
-            logger.error("スレッド処理中にエラーが発生したため全スレッドを停止")
-            for t in threadList:
-                try:
-                    t.result()
-                except Exception as e:
-                    pass
+            except Exception as e:  # 例外が起きたら、すべてのスレッドの終了を待ってからログを出力して終了する
+                common.errorOccurred()
+                ffmpegjob.cancelAll()  # 実行中・実行待ちのffmpegも止める
+                logger.error("スレッド処理中にエラーが発生したため全スレッドを停止")
+                for t in threadList:
+                    try:
+                        t.result()
+                    except Exception as e:
+                        pass
+
+                common.flushAllConfig()  # ここまでの進捗を保存
+
+                if common.isCancelFileExists():
+                    logger.error("認識がキャンセルされました（{}）".format(common.getCancelFilePath()))
+                    sys.exit(0)
+                else:
+                    tb = sys.exc_info()[2]
+                    logger.error(traceback.format_exc())
+                    logger.error("スレッド処理中にエラーが発生しました({})。".format(e.with_traceback(tb)))
+                    sys.exit(1)
 
+        # 結果マージ
+        try:
+            merge.main(input_files, arg_files, settings)
+            common.closeProjectDb()  # このスレッドのDBの接続を閉じる
+        except Exception as e:
             if common.isCancelFileExists():
                 logger.error("認識がキャンセルされました（{}）".format(common.getCancelFilePath()))
                 sys.exit(0)
             else:
                 tb = sys.exc_info()[2]
                 logger.error(traceback.format_exc())
-                logger.error("スレッド処理中にエラーが発生しました({})。".format(e.with_traceback(tb)))
+                logger.error("結果マージ(5)に失敗しました({})。".format(e.with_traceback(tb)))
                 sys.exit(1)
 
-    # 結果マージ
-    try:
-        merge.main(input_files, arg_files)
-    except Exception as e:
-        if common.isCancelFileExists():
-            logger.error("認識がキャンセルされました（{}）".format(common.getCancelFilePath()))
-            sys.exit(0)
-        else:
-            tb = sys.exc_info()[2]
-            logger.error(traceback.format_exc())
-            logger.error("結果マージ(5)に失敗しました({})。".format(e.with_traceback(tb)))
-            sys.exit(1)
-
-finally:  # バージョン確認する
-    announceNewVersion()
+    finally:  # バージョン確認する（確認が終わっていなければ少しだけ待つ）
+        versionThread.join(timeout=1)
+        announceNewVersion()
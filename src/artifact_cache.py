@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+import threading
+import common
+
+logger = common.getLogger(__file__)
+
+# 処理結果のキャッシュ（プロジェクトをまたいで共有する）
+# 無音解析結果や分割設定を、入力音声の指紋と処理条件から作ったキーで cache/ フォルダに保存しておき、
+# 同じ音声をコピー・リネームしたり別のフォルダから処理した場合でも、解析し直さずに使う。
+# 合計サイズが artifact_cache_size(MB) を超えたら、最後に使ったのが古いものから消す。
+
+CACHE_DIR = "cache"
+
+lock = threading.Lock()
+
+
+# キャッシュの上限サイズ（バイト。0ならキャッシュを使わない）
+def getMaxSize(settings=None):
+    if settings is None:  # 呼び出し元から渡されなかったら共通の設定を使う
+        settings = common.getSettings()
+    return settings.artifact_cache_size * 1024 * 1024
+
+
+# キャッシュを使うかどうか
+def isEnabled(settings=None):
+    return getMaxSize(settings) > 0
+
+
+# 処理条件(dict)からキーを作る
+def makeKey(kind, params):
+    text = json.dumps({"kind": kind, "params": params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# 内容(JSONにできるもの)のhash値（上流の処理結果を次の処理のキーに含めるときに使う）
+def contentHash(data):
+    text = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# キャッシュファイルのパス
+def getCacheFile(kind, key):
+    return os.path.join(CACHE_DIR, kind, key[:2], "{}.json".format(key))
+
+
+# キャッシュを読む（なければNone）。使ったことを記録するため更新日時を更新する
+def get(kind, params, settings=None):
+    if not isEnabled(settings):
+        return None
+
+    cache_file = getCacheFile(kind, makeKey(kind, params))
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        if entry.get("kind") != kind or entry.get("params") != params:
+            return None
+        os.utime(cache_file)
+    except (OSError, ValueError):
+        return None
+
+    logger.info("キャッシュを使用：{} {}".format(kind, os.path.basename(cache_file)))
+    return entry.get("data")
+
+
+# キャッシュに書く（書き込み途中で落ちても壊れないように、テンポラリファイルからリネームする）
+def put(kind, params, data, settings=None):
+    if not isEnabled(settings):
+        return
+
+    cache_file = getCacheFile(kind, makeKey(kind, params))
+    tmp_file = "{}.{}.{}.tmp".format(cache_file, os.getpid(), threading.get_ident())
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"kind": kind, "params": params, "data": data}, f, ensure_ascii=False)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:  # キャッシュに書けなくても処理は続ける
+        logger.warning("キャッシュに書き込めませんでした：{}".format(e))
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return
+
+    evict(settings)
+
+
+# 上限サイズを超えていたら、最後に使ったのが古いものから消す
+def evict(settings=None):
+    max_size = getMaxSize(settings)
+    with lock:
+        entries = []
+        total = 0
+        for root, _, files in os.walk(CACHE_DIR):
+            for file in files:
+                if not file.endswith(".json"):
+                    continue
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except OSError:  # 他のプロセスが消した
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= max_size:
+                break
+            try:
+                os.remove(path)
+                logger.debug("キャッシュ削除：{}".format(path))
+            except OSError:
+                pass
+            total -= size
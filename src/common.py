@@ -3,20 +3,32 @@ import sys
 import logging
 import logging.handlers
 import configparser
-import hashlib
 import subprocess
 import threading
 import argparse
 import copy
+import collections
 import json
+import hashlib
+import codecs
+import time
+import atexit
+import queue
+import shlex
+import fingerprint
+import journal
+import probe
+import projectdb
+import csv
+import glob
 
 VERSION = "v3.2.2"
 
-input_file_config_lock = threading.Lock()
 error_occurred = False
 cancel_file_path = None
 
 DONE = "done"
+FINGERPRINT_KEY_SUFFIX = "_fingerprint"  # 処理ごとの入力の指紋をiniファイルに記録するキーの接尾辞
 
 SYSTEM_CONF_FILE = "DisNOTE.ini"
 SEG_TMP_AUDIO_LENGTH = "seg_tmp_audio_length"
@@ -30,10 +42,34 @@ WHISPER_LANG = "recognize_whisper_language"
 WHISPER_TMP_AUDIO_LENGTH = "whisper_tmp_audio_length"
 WHISPER_BINARY_DURATION = "whisper_binary_duration"
 IS_USE_BINARY_WHISPER = "is_use_binary_whisper"
+INPUT_FILE_HASH_MODE = "input_file_hash_mode"
+USE_PROJECT_DB = "use_project_db"
+FFMPEG_MAX_WORKERS = "ffmpeg_max_workers"
+USE_FULL_RATE_PCM = "use_full_rate_pcm"
+SEG_STREAMING = "seg_streaming"
+SEG_MAX_WORKERS = "seg_max_workers"
+PREPARE_MAX_WORKERS = "prepare_max_workers"
+SEG_ENGINE = "seg_engine"
+SEG_SILENCE_GATE = "seg_silence_gate"
+ARTIFACT_CACHE_SIZE = "artifact_cache_size"
+WHISPER_PACK_LENGTH = "whisper_pack_length"
+WHISPER_BATCH_SIZE = "whisper_batch_size"
+CPU_THREADS = "cpu_threads"
+WHISPER_WORKERS = "whisper_workers"
 
 WHISPER_MODEL_NONE = "none"
 WIT_AI_SERVER_ACCESS_TOKEN_NONE = "none"
 
+# 無音解析の方法
+SEG_ENGINE_AUTO = "auto"  # ノイズ部分も認識対象にする場合はenergy、そうでなければcnn
+SEG_ENGINE_CNN = "cnn"  # inaSpeechSegmenter（音声・音楽・ノイズを分類する）
+SEG_ENGINE_ENERGY = "energy"  # 音量だけで無音かどうかを判定する
+SEG_ENGINES = [SEG_ENGINE_AUTO, SEG_ENGINE_CNN, SEG_ENGINE_ENERGY]
+
+# 認識エンジン名（進捗ジャーナル、プロジェクトDBで使う。Whisperは getRecognizeEngineWhisper()）
+RECOGNIZE_ENGINE_GOOGLE = "google"
+RECOGNIZE_ENGINE_WITAI = "witai"
+
 LOG_FOR_GUI = "[PROGRESS]"  # GUI用にログを出力するときに出す文字列
 
 
@@ -53,8 +89,11 @@ def logForGui(logger, stage, input_file=None, info=None, progress=0, max=None):
     outinfo["stage"] = stage
     outinfo["progress"] = progress
     outinfo["max"] = max
-    logger.info(LOG_FOR_GUI + json.dumps(outinfo))
-    logger.handlers[0].flush()  # 標準出力を強制的にflush
+
+    if progress_logger is not None:  # 進捗専用チャネルがあればそちらにJSON Linesで出す
+        progress_logger.info(json.dumps(outinfo))
+    else:
+        logger.info(LOG_FOR_GUI + json.dumps(outinfo))
 
 
 # 認識対象の音声ファイル情報のmap（key=ファイル名 setAudioFileInfo
@@ -89,6 +128,12 @@ parser.add_argument(
 parser.add_argument(
     "--cancelfilepath"
 ) # キャンセルファイルのパス
+parser.add_argument(
+    "--progressfd", type=int
+)  # 進捗(JSON Lines)を出力するファイルディスクリプタ（未指定の場合は標準出力に [PROGRESS] をつけて出す）
+parser.add_argument(
+    "--progressfile"
+)  # 進捗(JSON Lines)を出力するファイル・名前付きパイプのパス（--progressfdと同じ。--progressfdが優先）
 parser.add_argument("--files", nargs="*", required=True)  # ファイル
 args = parser.parse_args()
 
@@ -106,145 +151,237 @@ def getVersion():
     return VERSION
 
 
+# システム設定（DisNOTE.iniと実行引数を1回だけ読み込んだもの。変更しないこと）
+Settings = collections.namedtuple(
+    "Settings",
+    [
+        "seg_tmp_audio_length",  # 無音解析時に作るテンポラリファイルの音声の長さ（ミリ秒）
+        "seg_filter_strength",  # 無音解析時にかけるノイズフィルタの強さ(0以下だとフィルタをかけない)
+        "is_recognize_noize",  # ノイズっぽい音声を認識するかどうか
+        "wit_ai_server_access_token",  # wit.aiのServer Access Token(空文字列ならwit.aiを使わない)
+        "recognize_google_language",  # GoogleAPIで認識する際の言語
+        "is_remove_temp_split_flac",  # 音声認識にかけたflacファイルを最後に削除するかどうか
+        "whisper_model",  # Whisperのモデル名
+        "whisper_language",  # Whisperの言語
+        "whisper_tmp_audio_length",  # Whisper(python版)解析時に作るテンポラリファイルの音声の長さ（ミリ秒）
+        "whisper_binary_duration",  # Whisper(バイナリ版)解析時に読み込む音声の長さ（ミリ秒）
+        "is_use_binary_whisper",  # Whisperをバイナリ版(whisper.cpp)で実行するかどうか
+        "input_file_hash_mode",  # 音声ファイルのhash値の求め方
+        "is_use_project_db",  # プロジェクトDB(SQLite)にも保存するかどうか
+        "ffmpeg_max_workers",  # ffmpegを同時に実行する数(0ならCPUのコア数)
+        "is_use_full_rate_pcm",  # 音声を元のサンプリングレートのままwavにデコードしておき、分割はそこから行うかどうか
+        "is_seg_streaming",  # 無音解析を一時ファイルを作らずにストリーミングで行うかどうか（0なら従来通り一定時間ごとに区切る）
+        "seg_max_workers",  # 無音解析を同時に実行する数(0ならCPUのコア数とメモリから決める)
+        "prepare_max_workers",  # 認識準備(無音解析～音声分割)を同時に行うトラックの数(0ならCPUのコア数の半分)
+        "seg_engine",  # 無音解析の方法(auto, cnn, energy)
+        "is_seg_silence_gate",  # 無音解析の前に長いデジタル無音を除き、音がある範囲だけをモデルで解析するかどうか
+        "artifact_cache_size",  # 無音解析結果・分割設定のキャッシュ(cacheフォルダ)の上限サイズ(MB。0ならキャッシュしない)
+        "whisper_pack_length",  # Whisper(python版)で短いセグメントをまとめて認識する長さ（ミリ秒。0ならセグメントごとに認識する）
+        "whisper_batch_size",  # Whisper(python版)で一度に推論するセグメントの数(0なら空きメモリから決める。1ならバッチにしない)
+        "cpu_threads",  # 無音解析とWhisperに割り当てるスレッドの合計(0ならCPUのコア数)
+        "whisper_workers",  # Whisper(python版)で認識するプロセスの数(0ならCPUのコア数とメモリから決める。1なら別プロセスにしない)
+    ],
+)
+
+settings = None  # 読み込み済みのシステム設定
+settings_lock = threading.Lock()
+
+
+# システム設定を返す（初回のみDisNOTE.iniを読み込む）
+def getSettings():
+    global settings
+    with settings_lock:
+        if settings is None:
+            settings = loadSettings()
+        return settings
+
+
+# システム設定を読み込みなおす
+def reloadSettings():
+    global settings
+    with settings_lock:
+        settings = loadSettings()
+        return settings
+
+
+# 空きメモリ(バイト)を返す（取れない環境ではNone）
+def getAvailableMemory():
+    try:
+        if sys.platform == "win32":
+            import ctypes
+
+            class MemoryStatusEx(ctypes.Structure):
+                _fields_ = [
+                    ("dwLength", ctypes.c_ulong),
+                    ("dwMemoryLoad", ctypes.c_ulong),
+                    ("ullTotalPhys", ctypes.c_ulonglong),
+                    ("ullAvailPhys", ctypes.c_ulonglong),
+                    ("ullTotalPageFile", ctypes.c_ulonglong),
+                    ("ullAvailPageFile", ctypes.c_ulonglong),
+                    ("ullTotalVirtual", ctypes.c_ulonglong),
+                    ("ullAvailVirtual", ctypes.c_ulonglong),
+                    ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+                ]
+
+            status = MemoryStatusEx()
+            status.dwLength = ctypes.sizeof(MemoryStatusEx)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return status.ullAvailPhys
+            return None
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
 # 共通設定iniファイルの設定値を一通り読み込み（設定値がなければ初期値が書き込まれる）
 def writeDefaultSysConfig():
-    getSegTmpAudioLength()
-    getSegFilterStrength()
-    isRecognizeNoize()
-    getWitAiServerAccessToken()
-    getRecognizeGoogleLanguage()
-    isRemoveTempSplitFlac()
-    getWhisperModel()
-    getWhisperLanguage()
-    getWhisperTmpAudioLength()
-    getWhisperBinaryDuration()
+    getSettings()
 
 
-# 無音解析時に作るテンポラリファイルの音声の長さ（iniファイルでは分単位だが、ミリ秒に変換して返す）
-def getSegTmpAudioLength():
-    min = 30  # 30分ごとに分割（デフォルト）
+# DisNOTE.iniと実行引数からシステム設定を作る。未設定・不正な値は初期値にして、まとめて1回だけ書き込む
+def loadSettings():
+    config = readSysConfig()
+    defaults = dict()  # iniファイルに書き込む初期値
 
-    try:
-        config = readSysConfig()
-        val = config["DEFAULT"].get(SEG_TMP_AUDIO_LENGTH)
-        min = int(val)
-        if min < 10:  # 最低でも10分区切り
-            min = 10
-
-    except:  # 設定ファイルが読めなかったり(初回起動時)、値がおかしかったらデフォルトで保存
-        min = 30
-        config.set("DEFAULT", SEG_TMP_AUDIO_LENGTH, str(min))
-        writeSysConfig(config)
+    # wit.aiのServer Access Token（引数で未指定の場合(None)はiniファイルの設定を使う。"none" を指定したらwit.aiを使わない）
+    wit_ai_server_access_token = readSysConfigStr(
+        config, WIT_AI_SERVER_ACCESS_TOKEN, "", defaults
+    )
+    if args.witaitoken is not None:
+        wit_ai_server_access_token = args.witaitoken
+        if args.witaitoken == WIT_AI_SERVER_ACCESS_TOKEN_NONE:
+            wit_ai_server_access_token = ""
+
+    # Whisperのモデル（引数で未指定の場合(None)はiniファイルの設定を使う）
+    whisper_model = readSysConfigStr(config, WHISPER_MODEL, WHISPER_MODEL_NONE, defaults)
+    if args.whispermodel is not None:
+        whisper_model = args.whispermodel
+
+    ret = Settings(
+        seg_tmp_audio_length=readSysConfigInt(config, SEG_TMP_AUDIO_LENGTH, 30, 10, defaults)
+        * 60
+        * 1000,  # 30分ごとに分割（デフォルト）、最低でも10分区切り
+        seg_filter_strength=readSysConfigFloat(config, SEG_FILTER_STRENGTH, 0.1, defaults),
+        is_recognize_noize=readSysConfigInt(config, IS_RECOGNIZE_NOIZE, 0, None, defaults) != 0,
+        wit_ai_server_access_token=wit_ai_server_access_token,
+        recognize_google_language=readSysConfigStr(
+            config, RECOGNIZE_GOOGLE_LANGUAGE, "ja-JP", defaults, allow_empty=False
+        ),
+        is_remove_temp_split_flac=readSysConfigInt(config, REMOVE_TEMP_SPLIT_FLAC, 1, None, defaults) != 0,
+        whisper_model=whisper_model,
+        whisper_language=readSysConfigStr(config, WHISPER_LANG, "ja", defaults),
+        whisper_tmp_audio_length=readSysConfigInt(config, WHISPER_TMP_AUDIO_LENGTH, 5, 1, defaults)
+        * 60
+        * 1000,  # 5分ごとに分割（デフォルト）、最低でも1分区切り
+        whisper_binary_duration=readSysConfigInt(config, WHISPER_BINARY_DURATION, 20, 1, defaults)
+        * 60
+        * 1000,  # 20分ごとに出力（デフォルト）、最低でも1分区切り
+        is_use_binary_whisper=readSysConfigInt(config, IS_USE_BINARY_WHISPER, 0, None, defaults) != 0,
+        input_file_hash_mode=readSysConfigChoice(
+            config, INPUT_FILE_HASH_MODE, fingerprint.MODES, fingerprint.MODE_FULL, defaults
+        ),
+        is_use_project_db=readSysConfigInt(config, USE_PROJECT_DB, 0, None, defaults) != 0,
+        ffmpeg_max_workers=readSysConfigInt(config, FFMPEG_MAX_WORKERS, 0, 0, defaults),
+        is_use_full_rate_pcm=readSysConfigInt(config, USE_FULL_RATE_PCM, 0, None, defaults) != 0,
+        is_seg_streaming=readSysConfigInt(config, SEG_STREAMING, 1, None, defaults) != 0,
+        seg_max_workers=readSysConfigInt(config, SEG_MAX_WORKERS, 0, 0, defaults),
+        prepare_max_workers=readSysConfigInt(config, PREPARE_MAX_WORKERS, 0, 0, defaults),
+        seg_engine=readSysConfigChoice(config, SEG_ENGINE, SEG_ENGINES, SEG_ENGINE_AUTO, defaults),
+        is_seg_silence_gate=readSysConfigInt(config, SEG_SILENCE_GATE, 1, None, defaults) != 0,
+        artifact_cache_size=readSysConfigInt(config, ARTIFACT_CACHE_SIZE, 1024, 0, defaults),
+        whisper_pack_length=min(readSysConfigInt(config, WHISPER_PACK_LENGTH, 0, 0, defaults), 30)
+        * 1000,  # 秒で指定、Whisperが一度に処理する30秒まで
+        whisper_batch_size=readSysConfigInt(config, WHISPER_BATCH_SIZE, 0, 0, defaults),
+        cpu_threads=readSysConfigInt(config, CPU_THREADS, 0, 0, defaults),
+        whisper_workers=readSysConfigInt(config, WHISPER_WORKERS, 0, 0, defaults),
+    )
 
-    return min * 60 * 1000
+    # 設定ファイルが読めなかったり(初回起動時)、値がおかしかったらデフォルトで保存
+    if len(defaults) > 0:
+        for key, val in defaults.items():
+            config.set("DEFAULT", key, val)
+        writeSysConfig(config)
 
+    return ret
 
-# 無音解析時にかけるノイズフィルタの強さ(0以下だとフィルタをかけない)
-def getSegFilterStrength():
-    ret = 0.1
 
+# 整数の設定値（未設定・不正ならdefaultsに初期値を入れて初期値を返す。minimum未満ならminimumを返す）
+def readSysConfigInt(config, key, default, minimum, defaults):
     try:
-        config = readSysConfig()
-        val = config["DEFAULT"].get(SEG_FILTER_STRENGTH)
-        ret = float(val)
-
-    except:  # 設定ファイルが読めなかったり(初回起動時)、値がおかしかったらデフォルトで保存
-        config.set("DEFAULT", SEG_FILTER_STRENGTH, str(ret))
-        writeSysConfig(config)
+        ret = int(config["DEFAULT"].get(key))
+    except (TypeError, ValueError):
+        defaults[key] = str(default)
+        return default
 
+    if minimum is not None and ret < minimum:
+        return minimum
     return ret
 
 
-# ノイズっぽい音声を認識するかどうか
-def isRecognizeNoize():
-    ret = 0
+# 小数の設定値（未設定・不正ならdefaultsに初期値を入れて初期値を返す）
+def readSysConfigFloat(config, key, default, defaults):
     try:
-        config = readSysConfig()
-        val = config["DEFAULT"].get(IS_RECOGNIZE_NOIZE)
-        ret = int(val)
+        return float(config["DEFAULT"].get(key))
+    except (TypeError, ValueError):
+        defaults[key] = str(default)
+        return default
 
-    except:  # 設定ファイルが読めなかったり(初回起動時)、値がおかしかったらデフォルトで保存
-        config.set("DEFAULT", IS_RECOGNIZE_NOIZE, str(ret))
-        writeSysConfig(config)
 
-    return ret != 0
+# 文字列の設定値（未設定ならdefaultsに初期値を入れて初期値を返す）
+def readSysConfigStr(config, key, default, defaults, allow_empty=True):
+    val = config["DEFAULT"].get(key)
+    if val is not None:
+        val = val.strip()
+        if allow_empty or len(val) > 0:
+            return val
 
+    defaults[key] = default
+    return default
 
-# wit.aiのServer Access Token(未設定時(空文字列)はwit.aiでの認識をスキップする)
-def getWitAiServerAccessToken():
-    if args.witaitoken is None:  # 引数で未指定の場合はiniファイルの設定を使う
-        try:
-            config = readSysConfig()
-            val = config["DEFAULT"].get(WIT_AI_SERVER_ACCESS_TOKEN)
-            if val is not None:
-                return val.strip()
 
-        except:  # 設定ファイルが読めなかったり(初回起動時)、値がおかしかったらデフォルトで保存
-            pass
+# 選択肢から選ぶ設定値（未設定・選択肢にない値ならdefaultsに初期値を入れて初期値を返す）
+def readSysConfigChoice(config, key, choices, default, defaults):
+    val = readSysConfigStr(config, key, default, defaults)
+    if val in choices:
+        return val
 
-        config.set("DEFAULT", WIT_AI_SERVER_ACCESS_TOKEN, "")
-        writeSysConfig(config)
-        return ""
+    defaults[key] = default
+    return default
 
-    if args.witaitoken == WIT_AI_SERVER_ACCESS_TOKEN_NONE:  # 引数で"none"を指定したら使わない
-        return ""
 
-    return args.witaitoken
+# 無音解析時に作るテンポラリファイルの音声の長さ（iniファイルでは分単位だが、ミリ秒に変換して返す）
+def getSegTmpAudioLength():
+    return getSettings().seg_tmp_audio_length
 
 
-# GoogleAPIで認識する際の言語（デフォルトは日本語(ja-JP)）
-def getRecognizeGoogleLanguage():
-    try:
-        config = readSysConfig()
-        val = config["DEFAULT"].get(RECOGNIZE_GOOGLE_LANGUAGE)
-        if val is not None:
-            val = val.strip()
-            if len(val) > 0:
-                return val
-
-    except:  # 設定ファイルが読めなかったり(初回起動時)、値がおかしかったらデフォルトで保存
-        pass
+# 無音解析時にかけるノイズフィルタの強さ(0以下だとフィルタをかけない)
+def getSegFilterStrength():
+    return getSettings().seg_filter_strength
 
-    config.set("DEFAULT", RECOGNIZE_GOOGLE_LANGUAGE, "ja-JP")
-    writeSysConfig(config)
 
-    return ""
+# ノイズっぽい音声を認識するかどうか
+def isRecognizeNoize():
+    return getSettings().is_recognize_noize
 
 
-# 音声認識にかけたflacファイルを最後に削除するかどうか(デフォルトはTrue)
-def isRemoveTempSplitFlac():
-    ret = 1
-    try:
-        config = readSysConfig()
-        val = config["DEFAULT"].get(REMOVE_TEMP_SPLIT_FLAC)
-        ret = int(val)
+# wit.aiのServer Access Token(未設定時(空文字列)はwit.aiでの認識をスキップする)
+def getWitAiServerAccessToken():
+    return getSettings().wit_ai_server_access_token
 
-    except:  # 設定ファイルが読めなかったり(初回起動時)、値がおかしかったらデフォルトで保存
-        config.set("DEFAULT", REMOVE_TEMP_SPLIT_FLAC, str(ret))
-        writeSysConfig(config)
 
-    return ret != 0
+# GoogleAPIで認識する際の言語（デフォルトは日本語(ja-JP)）
+def getRecognizeGoogleLanguage():
+    return getSettings().recognize_google_language
 
 
-# Whisperのモデル名
-def getWhisperModel():
-    if args.whispermodel is None:  # 引数で未指定の場合はiniファイルの設定を使う
-        try:
-            config = readSysConfig()
-            val = config["DEFAULT"].get(WHISPER_MODEL)
-            if val is not None:
-                return val.strip()
-
-        except:  # 設定ファイルが読めなかったり(初回起動時)、値がおかしかったらデフォルトで保存
-            pass
-
-        ret = WHISPER_MODEL_NONE
-        config.set("DEFAULT", WHISPER_MODEL, ret)
-        writeSysConfig(config)
+# 音声認識にかけたflacファイルを最後に削除するかどうか(デフォルトはTrue)
+def isRemoveTempSplitFlac():
+    return getSettings().is_remove_temp_split_flac
 
-        return ret
 
-    return args.whispermodel  # 引数で直接指定
+# Whisperのモデル名
+def getWhisperModel():
+    return getSettings().whisper_model
 
 
 # Whisperのモデル名が有効かどうか
@@ -264,58 +401,28 @@ def isValidWhisperModel():
 
 # Whisperの言語
 def getWhisperLanguage():
-    try:
-        config = readSysConfig()
-        val = config["DEFAULT"].get(WHISPER_LANG)
-        if val is not None:
-            return val.strip()
-
-    except:  # 設定ファイルが読めなかったり(初回起動時)、値がおかしかったらデフォルトで保存
-        pass
-
-    ret = "ja"
-    config.set("DEFAULT", WHISPER_LANG, ret)
-    writeSysConfig(config)
-
-    return ret
+    return getSettings().whisper_language
 
 
 # Whisper(python版)解析時に作るテンポラリファイルの音声の長さ（iniファイルでは分単位だが、ミリ秒に変換して返す）
 def getWhisperTmpAudioLength():
-    min = 5  # 5分ごとに分割（デフォルト）
-
-    try:
-        config = readSysConfig()
-        val = config["DEFAULT"].get(WHISPER_TMP_AUDIO_LENGTH)
-        min = int(val)
-        if min < 1:  # 最低でも1分区切り
-            min = 1
-
-    except:  # 設定ファイルが読めなかったり(初回起動時)、値がおかしかったらデフォルトで保存
-        min = 5
-        config.set("DEFAULT", WHISPER_TMP_AUDIO_LENGTH, str(min))
-        writeSysConfig(config)
-
-    return min * 60 * 1000
+    return getSettings().whisper_tmp_audio_length
 
 
 # Whisper(バイナリ版)解析時に読み込む音声の長さ（iniファイルでは分単位だが、ミリ秒に変換して返す）
 def getWhisperBinaryDuration():
-    min = 20  # 20分ごとに出力（デフォルト）
+    return getSettings().whisper_binary_duration
 
-    try:
-        config = readSysConfig()
-        val = config["DEFAULT"].get(WHISPER_BINARY_DURATION)
-        min = int(val)
-        if min < 1:  # 最低でも1分区切り
-            min = 1
-
-    except:  # 設定ファイルが読めなかったり(初回起動時)、値がおかしかったらデフォルトで保存
-        min = 20
-        config.set("DEFAULT", WHISPER_BINARY_DURATION, str(min))
-        writeSysConfig(config)
 
-    return min * 60 * 1000
+# 音声ファイルのhash値の求め方（full:ファイル全体、sampled:一部のブロックのみ（巨大な動画ファイル向け））
+def getInputFileHashMode():
+    return getSettings().input_file_hash_mode
+
+
+# 無音解析結果・分割結果・認識結果をプロジェクトDB(SQLite)にも保存するかどうか(デフォルトはFalse)
+def isUseProjectDb():
+    return getSettings().is_use_project_db
+
 
 # システムconfig読み込み
 def readSysConfig():
@@ -340,44 +447,129 @@ def getConfigFile(input_file):
     return os.path.join(outputdir, ini_file)
 
 
-# 認識する音声ファイルのconfig読み込み
-def readConfig(input_file):
+# 認識する音声ファイルのconfig(進捗状況)はメモリ上に保持し、まとめてiniファイルに書き込む
+CONFIG_FLUSH_COUNT = 20  # 更新がこの回数たまったら書き込む
+CONFIG_FLUSH_INTERVAL = 10  # 前回の書き込みからこの秒数が経っていたら書き込む
+
+input_file_states = {}  # 音声ファイルごとの状態（key=iniファイルのパス）
+input_file_states_lock = threading.Lock()  # input_file_states自体の操作用のロック
+
+
+# 音声ファイルごとの状態を取得（なければ作る）
+def getInputFileState(input_file):
     ini_file = getConfigFile(input_file)
 
-    config = configparser.ConfigParser()
-    config.read(ini_file, "utf-8")
+    with input_file_states_lock:
+        state = input_file_states.get(ini_file)
+        if state is None:
+            state = {
+                "lock": threading.Lock(),  # 音声ファイルごとのロック
+                "ini_file": ini_file,
+                "input_file": input_file,
+                "config": None,  # 初回アクセス時にiniファイルから読み込む
+                "dirty": 0,  # iniファイルに書き込んでいない更新の数
+                "flushed_time": time.time(),  # 最後にiniファイルに書き込んだ時間
+            }
+            input_file_states[ini_file] = state
+
+    return state
+
+
+# メモリ上のconfigを返す（state["lock"]を取った状態で呼ぶこと）
+def loadInputFileConfig(input_file, state):
+    config = state["config"]
+    if config is None:
+        config = configparser.ConfigParser()
+        config.read(state["ini_file"], "utf-8")
 
     # 音声のhash値が違ったら最初からやり直し
     hash = inputFileHash(input_file)
     if config["DEFAULT"].get("hash") != hash:
         config = configparser.ConfigParser()
         config.set("DEFAULT", "hash", hash)
+        config.set("DEFAULT", "input_file", input_file)
 
-    config.set("DEFAULT", "input_file", input_file)
-
+    state["config"] = config
     return config
 
 
-# 認識する音声ファイルのconfig更新
-def updateConfig(input_file, difference):
-    global input_file_config_lock
+# メモリ上のconfigをiniファイルに書き込む（state["lock"]を取った状態で呼ぶこと）
+def writeInputFileConfig(state):
+    if state["config"] is None or state["dirty"] == 0:
+        return
+
+    # 書き込み途中で落ちてもiniファイルが壊れないように、テンポラリファイルからリネームする
+    ini_file = state["ini_file"]
+    tmp_file = ini_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as configfile:
+        state["config"].write(configfile)
+    os.replace(tmp_file, ini_file)
+
+    if useProjectDb(state["input_file"]):  # プロジェクトDBにも同じ内容を書き込む
+        projectdb.writeStageState(
+            state["input_file"], dict(state["config"].items("DEFAULT", raw=True))
+        )
+
+    state["dirty"] = 0
+    state["flushed_time"] = time.time()
+
+
+# 認識する音声ファイルのconfig読み込み（メモリ上の値のコピーを返す）
+def readConfig(input_file):
+    state = getInputFileState(input_file)
+
+    with state["lock"]:
+        config = loadInputFileConfig(input_file, state)
+        ret = configparser.ConfigParser()
+        ret.read_dict({"DEFAULT": dict(config.items("DEFAULT", raw=True))})
+
+    ret.set("DEFAULT", "input_file", input_file)
 
-    with input_file_config_lock:
-        config = readConfig(input_file)
+    return ret
+
+
+# 認識する音声ファイルのconfig更新（flush=Trueか、更新がたまったらiniファイルに書き込む）
+def updateConfig(input_file, difference, flush=False):
+    state = getInputFileState(input_file)
+
+    with state["lock"]:
+        config = loadInputFileConfig(input_file, state)
+        config.set("DEFAULT", "input_file", input_file)
         for key, val in difference.items():
             config.set("DEFAULT", key, val)
 
-        ini_file = getConfigFile(input_file)
-        with open(ini_file, "w", encoding="utf-8") as configfile:
-            config.write(configfile)
+        state["dirty"] += 1
+        if (
+            flush
+            or state["dirty"] >= CONFIG_FLUSH_COUNT
+            or time.time() - state["flushed_time"] >= CONFIG_FLUSH_INTERVAL
+        ):
+            writeInputFileConfig(state)
+
+
+# 認識する音声ファイルのconfigをiniファイルに書き込む
+def flushConfig(input_file):
+    state = getInputFileState(input_file)
+    with state["lock"]:
+        writeInputFileConfig(state)
 
 
-# 元になる音声のhash値
+# すべての音声ファイルのconfigをiniファイルに書き込む（終了時・中断時）
+def flushAllConfig():
+    with input_file_states_lock:
+        states = list(input_file_states.values())
+
+    for state in states:
+        with state["lock"]:
+            try:
+                writeInputFileConfig(state)
+            except Exception as e:
+                logger.error("進捗状況の書き込みに失敗しました({}):{}".format(state["ini_file"], e))
+
+
+# 元になる音声のhash値（計算は1回だけで、以降はキャッシュを返す）
 def inputFileHash(input_file):
-    with open(input_file, "rb") as file:
-        fileData = file.read()
-        hash_sha3_256 = hashlib.sha3_256(fileData).hexdigest()
-        return hash_sha3_256
+    return fingerprint.getFingerprint(input_file, getInputFileHashMode())
 
 
 # 拡張子を省いたファイル名を返す（これをフォルダ名などにする）
@@ -459,6 +651,288 @@ def getRecognizeResultFileWhisper(input_file):
     return os.path.join(outputdir, output_file)
 
 
+# 認識の進捗ジャーナル(engineごとに分ける)
+def getRecognizeJournalFile(input_file, engine):
+    base = getFileNameWithoutExtension(input_file)
+    basedir = os.path.dirname(input_file)  # 入力音声ファイルの置いてあるディレクトリ
+    outputdir = os.path.join(basedir, base)  # 各種ファイルの出力先ディレクトリ
+
+    output_file = "_{}_{}.journal".format(base, engine)
+
+    return os.path.join(outputdir, output_file)
+
+
+# 処理の入力の指紋（上流の処理結果のhash値と、結果が変わる設定をまとめたdictのhash値）
+def getStageFingerprint(params):
+    text = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# 処理が完了済みで、前回と入力が変わっていないかどうか（変わっていたらやり直す。下流の処理は上流の結果のhash値が変わるのでやり直しになる）
+# get_paramsは入力をまとめたdictを返す関数（hash値の計算は重いので、完了済みの場合だけ呼ぶ）
+def isStageDone(input_file, key, get_params):
+    config = readConfig(input_file)
+    if config["DEFAULT"].get(key) != DONE:
+        return False
+
+    stage_fingerprint = getStageFingerprint(get_params())
+    saved = config["DEFAULT"].get(key + FINGERPRINT_KEY_SUFFIX)
+    if saved is None:  # 指紋を記録していないバージョンで完了したものは、そのまま使う（今回の指紋を記録しておく）
+        updateConfig(input_file, {key + FINGERPRINT_KEY_SUFFIX: stage_fingerprint})
+        return True
+
+    if saved != stage_fingerprint:
+        logger.info("前回から入力・設定が変わったためやり直します({})".format(key))
+        return False
+    return True
+
+
+# 処理が完了したことを、入力の指紋と一緒にiniファイルに保存
+def markStageDone(input_file, key, params, difference={}):
+    values = {key: DONE, key + FINGERPRINT_KEY_SUFFIX: getStageFingerprint(params)}
+    values.update(difference)
+    updateConfig(input_file, values, flush=True)
+
+
+# 認識の進捗ジャーナルのヘッダ（分割結果のhash値と、認識の条件）
+def getRecognizeJournalHeader(input_file, params):
+    return {"split": fingerprint.fullHash(getSplitResultFile(input_file)), "params": params}
+
+
+# 認識の進捗ジャーナルを開く。(ジャーナル, 認識済みのレコードのdict(key=id)) を返す
+# 分割結果が変わっていても、区間(開始・終了時間)が同じセグメントの認識結果は使い回す（新しい・変わったセグメントだけ認識する）
+def openRecognizeJournal(input_file, engine, params):
+    def reuse(saved_header, saved_records):
+        if saved_header.get("params", params) != params:  # 認識の条件が変わっていたら使わない（条件を記録していないジャーナルは同じ条件とみなす）
+            return []
+
+        saved = {(record["start_time"], record["end_time"]): record for record in saved_records}
+        audio_file_prefix = getSplitAudioFilePrefix(input_file)
+        records = []
+        for split_result in readSplitResult(input_file):  # ID,ファイル名,開始時間,終了時間,長さ,(開始時間,終了時間)の順
+            start_time = int(float(split_result[2]))
+            end_time = int(float(split_result[3]))
+            record = saved.get((start_time, end_time))
+            if record is None:
+                continue
+
+            id = int(split_result[0])
+            org_start_time = start_time
+            org_end_time = end_time
+            try:
+                org_start_time = int(float(split_result[5]))
+                org_end_time = int(float(split_result[6]))
+            except IndexError:
+                pass
+
+            record = dict(record)
+            record.update(
+                {
+                    "id": id,
+                    "audio_file": "{}{}.mp3".format(audio_file_prefix, id),
+                    "org_start_time": org_start_time,
+                    "org_end_time": org_end_time,
+                }
+            )
+            records.append(record)
+
+        logger.info("分割結果が変わったため、区間が同じセグメントの認識結果を使います({}/{}件)".format(len(records), len(saved_records)))
+        return records
+
+    return journal.openJournal(
+        getRecognizeJournalFile(input_file, engine), getRecognizeJournalHeader(input_file, params), reuse
+    )
+
+
+# ジャーナルに記録した認識結果を、分割結果の順に認識結果ファイル(csv)に書き出す（プロジェクトDBを使う場合はDBにも書き込む）
+def writeRecognizeResultFile(input_file, engine, recognize_result_file, split_results, records):
+    lines = list()
+    for split_result in split_results:
+        record = records.get(int(split_result[0]))
+        if record is None:
+            continue
+        line = "{},{},{},{},{},{}".format(
+            record["base"],
+            record["audio_file"],
+            record["org_start_time"],
+            record["org_end_time"] - record["org_start_time"],
+            record["confidence"],
+            record["text"],
+        )
+        lines.append((record["id"], line))
+
+    tmp_file = recognize_result_file + ".tmp"
+    with codecs.open(tmp_file, "w", "CP932", "ignore") as f:
+        for id, line in lines:
+            f.write(line + "\n")
+    os.replace(tmp_file, recognize_result_file)
+
+    if useProjectDb(input_file):
+        projectdb.writeResults(input_file, engine, lines)
+
+
+# 認識結果(csvの行のリスト)の読み込み。プロジェクトDBになければファイルから読む
+def readRecognizeResult(input_file, engine, recognize_result_file):
+    if useProjectDb(input_file):
+        lines = projectdb.readResults(input_file, engine)
+        if lines is not None:
+            return lines
+
+    with codecs.open(recognize_result_file, "r", "CP932", "ignore") as f:
+        return f.read().splitlines()
+
+
+# 無音解析結果の保存（テキストファイルはseg2csvで出力済み。プロジェクトDBを使う場合はDBにも書き込む）
+def storeSegResult(input_file, index, segmentation):
+    if useProjectDb(input_file):
+        projectdb.writeSegments(input_file, index, segmentation)
+
+
+# 無音解析結果((ラベル,開始秒,終了秒)のリスト)の読み込み。結果がなければNoneを返す
+def readSegResult(input_file, index):
+    if useProjectDb(input_file):
+        segmentation = projectdb.readSegments(input_file, index)
+        if segmentation is not None:
+            return segmentation
+
+    return readSegResultFile(getSegResultFile(input_file, index))
+
+
+# from_index番目以降の無音解析結果を消す（前回の解析で作った、今回は作らない結果が読まれないようにする）
+def removeSegResultFiles(input_file, from_index):
+    index = from_index
+    while True:
+        seg_result_file = getSegResultFile(input_file, index)
+        if os.path.exists(seg_result_file) == False:
+            break
+        logger.debug("remove:{}".format(seg_result_file))
+        os.remove(seg_result_file)
+        index += 1
+
+    if useProjectDb(input_file):
+        projectdb.deleteSegments(input_file, from_index)
+
+
+# 無音解析結果ファイル（タブ区切り）の読み込み。ファイルがなければNoneを返す
+def readSegResultFile(seg_result_file):
+    if os.path.exists(seg_result_file) == False:
+        return None
+
+    segmentation = list()
+    with open(seg_result_file, "r") as f:
+        f.readline()  # ヘッダを読み捨て
+
+        for line in f.readlines():
+            segment = line.split("\t")
+            segmentation.append((segment[0], float(segment[1]), float(segment[2])))
+
+    return segmentation
+
+
+# 分割結果の書き込み（rowsはID,分割した音声ファイル名(flac),開始時間(冒頭無音あり),終了時間(末尾無音あり),長さ(無音あり),開始時間(冒頭無音なし),終了時間(末尾無音なし)のリスト）
+def writeSplitResult(input_file, rows):
+    split_result_file = getSplitResultFile(input_file)
+    with open(split_result_file, "w", encoding="CP932") as f:
+        for row in rows:
+            f.write("\t".join([str(v) for v in row]) + "\n")
+
+    if useProjectDb(input_file):
+        projectdb.writeSplitPlan(input_file, rows)
+
+
+# 分割結果の読み込み（_split.txtの1行をタブで区切ったものと同じ形式のリストを返す）
+def readSplitResult(input_file):
+    if useProjectDb(input_file):
+        if projectdb.countSplitPlan(input_file) > 0:
+            return [[str(v) for v in row] for row in projectdb.readSplitPlan(input_file)]
+
+    with codecs.open(getSplitResultFile(input_file), "r", "CP932", "ignore") as f:
+        return [line.split("\t") for line in f.readlines()]
+
+
+# プロジェクトDBを使うかどうか。使う場合、初回はトラックを開いて、DBが空ならテキストファイルから移行する
+def useProjectDb(input_file):
+    if not isUseProjectDb():
+        return False
+
+    if projectdb.openTrack(input_file, inputFileHash(input_file)):
+        importTextFilesToProjectDb(input_file)
+
+    return True
+
+
+# このスレッドのプロジェクトDBの接続を閉じる（スレッドや処理が終わったら呼ぶ。次に使うときはまた接続する）
+def closeProjectDb():
+    projectdb.close()
+
+
+# 既存のプロジェクトフォルダのテキストファイルをプロジェクトDBに取り込む
+def importTextFilesToProjectDb(input_file):
+    # 音声のhash値がiniファイルの記録と違っていたら、テキストファイルは古いので取り込まない
+    config = configparser.ConfigParser()
+    config.read(getConfigFile(input_file), "utf-8")
+    if config["DEFAULT"].get("hash") != inputFileHash(input_file):
+        return
+
+    logger.info("プロジェクトDBへ移行：{}".format(os.path.basename(input_file)))
+
+    # 無音解析結果
+    index = 0
+    while True:
+        segmentation = readSegResultFile(getSegResultFile(input_file, index))
+        if segmentation is None:
+            break
+        projectdb.writeSegments(input_file, index, segmentation)
+        index += 1
+
+    # 分割結果
+    split_result_file = getSplitResultFile(input_file)
+    if os.path.exists(split_result_file):
+        with codecs.open(split_result_file, "r", "CP932", "ignore") as f:
+            rows = [line.rstrip("\r\n").split("\t") for line in f.readlines()]
+        projectdb.writeSplitPlan(
+            input_file,
+            [[int(row[0]), row[1]] + [float(v) for v in row[2:7]] for row in rows if len(row) >= 7],
+        )
+
+    # 認識結果(engine名は進捗ジャーナルと同じ)
+    base = getFileNameWithoutExtension(input_file)
+    result_files = {
+        RECOGNIZE_ENGINE_GOOGLE: getRecognizeResultFile(input_file),
+        RECOGNIZE_ENGINE_WITAI: getRecognizeResultFileWitAI(input_file),
+    }
+    for whisper_result_file in glob.glob(
+        os.path.join(os.path.dirname(getConfigFile(input_file)), glob.escape("_{}_whisper_".format(base)) + "*.csv")
+    ):
+        if whisper_result_file == getSegmentFileWhisper(input_file):
+            continue
+        model = os.path.splitext(os.path.basename(whisper_result_file))[0][len("_{}_whisper_".format(base)):]
+        result_files["whisper_" + model] = whisper_result_file
+
+    for engine, recognize_result_file in result_files.items():
+        if not os.path.exists(recognize_result_file):
+            continue
+        lines = list()
+        with codecs.open(recognize_result_file, "r", "CP932", "ignore") as f:
+            for line in f.read().splitlines():
+                row = next(csv.reader([line]), [])
+                if len(row) < 2:
+                    continue
+                audio_file = os.path.splitext(row[1])[0]
+                lines.append((int(audio_file[audio_file.rfind("_") + 1 :]), line))
+        projectdb.writeResults(input_file, engine, lines)
+
+    # 進捗状況
+    projectdb.writeStageState(input_file, dict(config.items("DEFAULT", raw=True)))
+
+
+# 認識エンジン名(whisper) モデルごとに分ける
+def getRecognizeEngineWhisper(modelname=None):
+    if modelname is None:
+        modelname = getWhisperModel()
+    return "whisper_" + modelname
+
+
 # 認識中間ファイル(whisper)
 def getSegmentFileWhisper(input_file):
     base = getFileNameWithoutExtension(input_file)
@@ -482,48 +956,162 @@ def getTemporaryFile(input_file, srcfile, extension):
     return os.path.join(outputdir, output_file)
 
 
+# ログはキューに積むだけにして、実際の出力（標準出力とログファイル）は専用のスレッド1本で行う
+log_queue = queue.SimpleQueue()
+log_listener = None
+progress_logger = None  # 進捗専用チャネルのlogger（--progressfd/--progressfile 指定時のみ）
+progress_listener = None
+worker_log_queue = None  # ワーカープロセスからログを受け取るキュー（multiprocessing.Queue）
+worker_log_listener = None
+log_lock = threading.Lock()
+
+
+# ログ出力スレッド開始（最初の1回だけ）
+def startLogListener():
+    global log_listener
+
+    with log_lock:
+        if log_listener is not None:
+            return
+        if isWorkerProcess():  # ワーカープロセスはログファイルを開かない（sendLogsToWorkerParentでメインのプロセスに送る）
+            return
+
+        # logフォルダがなければmkdir
+        os.makedirs("log", exist_ok=True)
+
+        # 標準出力
+        handler1 = logging.StreamHandler(sys.stdout)
+        handler1.setLevel(logging.INFO)
+        handler1.setFormatter(logging.Formatter("%(asctime)s [%(name)s] %(message)s"))
+
+        # ログファイル
+        handler2 = logging.handlers.RotatingFileHandler(
+            filename="log/disnote.log", maxBytes=1024 * 1024 * 10, backupCount=3
+        )
+        handler2.setLevel(logging.INFO)
+        handler2.setFormatter(
+            logging.Formatter(
+                "%(asctime)s %(process)8d [%(levelname)s] %(name)s %(message)s"
+            )
+        )
+
+        log_listener = logging.handlers.QueueListener(
+            log_queue, handler1, handler2, respect_handler_level=True
+        )
+        log_listener.start()
+
+
+# ログ出力スレッド停止（キューに残っているログを全て書き出してから止める）
+def stopLogListener():
+    global log_listener, progress_listener, worker_log_listener
+
+    with log_lock:
+        for listener in [worker_log_listener, progress_listener, log_listener]:  # ワーカープロセスのログを先に積んでおく
+            if listener is not None:
+                listener.stop()
+        worker_log_listener = None
+        progress_listener = None
+        log_listener = None
+
+
+# ワーカープロセスのログを受け取るキューを返す（contextはmultiprocessingのcontext。最初の1回だけ作る）
+# 受け取ったログはこのプロセスのログ出力スレッドに積むので、ログファイルに書くのはメインのプロセスだけになる
+def getWorkerLogQueue(context):
+    global worker_log_queue, worker_log_listener
+
+    with log_lock:
+        if worker_log_queue is None:
+            worker_log_queue = context.Queue()
+            worker_log_listener = logging.handlers.QueueListener(
+                worker_log_queue, logging.handlers.QueueHandler(log_queue)
+            )
+            worker_log_listener.start()
+        return worker_log_queue
+
+
+# ワーカープロセスのログを、メインのプロセスに送る（ワーカープロセスで最初に呼ぶ。それまでのログも送る）
+def sendLogsToWorkerParent(queue):
+    global log_listener
+
+    with log_lock:
+        if log_listener is not None:
+            return
+        log_listener = logging.handlers.QueueListener(log_queue, logging.handlers.QueueHandler(queue))
+        log_listener.start()
+
+
 # logger
 def getLogger(srcfile):
     name = os.path.splitext(os.path.basename(srcfile))[0]  # ソースファイル名（拡張子を取る）
 
+    startLogListener()
+
     logger = logging.getLogger(name)  # logger名loggerを取得
     logger.setLevel(logging.INFO)
 
-    # logフォルダがなければmkdir
+    # 何度呼ばれてもハンドラは1つだけ
+    with log_lock:
+        if not any(isinstance(h, logging.handlers.QueueHandler) for h in logger.handlers):
+            logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    return logger
+
+
+# 進捗専用チャネルを開く（targetは数値ならファイルディスクリプタ、それ以外は名前付きパイプやファイルのパス）
+# 開けなかったら従来通り標準出力に [PROGRESS] をつけて出す
+def openProgressChannel(target):
+    global progress_logger, progress_listener
+
     try:
-        os.mkdir("log")
-    except FileExistsError:
-        pass
+        if isinstance(target, int):
+            stream = os.fdopen(target, "w", encoding="utf-8", newline="\n")
+        else:
+            stream = open(target, "w", encoding="utf-8", newline="\n")
+    except OSError as e:
+        logger.warning("進捗出力先を開けませんでした({}):{}".format(target, e))
+        return
 
-    # 標準出力
-    handler1 = logging.StreamHandler(sys.stdout)
-    handler1.setLevel(logging.INFO)
-    handler1.setFormatter(logging.Formatter("%(asctime)s [%(name)s] %(message)s"))
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(message)s"))
 
-    # ログファイル
-    handler2 = logging.handlers.RotatingFileHandler(
-        filename="log/disnote.log", maxBytes=1024 * 1024 * 10, backupCount=3
-    )
-    handler2.setLevel(logging.INFO)
-    handler2.setFormatter(
-        logging.Formatter(
-            "%(asctime)s %(process)8d [%(levelname)s] %(name)s %(message)s"
-        )
-    )
+    progress_queue = queue.SimpleQueue()
+    progress_listener = logging.handlers.QueueListener(progress_queue, handler)
+    progress_listener.start()
 
-    # loggerに2つのハンドラを設定
-    logger.addHandler(handler1)  # 0番目は標準出力であること（logForGuiでflushするため）
-    logger.addHandler(handler2)
+    progress_logger = logging.getLogger("progress")
+    progress_logger.setLevel(logging.INFO)
+    progress_logger.propagate = False  # 人間用のログには混ぜない
+    progress_logger.addHandler(logging.handlers.QueueHandler(progress_queue))
 
-    return logger
+
+# Whisperのワーカープロセス(multiprocessing)として起動されたかどうか
+# 起動中(メインモジュールの読み込み中)もプロセス名はメインのプロセスと違うので判断できる
+def isWorkerProcess():
+    import multiprocessing
+
+    return multiprocessing.current_process().name != "MainProcess"
 
 
 # common.pyのlogger
 logger = getLogger(__file__)
 
+atexit.register(stopLogListener)  # 終了時に溜まったログを書き出す（atexitは登録と逆順に呼ばれるので、ログを出す終了処理より先に登録する）
+atexit.register(flushAllConfig)  # 途中で終了した場合も、そこまでの進捗は書き込む
+
+# 進捗専用チャネル（ワーカープロセスは進捗を出さないので開かない。ファイルを開き直すと中身が消えてしまう）
+if isWorkerProcess():
+    pass
+elif args.progressfd is not None:
+    openProgressChannel(args.progressfd)
+elif args.progressfile is not None:
+    openProgressChannel(args.progressfile)
+
 
 # サブプロセス実行（returncodeが非0の場合は標準エラー出力をログに吐いて例外を投げる。正常終了時、res.stdoutに標準出力）
 def runSubprocess(args):
+    if isinstance(args, str) and os.name != "nt":  # Windows以外では文字列のままだと実行できないので分解する
+        args = shlex.split(args)
+
     res = subprocess.run(
         args, encoding="utf-8", capture_output=True, text=True
     )  # , stdout=subprocess.PIPE, stderr=subprocess.PIPE)
@@ -540,19 +1128,19 @@ def runSubprocess(args):
     return res
 
 
-# メディアファイルのフォーマットを返す
+# メディアファイルのフォーマット(ffprobeのstreamsとformat)を返す。結果はキャッシュされ、ffprobeは1ファイルにつき1回だけ実行する
 def getFileFormat(input_file):
     try:
-        res = runSubprocess(
-            'ffprobe.exe -v error -show_streams -print_format json "{}"'.format(
-                input_file
-            )
-        )
-        return res.stdout
+        return probe.getProbe(input_file, inputFileHash(input_file))
     except Exception as e:
-        logger = getLogger(__file__)
         logger.error("フォーマット確認失敗。{} は音声ファイルではないようです。".format(input_file))
-        pass
+        raise
+
+
+# メディアファイルの再生時間（ミリ秒）
+def getDuration(input_file):
+    return float(getFileFormat(input_file)["format"]["duration"]) * 1000
+
 
 # キャンセルファイル
 def getCancelFilePath():
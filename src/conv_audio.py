@@ -6,7 +6,9 @@ import traceback
 import codecs
 from mutagen.easyid3 import EasyID3
 import csv
-import shutil
+import functools
+import ffmpegjob
+import pcm_cache
 
 logger = common.getLogger(__file__)
 
@@ -15,9 +17,12 @@ CONFIG_WORK_CONV_READY = "speech_rec_conv_ready"
 
 
 # 音声ファイルをtxtファイルに出力された結果に従ってmp3に変換（htmlから再生する用）
-def main(input_file):
+def main(input_file, settings=None):
     logger.info("4. 音声変換開始 - {}".format(os.path.basename(input_file)))
 
+    if settings is None:  # 呼び出し元から渡されなかったら共通の設定を使う
+        settings = common.getSettings()
+
     config = common.readConfig(input_file)
     # 	if config['DEFAULT'].get(CONFIG_WORK_KEY) == common.DONE: # 処理順によっては変換前のファイルが残っていることがあるので、完了済みでもreturnしない
     # 		logger.info("完了済みのためスキップ(音声変換)")
@@ -34,29 +39,27 @@ def main(input_file):
     base = os.path.splitext(os.path.basename(input_file))[0]  # 拡張子なしのファイル名（話者）
 
     # 最後にflacファイルを消すかどうか
-    is_remove_temp_split_flac = common.isRemoveTempSplitFlac()
+    is_remove_temp_split_flac = settings.is_remove_temp_split_flac
     logger.info("テンポラリファイル削除：{}".format(is_remove_temp_split_flac))
 
     # 分割結果ファイルの読み込み
     split_result_file = common.getSplitResultFile(input_file)
     logger.info("分割結果ファイル：{}".format(os.path.basename(split_result_file)))
 
-    split_result_queue = deque()
-    with codecs.open(split_result_file, "r", "CP932", "ignore") as f:
-        file_data = f.readlines()
-        for line in file_data:
-            split_result_queue.append(line.split("\t"))
+    split_result_queue = deque(common.readSplitResult(input_file))
 
     # 認識結果ファイルの読み込み
     recognize_result_file = common.getRecognizeResultFile(input_file)
     logger.info("認識結果ファイル：{}".format(os.path.basename(recognize_result_file)))
 
-    recognize_result_list = list()
-    with codecs.open(recognize_result_file, "r", "CP932", "ignore") as f:
-        rows = csv.reader(f)
-        recognize_result_list.extend(rows)
+    recognize_result_list = list(
+        csv.reader(
+            common.readRecognizeResult(input_file, common.RECOGNIZE_ENGINE_GOOGLE, recognize_result_file)
+        )
+    )
 
     logger.info("音声変換中… {}".format(os.path.basename(input_file)))
+    jobs = []  # (ffmpegのジョブ, ID, srcファイル名(flac))
 
     queuesize = len(split_result_queue)
 
@@ -113,75 +116,88 @@ def main(input_file):
 
             logger.debug("変換後のファイルが存在しているが、古いので作り直す:{}".format(audio_file))
 
-        # 無音部分を省いてmp3に変換。いったんテンポラリファイルに吐く（ffmpegの処理中にプロセスが落ちると中途半端なファイルが残ってしまうのを防ぐ）
-        tmp_audio_file = common.getTemporaryFile(input_file, __file__, "mp3")
-        logger.debug(
-            'ffmpeg -ss {} -t {} -i "{}" -vn -y "{}"'.format(
-                (org_start_time - start_time) / 1000,
-                (org_end_time - org_start_time) / 1000,
-                src_audio_file,
-                tmp_audio_file,
-            )
+        # 無音部分を省いてmp3に変換。テンポラリファイルに吐いてからリネームするのは実行エンジンが行う（ffmpegの処理中にプロセスが落ちると中途半端なファイルが残ってしまうのを防ぐ）
+        process_args = [
+            "ffmpeg",
+            "-ss",
+            str((org_start_time - start_time) / 1000),
+            "-t",
+            str((org_end_time - org_start_time) / 1000),
+            "-i",
+            src_audio_file,
+            "-vn",
+            "-y",
+        ]
+        logger.debug("ffmpeg process:{} {}".format(process_args, audio_file))
+        job = ffmpegjob.submit(
+            process_args,
+            output_file=audio_file,
+            on_output=functools.partial(writeTag, base=base, org_start_time=org_start_time, text=text),
         )
-        try:
-            common.runSubprocess(
-                'ffmpeg -ss {} -t {} -i "{}" -vn -y "{}"'.format(
-                    (org_start_time - start_time) / 1000,
-                    (org_end_time - org_start_time) / 1000,
-                    src_audio_file,
-                    tmp_audio_file,
+        jobs.append((job, id, src_audio_file))
+
+    # 変換が終わったものから後始末
+    try:
+        for job, id, src_audio_file in jobs:
+            try:
+                job.result()
+            except Exception as e:
+                ffmpegjob.checkCancelled()  # キャンセルされた場合はスキップせずに止める（デコードした音声の削除・完了の記録もしない）
+                logger.info(e)
+                logger.info(
+                    "mp3変換に失敗したのでスキップ：{}".format(src_audio_file)
+                )  # 変換元ファイルの内容と-ss,-tの値によっては、ffmpegが異常終了することがある（Output file is empty）
+                continue
+
+            # 変換が終わったのでsrcファイル(flac)を削除する
+            if is_remove_temp_split_flac:
+                logger.debug("remove:{}".format(src_audio_file))
+                os.remove(src_audio_file)
+
+            # 100行ごとか、最後の1行に進捗を出す
+            if (id % 100) == 0 or (id == jobs[-1][1]):
+                logger.info("　音声変換中… {} {}/{}".format(base, id, queuesize))
+                common.logForGui(
+                    logger,
+                    "conv_audio",
+                    input_file,
+                    progress=id,
+                    max=queuesize,
                 )
-            )
-        except Exception as e:
-            logger.info(e)
-            logger.info(
-                "mp3変換に失敗したのでスキップ：{}".format(src_audio_file)
-            )  # 変換元ファイルの内容と-ss,-tの値によっては、ffmpegが異常終了することがある（Output file is empty）
-            continue
-        logger.debug("mp3_end")
+    finally:
+        for job, id, src_audio_file in jobs:  # 中断したら残りは実行しない
+            job.cancel()
+
+    # 音声認識が全て終わっているので、デコードした音声も削除する
+    if is_remove_temp_split_flac:
+        pcm_cache.removePcmFiles(input_file)
 
-        # 分析した音声にタグをつける
-        logger.debug("tag_start")
-        try:
-            audio = EasyID3(tmp_audio_file)
-
-            audio["artist"] = audio["albumartist"] = base
-            audio["title"] = "{:0=2}:{:0=2}:{:0=2} {}".format(
-                int(org_start_time / 1000 / 60 / 60),
-                int(org_start_time / 1000 / 60) % 60,
-                int(org_start_time / 1000) % 60,
-                text,
-            )
-            audio.save()
-        except Exception as e:
-            logger.info(e)
-            pass
-        logger.debug("tag_end")
-
-        # テンポラリファイルからリネーム、上書き
-        shutil.move(tmp_audio_file, audio_file)
-
-        # 変換が終わったのでsrcファイル(flac)を削除する
-        if is_remove_temp_split_flac:
-            logger.debug("remove:{}".format(src_audio_file))
-            os.remove(src_audio_file)
-
-        # 100行ごとか、最後の1行に進捗を出す
-        if (id % 100) == 0 or (len(split_result_queue) == 0):
-            logger.info("　音声変換中… {} {}/{}".format(base, id, queuesize))
-            common.logForGui(
-                logger,
-                "conv_audio",
-                input_file,
-                progress=id,
-                max=queuesize,
-            )
     # 終了したことをiniファイルに保存
-    common.updateConfig(input_file, {CONFIG_WORK_KEY: common.DONE})
+    common.updateConfig(input_file, {CONFIG_WORK_KEY: common.DONE}, flush=True)
 
     logger.info("音声変換終了！ {}".format(os.path.basename(input_file)))
 
 
+# 分析した音声にタグをつける（mp3に変換した直後、リネーム前に呼ばれる）
+def writeTag(tmp_audio_file, base, org_start_time, text):
+    logger.debug("tag_start")
+    try:
+        audio = EasyID3(tmp_audio_file)
+
+        audio["artist"] = audio["albumartist"] = base
+        audio["title"] = "{:0=2}:{:0=2}:{:0=2} {}".format(
+            int(org_start_time / 1000 / 60 / 60),
+            int(org_start_time / 1000 / 60) % 60,
+            int(org_start_time / 1000) % 60,
+            text,
+        )
+        audio.save()
+    except Exception as e:
+        logger.info(e)
+        pass
+    logger.debug("tag_end")
+
+
 # 直接起動した場合
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -0,0 +1,71 @@
+import os
+import threading
+import common
+
+logger = common.getLogger(__file__)
+
+# CPUを使う処理(無音解析とWhisper)へのコアの割り当て
+# 無音解析とWhisperを同時に動かす場合に、それぞれが全コアを使おうとして取り合わないように、
+# 処理待ちの量(トラック数)に応じてコアを分ける。片方の処理待ちがなくなれば、もう片方が全コアを使う。
+# 無音解析は同時に推論するモデルの数で、Whisperは推論のスレッド数(torch、whisper.cppの-t)で割り当てに合わせる。
+
+SEG = "seg"
+WHISPER = "whisper"
+
+condition = threading.Condition()
+demand = {SEG: 0, WHISPER: 0}  # 処理待ち・処理中のトラック数
+busy = {SEG: 0, WHISPER: 0}  # 実行中の処理の数
+allocation = None  # 最後にログに出した割り当て
+
+
+# 割り当てるスレッドの合計（cpu_threads、0ならCPUのコア数）
+def getTotalThreads(settings=None):
+    if settings is None:  # 呼び出し元から渡されなかったら共通の設定を使う
+        settings = common.getSettings()
+    if settings.cpu_threads > 0:
+        return settings.cpu_threads
+    return os.cpu_count() or 1
+
+
+# 処理待ちのトラック数を増減する（割り当てが変わるので、待っている処理を起こす）
+def addDemand(name, count):
+    with condition:
+        demand[name] = max(0, demand[name] + count)
+        condition.notify_all()
+
+
+# 処理に割り当てられたスレッド数（処理待ちのトラック数の比で分ける。最低1）
+def getThreads(name):
+    total = getTotalThreads()
+    with condition:
+        demands = {key: value for key, value in demand.items() if value > 0}
+        demands[name] = max(demands.get(name, 0), 1)  # 登録せずに使う場合も1トラック分とする
+        threads = max(1, round(total * demands[name] / sum(demands.values())))
+        logAllocation(total, demands)
+    return min(threads, total)
+
+
+# 割り当てが変わったらログに出す
+def logAllocation(total, demands):
+    global allocation
+    current = {
+        key: max(1, round(total * value / sum(demands.values()))) for key, value in sorted(demands.items())
+    }
+    if current != allocation:
+        allocation = current
+        logger.debug("CPU割り当て：{}".format(current))
+
+
+# 割り当ての範囲で処理を始める（threadsは処理1つが使うスレッド数。1つも実行中でなければ必ず始められる）。終わったら release() を呼ぶ
+def acquire(name, threads):
+    with condition:
+        while busy[name] > 0 and (busy[name] + 1) * threads > getThreads(name):
+            condition.wait(1)  # 割り当てが増えるか、他の処理が終わるまで待つ
+        busy[name] += 1
+
+
+# 処理が終わったことを知らせる
+def release(name):
+    with condition:
+        busy[name] -= 1
+        condition.notify_all()
@@ -0,0 +1,120 @@
+# 音量だけで無音区間を検出する（inaSpeechSegmenterの1段階目のエネルギーによる検出と同じ考え方）
+# ノイズ部分も認識対象にする設定(is_recognize_noize)では、音声・音楽・ノイズの分類(CNN)の結果は使わず、
+# 無音(noEnergy)かどうかだけで分割するので、CNNを動かさずにこちらで済ませられる。
+# 結果は無音解析結果ファイルと同じ (ラベル, 開始秒, 終了秒) のリスト。無音でない区間のラベルは "energy"。
+
+VERSION = 1  # 判定方法を変えたら上げる（処理結果のキャッシュのキーに使う）
+
+SAMPLE_RATE = 16000
+FRAME_LENGTH = 400  # 25ms（inaSpeechSegmenterの特徴量と同じ）
+FRAME_SHIFT = 160  # 10ms
+FRAME_STEP = 2  # 2フレームごと(20ms単位)に判定する（inaSpeechSegmenterと同じ）
+PRE_EMPHASIS = 0.97
+ENERGY_RATIO = 0.03  # 平均の対数エネルギーからこの比率(の対数)を引いたものをしきい値にする（inaSpeechSegmenterの既定値）
+
+LABEL_NO_ENERGY = "noEnergy"
+LABEL_ENERGY = "energy"
+
+
+# フレームごとの対数エネルギー（20ms単位）。samplesは16kHz monoのint16の配列
+def logEnergy(samples):
+    import numpy as np  # 起動時間を短くするため、使うときに初めてimportする
+
+    frame_count = len(samples) // FRAME_SHIFT
+    if frame_count == 0:
+        return np.zeros(0)
+
+    # フレームの中心が10msごとになるように前後を0で埋める
+    pad = (FRAME_LENGTH - FRAME_SHIFT) // 2
+    signal = np.zeros(frame_count * FRAME_SHIFT + FRAME_LENGTH, dtype=np.float64)
+    signal[pad : pad + len(samples)] = samples[: len(signal) - pad]
+
+    emphasized = np.empty_like(signal)
+    emphasized[0] = signal[0]
+    emphasized[1:] = signal[1:] - PRE_EMPHASIS * signal[:-1]
+
+    # 累積和の差でフレームごとの二乗和を求める（フレームを切り出して並べるより省メモリ）
+    cumsum = np.concatenate(([0.0], np.cumsum(emphasized * emphasized)))
+    starts = np.arange(0, frame_count, FRAME_STEP) * FRAME_SHIFT
+    energy = np.maximum(cumsum[starts + FRAME_LENGTH] - cumsum[starts], 0)
+
+    with np.errstate(divide="ignore"):
+        return np.log(energy)
+
+
+# 無音かどうかを判定して区間のリストを返す。start_secは先頭の時刻
+def segment(samples, start_sec=0):
+    import numpy as np
+
+    loge = logEnergy(samples)
+    if len(loge) == 0:
+        return []
+
+    finite = np.isfinite(loge)
+    if not finite.any():  # 全て無音
+        return [(LABEL_NO_ENERGY, start_sec, start_sec + len(loge) * 0.02)]
+
+    threshold = np.mean(loge[finite]) + np.log(ENERGY_RATIO)
+    activity = loge > threshold
+
+    # 判定が切り替わるところで区切る
+    changes = np.flatnonzero(activity[1:] != activity[:-1]) + 1
+    bounds = np.concatenate(([0], changes, [len(activity)]))
+    return [
+        (
+            LABEL_ENERGY if activity[start] else LABEL_NO_ENERGY,
+            start_sec + start * 0.02,
+            start_sec + stop * 0.02,
+        )
+        for start, stop in zip(bounds[:-1].tolist(), bounds[1:].tolist())
+    ]
+
+
+# 無音解析の前段の無音ゲート（デジタル無音の長い区間は、モデルで解析せずに無音(noEnergy)とする）
+# 話者ごとのトラックは大半が無音なので、音がある部分（と前後の余白）だけをモデルで解析する。
+GATE_BLOCK = 0.1  # 振幅を調べる単位（秒）
+GATE_PEAK = 32  # ブロック内の最大振幅がこれ以下なら無音とする（16bitで約-60dBFS）
+GATE_MIN_SILENCE = 3.0  # これより短い無音は解析対象に含める（秒）
+GATE_PADDING = 1.0  # 音がある部分の前後に含める余白（秒）
+
+
+# 音がある範囲（余白込み）を (開始サンプル, 終了サンプル) のリストで返す
+def findSoundSpans(samples, sample_rate=SAMPLE_RATE):
+    import numpy as np
+
+    block = int(sample_rate * GATE_BLOCK)
+    block_count = -(-len(samples) // block)
+    if block_count == 0:
+        return []
+
+    # ブロックごとの最大振幅（最後の端数もブロックとして扱う）
+    full = len(samples) // block
+    peaks = np.zeros(block_count, dtype=np.int32)
+    if full > 0:
+        blocks = samples[: full * block].reshape(full, block)
+        peaks[:full] = np.maximum(blocks.max(axis=1).astype(np.int32), -blocks.min(axis=1).astype(np.int32))
+    if full < block_count:
+        rest = samples[full * block :].astype(np.int32)
+        peaks[full] = np.abs(rest).max()
+    sound = peaks > GATE_PEAK
+
+    # 前後に余白をつける（余白の範囲に音があるブロックを含める）
+    padding = int(GATE_PADDING / GATE_BLOCK)
+    counts = np.concatenate(([0], np.cumsum(sound)))
+    index = np.arange(block_count)
+    active = counts[np.minimum(index + padding + 1, block_count)] - counts[np.maximum(index - padding, 0)] > 0
+
+    # 音がある範囲を取り出し、間の無音が短ければ繋げる
+    changes = np.flatnonzero(active[1:] != active[:-1]) + 1
+    bounds = np.concatenate(([0], changes, [block_count])).tolist()
+    min_silence = int(GATE_MIN_SILENCE / GATE_BLOCK)
+    spans = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if not active[start]:
+            continue
+        if len(spans) > 0 and start - spans[-1][1] < min_silence:
+            spans[-1][1] = end
+        else:
+            spans.append([start, end])
+
+    return [(start * block, min(end * block, len(samples))) for start, end in spans]
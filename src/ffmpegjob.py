@@ -0,0 +1,235 @@
+import os
+import time
+import asyncio
+import tempfile
+import threading
+import subprocess
+import concurrent.futures
+import common
+
+logger = common.getLogger(__file__)
+
+# ffmpegの実行エンジン
+# ffmpegの実行をジョブとして受け付け、決まった数(ffmpeg_max_workers、0ならCPUのコア数)まで並列に実行する。
+# 出力ファイルを指定した場合は、テンポラリファイルに出力してから置き換える（処理中に落ちても中途半端なファイルが残らない）。
+# キャンセルファイルが置かれたり cancelAll() が呼ばれたら、実行中のffmpegをkillする。
+
+POLL_INTERVAL_MIN = 0.001  # ffmpegの終了確認の間隔（最初）
+POLL_INTERVAL_MAX = 0.05  # ffmpegの終了確認の間隔（最大）
+CANCEL_CHECK_INTERVAL = 1  # キャンセルファイルの確認間隔（秒）
+
+OUTPUT = "\0output"  # 引数の中で出力ファイル（のテンポラリファイル）に置き換える場所（出力ファイルが複数ある場合に使う）
+
+lock = threading.Lock()
+executor = None  # ThreadPoolExecutor（初回のsubmitで作る）
+running_procs = set()  # 実行中のffmpeg（キャンセル時にkillする）
+cancelled = threading.Event()
+stats = {"count": 0, "wall_time": 0.0, "cpu_time": 0.0}  # 実行したジョブの数と合計時間
+
+
+# 同時に実行する数
+def getMaxWorkers(settings=None):
+    if settings is None:  # 呼び出し元から渡されなかったら共通の設定を使う
+        settings = common.getSettings()
+    if settings.ffmpeg_max_workers > 0:
+        return settings.ffmpeg_max_workers
+    return os.cpu_count() or 1
+
+
+# ThreadPoolExecutorを返す（なければ作る）
+def getExecutor():
+    global executor
+    with lock:
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=getMaxWorkers(), thread_name_prefix="ffmpeg"
+            )
+        return executor
+
+
+# ジョブを登録してFutureを返す。argsは出力ファイルを除いたffmpegの引数のリスト。
+# output_fileを指定すると、テンポラリファイルを最後の引数にして実行し、成功したらoutput_fileに置き換える。
+# output_fileにリストを渡すと、argsの中のOUTPUTを順にそれぞれのテンポラリファイルに置き換える（1回のffmpegで複数出力）。
+# on_outputを指定すると、置き換える前にテンポラリファイルのパスを渡して呼ぶ（タグ付けなど）。
+# Futureの結果は {"returncode", "stdout", "stderr", "wall_time", "cpu_time"}、失敗したら例外。
+def submit(args, output_file=None, timeout=None, on_output=None):
+    checkCancelled()
+    return getExecutor().submit(runJob, list(args), output_file, timeout, on_output)
+
+
+# ジョブを実行して結果を待つ
+def run(args, output_file=None, timeout=None, on_output=None):
+    return submit(args, output_file, timeout, on_output).result()
+
+
+# ジョブを実行して結果を待つ(asyncio用)
+async def runAsync(args, output_file=None, timeout=None, on_output=None):
+    return await asyncio.wrap_future(submit(args, output_file, timeout, on_output))
+
+
+# ffmpegを起動して、標準出力をパイプで受け取れるプロセスを返す（デコード結果を少しずつ読む場合に使う。同時実行数には数えない）。
+# cancelAll() でkillされる。使い終わったら closePipe() を呼ぶこと
+def openPipe(args):
+    checkCancelled()
+    proc = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    with lock:
+        running_procs.add(proc)
+    return proc
+
+
+# openPipe() で起動したffmpegを終わらせて、終了コードを返す（途中で閉じる場合はkillする）
+def closePipe(proc):
+    with lock:
+        running_procs.discard(proc)
+    if proc.poll() is None:
+        killProcess(proc)
+    proc.stdout.close()
+    return proc.returncode
+
+
+# 実行中のffmpegをkillして、これから実行するジョブも全てキャンセルする
+def cancelAll():
+    cancelled.set()
+    with lock:
+        procs = list(running_procs)
+    for proc in procs:  # 回収はジョブを実行しているスレッドが行う
+        try:
+            proc.kill()
+        except OSError:
+            pass
+
+
+# 実行したジョブの数と合計時間（壁時計時間、CPU時間）を返す
+def getStats():
+    with lock:
+        return dict(stats)
+
+
+# 1つのジョブを実行（ワーカースレッドで呼ばれる）
+def runJob(args, output_file, timeout, on_output):
+    checkCancelled()
+
+    if output_file is None:
+        output_files = []
+    elif isinstance(output_file, str):
+        output_files = [output_file]
+    else:
+        output_files = list(output_file)
+
+    tmp_files = []
+    try:
+        for file in output_files:
+            # 出力先と同じフォルダにテンポラリファイルを作る（拡張子で出力フォーマットが決まるので拡張子は残す）
+            fd, tmp_file = tempfile.mkstemp(
+                prefix="_tmp_",
+                suffix=os.path.splitext(file)[1],
+                dir=os.path.dirname(os.path.abspath(file)),
+            )
+            os.close(fd)
+            tmp_files.append(tmp_file)
+
+        if OUTPUT in args:
+            tmp_iter = iter(tmp_files)
+            args = [next(tmp_iter) if arg == OUTPUT else arg for arg in args]
+        else:
+            args = args + tmp_files
+
+        result = execute(args, timeout)
+        if result["returncode"] != 0:
+            logger.error(args)
+            logger.error(result["stderr"])
+            raise RuntimeError(result["stderr"])
+
+        for tmp_file, file in zip(tmp_files, output_files):
+            if on_output is not None:
+                on_output(tmp_file)
+            os.replace(tmp_file, file)  # テンポラリファイルから置き換え
+
+        return result
+    finally:
+        for tmp_file in tmp_files:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+
+# ffmpegを実行して終了を待つ（タイムアウトやキャンセルの場合はkillする）
+def execute(args, timeout):
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:  # パイプだと詰まるのでファイルに受ける
+        start = time.perf_counter()
+        proc = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=stdout, stderr=stderr)
+        with lock:
+            running_procs.add(proc)
+
+        try:
+            returncode, cpu_time = waitProcess(proc, start, timeout)
+        finally:
+            with lock:
+                running_procs.discard(proc)
+
+        wall_time = time.perf_counter() - start
+
+        stdout.seek(0)
+        stderr.seek(0)
+        result = {
+            "returncode": returncode,
+            "stdout": stdout.read().decode("utf-8", "replace"),
+            "stderr": stderr.read().decode("utf-8", "replace"),
+            "wall_time": wall_time,
+            "cpu_time": cpu_time,
+        }
+
+    with lock:
+        stats["count"] += 1
+        stats["wall_time"] += wall_time
+        if cpu_time is not None:
+            stats["cpu_time"] += cpu_time
+
+    return result
+
+
+# プロセスの終了を待つ。(returncode, CPU時間(秒。取れない環境ではNone)) を返す
+def waitProcess(proc, start, timeout):
+    interval = POLL_INTERVAL_MIN
+    cancel_checked = start
+
+    while True:
+        if hasattr(os, "wait4"):  # POSIXならrusageからそのプロセスのCPU時間が取れる
+            pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+            if pid != 0:
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                checkCancelled()
+                return proc.returncode, rusage.ru_utime + rusage.ru_stime
+        elif proc.poll() is not None:
+            checkCancelled()
+            return proc.returncode, None
+
+        now = time.perf_counter()
+        if timeout is not None and now - start > timeout:
+            killProcess(proc)
+            raise RuntimeError("ffmpegがタイムアウトしました({}秒)".format(timeout))
+
+        if now - cancel_checked > CANCEL_CHECK_INTERVAL:
+            cancel_checked = now
+            if common.isCancelFileExists():
+                cancelled.set()
+        if cancelled.is_set():
+            killProcess(proc)
+            checkCancelled()
+
+        time.sleep(interval)
+        interval = min(interval * 2, POLL_INTERVAL_MAX)
+
+
+# キャンセルされていたら例外を投げる
+def checkCancelled():
+    if cancelled.is_set():
+        raise RuntimeError("ffmpegの実行はキャンセルされました")
+
+
+# プロセスをkillして回収する
+def killProcess(proc):
+    try:
+        proc.kill()
+        proc.wait()
+    except OSError:
+        pass
@@ -0,0 +1,166 @@
+import os
+import json
+import hashlib
+import threading
+
+# 入力ファイルの指紋(hash値)を求める。
+# 一度計算した値はプロセス内とディスク(log/fingerprint_cache.json)にキャッシュし、
+# (パス, サイズ, 更新日時, inode) が変わっていなければファイルを読まずにキャッシュを返す。
+
+MODE_FULL = "full"  # ファイル全体のhash値（従来のhash値と同じ値になる）
+MODE_SAMPLED = "sampled"  # サイズ＋先頭・末尾＋一定間隔のブロックだけのhash値（巨大な動画ファイル用）
+MODES = [MODE_FULL, MODE_SAMPLED]
+
+SAMPLED_PREFIX = "sampled-"  # sampledモードのhash値につける接頭辞（fullモードの値と区別するため）
+
+CHUNK_SIZE = 1024 * 1024  # ストリーミングで読み込むときの単位
+SAMPLED_BLOCK_SIZE = 1024 * 1024  # sampledモードで読み込むブロックの大きさ
+SAMPLED_BLOCK_COUNT = 32  # sampledモードで先頭・末尾以外に読み込むブロックの数
+
+CACHE_FILE = os.path.join("log", "fingerprint_cache.json")
+
+lock = threading.Lock()  # キャッシュ(dict)操作用のロック
+file_locks = {}  # 同じファイルを複数スレッドで同時にhash計算しないためのロック（key=ファイルパス）
+memory_cache = {}  # プロセス内キャッシュ（key=ファイルパスとモード）
+disk_cache = None  # ディスクキャッシュ（初回アクセス時に読み込む）
+
+
+# ファイルの指紋を返す
+def getFingerprint(input_file, mode=MODE_FULL):
+    if mode not in MODES:
+        raise ValueError("不正なhashモード：{}".format(mode))
+
+    path = os.path.abspath(input_file)
+    key = "{}|{}".format(mode, path)
+
+    stat = os.stat(path)
+    signature = statSignature(stat)
+
+    # キャッシュにあって、ファイルが変わっていなければそれを返す
+    cached = lookupCache(key, signature)
+    if cached is not None:
+        return cached
+
+    with getFileLock(key):
+        cached = lookupCache(key, signature)  # 待っている間に他のスレッドが計算したかもしれない
+        if cached is not None:
+            return cached
+
+        if mode == MODE_SAMPLED:
+            fingerprint = sampledHash(path, stat.st_size)
+        else:
+            fingerprint = fullHash(path)
+
+        # 計算中にファイルが変わっていたらキャッシュしない
+        if statSignature(os.stat(path)) == signature:
+            storeCache(key, signature, fingerprint)
+
+        return fingerprint
+
+
+# キャッシュの有効性確認に使う値
+def statSignature(stat):
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+# ファイル全体を少しずつ読んでhash値を計算する（ファイル全体をメモリに載せない）
+def fullHash(path):
+    hash_sha3_256 = hashlib.sha3_256()
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            hash_sha3_256.update(chunk)
+    return hash_sha3_256.hexdigest()
+
+
+# サイズ、先頭、末尾、一定間隔のブロックだけを読んでhash値を計算する
+def sampledHash(path, size):
+    hash_sha3_256 = hashlib.sha3_256()
+    hash_sha3_256.update(str(size).encode())
+
+    if size <= SAMPLED_BLOCK_SIZE * (SAMPLED_BLOCK_COUNT + 2):  # 小さいファイルは全部読んでも大差ない
+        offsets = range(0, size, SAMPLED_BLOCK_SIZE)
+    else:
+        stride = (size - SAMPLED_BLOCK_SIZE) // (SAMPLED_BLOCK_COUNT + 1)
+        offsets = [stride * i for i in range(SAMPLED_BLOCK_COUNT + 1)]
+        offsets.append(size - SAMPLED_BLOCK_SIZE)  # 末尾
+
+    with open(path, "rb") as file:
+        for offset in offsets:
+            file.seek(offset)
+            hash_sha3_256.update(file.read(SAMPLED_BLOCK_SIZE))
+
+    return SAMPLED_PREFIX + hash_sha3_256.hexdigest()
+
+
+# ファイルごとのロック取得
+def getFileLock(key):
+    with lock:
+        if key not in file_locks:
+            file_locks[key] = threading.Lock()
+        return file_locks[key]
+
+
+# キャッシュから取得（なかったり、ファイルが変わっていたらNone）
+def lookupCache(key, signature):
+    global disk_cache
+
+    with lock:
+        entry = memory_cache.get(key)
+        if entry is None:
+            if disk_cache is None:
+                disk_cache = readDiskCache()
+            entry = disk_cache.get(key)
+            if entry is not None:
+                memory_cache[key] = entry
+
+        if entry is not None and entry["signature"] == signature:
+            return entry["hash"]
+
+    return None
+
+
+# キャッシュに登録（ディスクにも書き込む）
+def storeCache(key, signature, fingerprint):
+    global disk_cache
+
+    with lock:
+        entry = {"signature": signature, "hash": fingerprint}
+        memory_cache[key] = entry
+
+        if disk_cache is None:
+            disk_cache = readDiskCache()
+        disk_cache[key] = entry
+
+        # 存在しなくなったファイルのエントリは消す
+        for path_key in list(disk_cache.keys()):
+            if not os.path.exists(path_key.split("|", 1)[1]):
+                disk_cache.pop(path_key)
+
+        writeDiskCache(disk_cache)
+
+
+# ディスクキャッシュ読み込み（壊れていたら空として扱う）
+def readDiskCache():
+    try:
+        with open(CACHE_FILE, "r", encoding="utf-8") as f:
+            ret = json.load(f)
+            if isinstance(ret, dict):
+                return ret
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+# ディスクキャッシュ書き込み（書き込み途中で落ちても壊れないように、テンポラリファイルからリネームする）
+def writeDiskCache(cache):
+    try:
+        os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+        tmp_file = "{}.{}.tmp".format(CACHE_FILE, os.getpid())
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+        os.replace(tmp_file, CACHE_FILE)
+    except OSError:
+        pass  # キャッシュが書けなくても処理は続けられる
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import zlib
+
+# 音声認識の進捗ジャーナル（認識エンジンごとの追記専用ファイル）
+# 1行1レコードで「crc32(16進8桁)<TAB>json<改行>」の形式。
+# 1行目はヘッダ（分割結果ファイルのhash値など）で、ヘッダが一致しない場合は最初からやり直す（使い回せるレコードは引き継ぐ）。
+# 書き込み途中で落ちた末尾のレコード（改行がない、crcが合わない）は読み込み時に捨てる。
+
+SYNC_COUNT = 10  # このレコード数ごとにfsyncする
+SYNC_INTERVAL = 5  # 前回のfsyncからこの秒数が経っていたらfsyncする
+
+HEADER_KEY = "header"
+
+
+# ジャーナルを開く。(ジャーナル, 記録済みのレコードのdict(key=id)) を返す
+# reuseを指定すると、ヘッダが一致しない場合に reuse(記録済みのヘッダ, レコードのlist) が返したレコードを引き継ぐ
+def openJournal(journal_file, header, reuse=None):
+    records = dict()
+    valid_length = 0
+
+    if os.path.exists(journal_file):
+        saved_header, saved_records, valid_length = readJournal(journal_file)
+        if saved_header == header:
+            for record in saved_records:
+                records[record["id"]] = record
+        else:  # 分割結果が変わっていたら最初から
+            if saved_header is not None and reuse is not None:
+                for record in reuse(saved_header, saved_records):
+                    records[record["id"]] = record
+            valid_length = 0
+
+    f = open(journal_file, "ab")
+    if f.tell() != valid_length:  # 壊れたレコードや、古いジャーナルを切り捨てる
+        f.truncate(valid_length)
+        f.seek(valid_length)
+
+    journal = {
+        "file": f,
+        "unsynced": 0,  # fsyncしていないレコード数
+        "synced_time": time.time(),  # 最後にfsyncした時間
+    }
+
+    if valid_length == 0:
+        appendJournal(journal, {HEADER_KEY: header})
+        for record in records.values():  # 引き継いだレコードを書き直す
+            appendJournal(journal, record)
+        syncJournal(journal)
+
+    return journal, records
+
+
+# ジャーナル読み込み。(ヘッダ, レコードのlist, 正常に読めた部分のバイト数) を返す
+def readJournal(journal_file):
+    header = None
+    records = list()
+    valid_length = 0
+
+    with open(journal_file, "rb") as f:
+        for line in f:
+            record = decodeRecord(line)
+            if record is None:  # 壊れたレコード以降は読まない
+                break
+
+            if header is None:
+                if HEADER_KEY not in record:
+                    break
+                header = record[HEADER_KEY]
+            else:
+                records.append(record)
+
+            valid_length += len(line)
+
+    if header is None:
+        valid_length = 0
+
+    return header, records, valid_length
+
+
+# 1行分のバイト列をレコードに変換（壊れていたらNone）
+def decodeRecord(line):
+    if not line.endswith(b"\n"):  # 書き込み途中で落ちた
+        return None
+
+    try:
+        crc, body = line[:-1].split(b"\t", 1)
+        if int(crc, 16) != zlib.crc32(body):
+            return None
+        return json.loads(body.decode("utf-8"))
+    except ValueError:
+        return None
+
+
+# レコード追記
+def appendJournal(journal, record):
+    body = json.dumps(record, ensure_ascii=False).encode("utf-8")
+    journal["file"].write(b"%08x\t%s\n" % (zlib.crc32(body), body))
+
+    journal["unsynced"] += 1
+    if (
+        journal["unsynced"] >= SYNC_COUNT
+        or time.time() - journal["synced_time"] >= SYNC_INTERVAL
+    ):
+        syncJournal(journal)
+
+
+# ディスクに書き込む
+def syncJournal(journal):
+    journal["file"].flush()
+    os.fsync(journal["file"].fileno())
+    journal["unsynced"] = 0
+    journal["synced_time"] = time.time()
+
+
+# ジャーナルを閉じる
+def closeJournal(journal):
+    if journal["file"].closed:
+        return
+    syncJournal(journal)
+    journal["file"].close()
@@ -17,9 +17,12 @@ logger = common.getLogger(__file__)
 CONFIG_WORK_KEY = "merge"
 
 
-def main(input_files, arg_files):
+def main(input_files, arg_files, settings=None):
     logger.info("5. 結果マージ開始")
 
+    if settings is None:  # 呼び出し元から渡されなかったら共通の設定を使う
+        settings = common.getSettings()
+
     personalData = {}  # 話者情報
     basedir = os.path.dirname(arg_files[0])  # 出力先のディレクトリ（＝入力音声ファイルの置いてあるディレクトリ）
 
@@ -58,8 +61,7 @@ def main(input_files, arg_files):
     if len(arg_files) == 1:  # 1つのファイルを元に解析されていた場合は、そのファイルをそのまま使う
         mixed_mediafile = arg_files[0]
         try:
-            ffprobe_result = common.getFileFormat(mixed_mediafile)
-            streams = json.loads(ffprobe_result)
+            streams = common.getFileFormat(mixed_mediafile)
             for stream_index, stream in enumerate(streams["streams"]):
                 if stream["codec_type"] == "video":  # 動画ファイルかどうかをチェック
                     mixed_media_ismovie = True
@@ -87,7 +89,7 @@ def main(input_files, arg_files):
         created_mixed_media = True
 
     # 認識結果ファイル(csv)を読み込んでマージする
-    whispermodelname = common.getWhisperModel()
+    whispermodelname = settings.whisper_model
 
     resultMap = dict()
     for input_file in input_files:
@@ -95,16 +97,32 @@ def main(input_files, arg_files):
 
         if True:  # Google音声認識は必ず使う
             recognize_result_file = common.getRecognizeResultFile(input_file)
-            count += mergeRecognizeResult(recognize_result_file, resultMap, "G")
+            count += mergeRecognizeResult(
+                input_file,
+                common.RECOGNIZE_ENGINE_GOOGLE,
+                recognize_result_file,
+                resultMap,
+                "G",
+            )
 
-        if len(common.getWitAiServerAccessToken()) > 0:  # wit.aiを使用した場合
+        if len(settings.wit_ai_server_access_token) > 0:  # wit.aiを使用した場合
             recognize_result_file = common.getRecognizeResultFileWitAI(input_file)
-            count += mergeRecognizeResult(recognize_result_file, resultMap, "W")
+            count += mergeRecognizeResult(
+                input_file,
+                common.RECOGNIZE_ENGINE_WITAI,
+                recognize_result_file,
+                resultMap,
+                "W",
+            )
 
         if whispermodelname != common.WHISPER_MODEL_NONE:  # Whisperを使用した場合
             recognize_result_file = common.getRecognizeResultFileWhisper(input_file)
             count += mergeRecognizeResult(
-                recognize_result_file, resultMap, whispermodelname[0]
+                input_file,
+                common.getRecognizeEngineWhisper(whispermodelname),
+                recognize_result_file,
+                resultMap,
+                whispermodelname[0],
             )  # tiny,base,small,medium,largeのいずれかの先頭1文字（小文字）
 
         # 発言がない人物は話者一覧から外す
@@ -245,52 +263,53 @@ def isInt(s):  # 整数値を表しているかどうかを判定
     else:
         return True
 
-# 認識結果ファイル(csv)を読み込んでマージする(行数を返す)
-def mergeRecognizeResult(recognize_result_file, resultMap, engine):
+# 認識結果ファイル(csv)を読み込んでマージする(行数を返す)。プロジェクトDBを使う場合はDBから読む
+def mergeRecognizeResult(input_file, recognize_engine, recognize_result_file, resultMap, engine):
     TEXT_INDEX = 5
     try:
         logger.debug("認識結果ファイル：{}".format(os.path.basename(recognize_result_file)))
         colcount = 0
-        with codecs.open(recognize_result_file, "r", "CP932", "ignore") as f:
-            rows = csv.reader(f)
-            colcount += 1
-
-            for row in rows:
-                audio_file = row[
-                    1
-                ]  # 2列目（音声ファイル名(分割したファイル）をキーにする。バージョンによって拡張子が異なるので拡張子以降は省略）
-                ppos = audio_file.rfind(".")
-                key = audio_file[0:ppos]
-                engineStr = engine * (len(row) - TEXT_INDEX)
-                
-                isFormatError = False
-                for rownum in [2,3,4]: # 3,4,5列目には数字が入っている。稀にファイル書き込みがおかしくて変な値が入っていることがある
-                    try:
-                        if isInt(row[rownum]) == False: 
-                            logger.info("フォーマットエラー(ValueError)：{} {}:{}".format(os.path.basename(recognize_result_file),colcount,rownum))
-                            isFormatError = True
-                    except IndexError:
-                        logger.info("フォーマットエラー(IndexError)：{} {}:{}".format(os.path.basename(recognize_result_file),colcount,rownum))
+        rows = csv.reader(
+            common.readRecognizeResult(input_file, recognize_engine, recognize_result_file)
+        )
+        colcount += 1
+
+        for row in rows:
+            audio_file = row[
+                1
+            ]  # 2列目（音声ファイル名(分割したファイル）をキーにする。バージョンによって拡張子が異なるので拡張子以降は省略）
+            ppos = audio_file.rfind(".")
+            key = audio_file[0:ppos]
+            engineStr = engine * (len(row) - TEXT_INDEX)
+            
+            isFormatError = False
+            for rownum in [2,3,4]: # 3,4,5列目には数字が入っている。稀にファイル書き込みがおかしくて変な値が入っていることがある
+                try:
+                    if isInt(row[rownum]) == False: 
+                        logger.info("フォーマットエラー(ValueError)：{} {}:{}".format(os.path.basename(recognize_result_file),colcount,rownum))
                         isFormatError = True
-                        continue
+                except IndexError:
+                    logger.info("フォーマットエラー(IndexError)：{} {}:{}".format(os.path.basename(recognize_result_file),colcount,rownum))
+                    isFormatError = True
+                    continue
 
+            
+            if isFormatError:
+                continue
                 
-                if isFormatError:
+            if key in resultMap.keys():
+                if len(row[TEXT_INDEX]) <= 0:
                     continue
-                    
-                if key in resultMap.keys():
-                    if len(row[TEXT_INDEX]) <= 0:
-                        continue
-                    del row[0:TEXT_INDEX]  # 認識結果は6列目以降にある。認識結果以外の要素を削除
-
-                    dst_result = resultMap[key]
-                    dst_result[TEXT_INDEX:TEXT_INDEX] = row  # 認識結果を混ぜる
-                    dst_result[4] = engineStr + dst_result[4]
-                else:
-                    row[4] = engineStr
-                    resultMap[key] = row
-
-            return rows.line_num
+                del row[0:TEXT_INDEX]  # 認識結果は6列目以降にある。認識結果以外の要素を削除
+
+                dst_result = resultMap[key]
+                dst_result[TEXT_INDEX:TEXT_INDEX] = row  # 認識結果を混ぜる
+                dst_result[4] = engineStr + dst_result[4]
+            else:
+                row[4] = engineStr
+                resultMap[key] = row
+
+        return rows.line_num
 
     except FileNotFoundError:
         logger.info(
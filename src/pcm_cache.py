@@ -0,0 +1,197 @@
+import os
+import json
+import struct
+import threading
+import common
+import ffmpegjob
+
+logger = common.getLogger(__file__)
+
+# 音声のデコード結果(PCM)のキャッシュ
+# 入力音声を1回だけデコードして 16kHz mono 16bit のwavファイルとしてプロジェクトフォルダに保存し、
+# 各処理はこのファイルをmemmapして、時刻で指定した範囲をNumPyのview（コピーなし）として取り出す。
+# 無音解析用にノイズフィルタ(anlmdn)をかけたもの、再生用に元のサンプリングレートのままのものも作れる。
+# キャッシュが有効かどうかは、入力ファイルの指紋とデコード条件を書いた _x_pcm.json で判断する。
+
+SAMPLE_RATE = 16000  # 音声認識・無音解析に使うサンプリングレート
+FULL_RATE = "full"  # 元のサンプリングレート・チャンネル数のままデコードしたもの
+
+lock = threading.Lock()
+file_locks = {}  # 同じファイルを複数スレッドで同時にデコードしないためのロック（key=キャッシュファイル）
+
+
+# デコード済みのwavファイルのパスを返す（なければデコードする）。filter_strengthが0より大きければanlmdnフィルタをかける
+def getPcmFile(input_file, filter_strength=0):
+    return decode(input_file, variantName(filter_strength), filterArgs(filter_strength))
+
+
+# 元のサンプリングレート・チャンネル数のままデコードしたwavファイルのパスを返す（再生用の音声を切り出す元）
+def getFullRatePcmFile(input_file):
+    return decode(input_file, FULL_RATE, [])
+
+
+# デコード済みの16kHz mono PCMをmemmapして返す（int16の1次元配列）
+def openPcm(input_file, filter_strength=0):
+    return openWav(getPcmFile(input_file, filter_strength))
+
+
+# 開始・終了時刻(ミリ秒)の範囲のサンプルをviewとして返す（コピーしない）
+def slicePcm(samples, start_time, end_time, sample_rate=SAMPLE_RATE):
+    start = max(0, int(start_time * sample_rate / 1000))
+    end = min(len(samples), int(end_time * sample_rate / 1000))
+    return samples[start:end]
+
+
+# キャッシュの種類の名前（ファイル名に使う）
+def variantName(filter_strength):
+    if filter_strength > 0:
+        return "16k_anlmdn{}".format(filter_strength)
+    return "16k"
+
+
+# デコード時にかけるフィルタ（-ar, -acの変換はフィルタの後にかかるので、元の処理と同じく元のサンプリングレートでフィルタをかける）
+def filterArgs(filter_strength):
+    args = ["-ac", "1", "-ar", str(SAMPLE_RATE)]
+    if filter_strength > 0:
+        args = ["-af", "anlmdn=s={}".format(filter_strength)] + args
+    return args
+
+
+# キャッシュファイルのパス
+def getCacheFile(input_file, variant):
+    base = common.getFileNameWithoutExtension(input_file)
+    basedir = os.path.dirname(input_file)  # 入力音声ファイルの置いてあるディレクトリ
+    outputdir = os.path.join(basedir, base)  # 各種ファイルの出力先ディレクトリ
+
+    return os.path.join(outputdir, "_{}_{}.wav".format(base, variant))
+
+
+# キャッシュの情報ファイルのパス（入力ファイルの指紋とデコード条件）
+def getInfoFile(input_file):
+    base = common.getFileNameWithoutExtension(input_file)
+    basedir = os.path.dirname(input_file)  # 入力音声ファイルの置いてあるディレクトリ
+    outputdir = os.path.join(basedir, base)  # 各種ファイルの出力先ディレクトリ
+
+    return os.path.join(outputdir, "_{}_pcm.json".format(base))
+
+
+# デコードしてキャッシュファイルのパスを返す（キャッシュが有効ならデコードしない）
+def decode(input_file, variant, args):
+    pcm_file = getCacheFile(input_file, variant)
+    fingerprint = common.inputFileHash(input_file)
+
+    with getFileLock(pcm_file):
+        info = readInfo(input_file)
+        if os.path.exists(pcm_file) and info.get(variant) == {"fingerprint": fingerprint, "args": args}:
+            return pcm_file
+
+        logger.info("音声デコード中… {} ({})".format(os.path.basename(input_file), variant))
+        os.makedirs(os.path.dirname(pcm_file), exist_ok=True)
+        result = ffmpegjob.run(
+            ["ffmpeg", "-i", input_file, "-vn"]
+            + args
+            + ["-acodec", "pcm_s16le", "-map_metadata", "-1", "-bitexact", "-f", "wav", "-y"],
+            output_file=pcm_file,
+        )
+        logger.info(
+            "音声デコード終了 {} ({}) 実時間:{:.1f}sec CPU時間:{}".format(
+                os.path.basename(input_file),
+                variant,
+                result["wall_time"],
+                "-" if result["cpu_time"] is None else "{:.1f}sec".format(result["cpu_time"]),
+            )
+        )
+
+        with lock:  # 情報ファイルは全種類で共有なので、読み直してから書く
+            info = readInfo(input_file)
+            info[variant] = {"fingerprint": fingerprint, "args": args}
+            writeInfo(input_file, info)
+
+    return pcm_file
+
+
+# デコードしたキャッシュファイルを全て消す
+def removePcmFiles(input_file):
+    with lock:
+        info = readInfo(input_file)
+        for variant in info.keys():
+            pcm_file = getCacheFile(input_file, variant)
+            if os.path.exists(pcm_file):
+                logger.debug("remove:{}".format(pcm_file))
+                os.remove(pcm_file)
+        writeInfo(input_file, {})
+
+
+# ファイルごとのロック取得
+def getFileLock(pcm_file):
+    with lock:
+        if pcm_file not in file_locks:
+            file_locks[pcm_file] = threading.Lock()
+        return file_locks[pcm_file]
+
+
+# 情報ファイル読み込み（なかったり壊れていたら空）
+def readInfo(input_file):
+    try:
+        with open(getInfoFile(input_file), "r", encoding="utf-8") as f:
+            info = json.load(f)
+            if isinstance(info, dict):
+                return info
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+# 情報ファイル書き込み（書き込み途中で落ちても壊れないように、テンポラリファイルからリネームする）
+def writeInfo(input_file, info):
+    info_file = getInfoFile(input_file)
+    tmp_file = "{}.{}.tmp".format(info_file, os.getpid())
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(info, f)
+    os.replace(tmp_file, info_file)
+
+
+# wavファイルをmemmapして返す（16bit PCMのみ。複数チャンネルなら(サンプル数, チャンネル数)の配列）
+def openWav(wav_file):
+    import numpy as np  # 起動時間を短くするため、使うときに初めてimportする
+
+    offset, size, channels, sample_rate = readWavHeader(wav_file)
+    samples = np.memmap(wav_file, dtype="<i2", mode="r", offset=offset, shape=(size // 2,))
+    if channels > 1:
+        samples = samples[: len(samples) // channels * channels].reshape(-1, channels)
+    return samples
+
+
+# wavファイルのヘッダを読んで (dataチャンクの位置, dataチャンクの大きさ, チャンネル数, サンプリングレート) を返す
+def readWavHeader(wav_file):
+    channels = None
+    sample_rate = None
+    file_size = os.path.getsize(wav_file)
+
+    with open(wav_file, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff not in (b"RIFF", b"RF64") or wave != b"WAVE":  # RF64は4GBを超えるwav(dataチャンクの大きさは0xFFFFFFFF)
+            raise RuntimeError("wavファイルではありません:{}".format(wav_file))
+
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise RuntimeError("wavファイルにdataチャンクがありません:{}".format(wav_file))
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+
+            if chunk_id == b"fmt ":
+                fmt = f.read(chunk_size)
+                format_tag, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", fmt[:16])
+                if bits != 16:
+                    raise RuntimeError("16bit PCMではありません:{}".format(wav_file))
+                f.seek(chunk_size % 2, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                offset = f.tell()
+                size = min(chunk_size, file_size - offset)  # 書き込み中に落ちたなどでサイズがおかしい場合はファイルの最後まで
+                if chunk_size == 0xFFFFFFFF or file_size - offset > 0xFFFFFFFF:
+                    # 4GB(16kHz mono 16bitで約37時間)を超えるとヘッダにサイズが書けないので、ファイルの最後までをdataとみなす
+                    logger.warning("wavファイルのdataチャンクの大きさがヘッダに収まらないため、ファイルの最後までを読み込みます:{}".format(wav_file))
+                    size = file_size - offset
+                return offset, size, channels, sample_rate
+            else:
+                f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
@@ -0,0 +1,96 @@
+import os
+import json
+import subprocess
+import threading
+
+# メディアファイルの情報(ffprobeの結果)をキャッシュする。
+# ffprobeは1ファイルにつき1回だけ（streamsとformatを一度に取得）実行し、
+# 結果は入力ファイルの指紋(hash値)と一緒にプロジェクトフォルダ(_x_probe.json)に保存する。
+# 指紋が変わっていなければ、次回以降の実行でもffprobeは実行しない。
+
+lock = threading.Lock()  # キャッシュ(dict)操作用のロック
+file_locks = {}  # 同じファイルを複数スレッドで同時にffprobeしないためのロック（key=ファイルパス）
+memory_cache = {}  # プロセス内キャッシュ（key=ファイルパス）
+
+
+# ffprobeの結果(dict)を返す。fingerprintは入力ファイルの指紋（キャッシュが有効かどうかの確認に使う）
+def getProbe(input_file, fingerprint):
+    path = os.path.abspath(input_file)
+
+    with getFileLock(path):
+        with lock:
+            entry = memory_cache.get(path)
+        if entry is None:
+            entry = readCacheFile(getCacheFile(input_file))
+
+        if entry is not None and entry["fingerprint"] == fingerprint:
+            with lock:
+                memory_cache[path] = entry
+            return entry["probe"]
+
+        entry = {"fingerprint": fingerprint, "probe": runProbe(input_file)}
+        with lock:
+            memory_cache[path] = entry
+        writeCacheFile(getCacheFile(input_file), entry)
+
+        return entry["probe"]
+
+
+# キャッシュファイルのパス（各種ファイルの出力先ディレクトリに置く）
+def getCacheFile(input_file):
+    base = os.path.splitext(os.path.basename(input_file))[0]
+    basedir = os.path.dirname(input_file)  # 入力音声ファイルの置いてあるディレクトリ
+    outputdir = os.path.join(basedir, base)  # 各種ファイルの出力先ディレクトリ
+
+    return os.path.join(outputdir, "_{}_probe.json".format(base))
+
+
+# ffprobe実行（失敗したら標準エラー出力の内容で例外を投げる）
+def runProbe(input_file):
+    args = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-show_streams",
+        "-show_format",
+        "-print_format",
+        "json",
+        input_file,
+    ]
+    res = subprocess.run(args, encoding="utf-8", capture_output=True, text=True)
+    if res.returncode != 0:
+        raise RuntimeError(res.stderr)
+
+    return json.loads(res.stdout)
+
+
+# ファイルごとのロック取得
+def getFileLock(path):
+    with lock:
+        if path not in file_locks:
+            file_locks[path] = threading.Lock()
+        return file_locks[path]
+
+
+# キャッシュファイル読み込み（なかったり壊れていたらNone）
+def readCacheFile(cache_file):
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+            if isinstance(entry, dict) and "fingerprint" in entry and "probe" in entry:
+                return entry
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+# キャッシュファイル書き込み（書き込み途中で落ちても壊れないように、テンポラリファイルからリネームする）
+def writeCacheFile(cache_file, entry):
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass  # キャッシュが書けなくても処理は続けられる
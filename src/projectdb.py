@@ -0,0 +1,237 @@
+import os
+import sqlite3
+import threading
+
+# プロジェクトDB（SQLite）
+# 音声ファイルごとの出力先フォルダ（分割結果ファイルなどと同じフォルダ）に1つ作り、トラック（音声ファイル名）ごとに
+# 無音解析結果・分割結果・認識結果・進捗状況を保持する。
+# テキストファイル(_x.txt, _x_split.txt, _x.csv など)はこれまで通り出力する（エクスポート扱い）。
+
+DB_FILE_NAME = "_disnote.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    track TEXT NOT NULL,
+    file_index INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    PRIMARY KEY (track, file_index, seq)
+);
+CREATE TABLE IF NOT EXISTS split_plan (
+    track TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    length REAL NOT NULL,
+    org_start_time REAL NOT NULL,
+    org_end_time REAL NOT NULL,
+    PRIMARY KEY (track, id)
+);
+CREATE TABLE IF NOT EXISTS results (
+    track TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    line TEXT NOT NULL,
+    PRIMARY KEY (track, engine, id)
+);
+CREATE TABLE IF NOT EXISTS stage_state (
+    track TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (track, key)
+);
+"""
+
+local = threading.local()  # sqlite3の接続はスレッドごとに持つ
+lock = threading.Lock()
+opened_tracks = set()  # このプロセスで既に確認済みのトラック
+
+
+# DBファイルのpath
+def getDbFile(input_file):
+    base = os.path.splitext(os.path.basename(input_file))[0]
+    basedir = os.path.dirname(os.path.abspath(input_file))  # 入力音声ファイルの置いてあるディレクトリ
+    outputdir = os.path.join(basedir, base)  # 各種ファイルの出力先ディレクトリ
+
+    return os.path.join(outputdir, DB_FILE_NAME)
+
+
+# トラック名（DB内のキー）
+def getTrack(input_file):
+    return os.path.basename(input_file)
+
+
+# 接続を返す（スレッドごと、DBファイルごとに1つ）
+def connect(input_file):
+    db_file = getDbFile(input_file)
+
+    connections = getattr(local, "connections", None)
+    if connections is None:
+        connections = local.connections = dict()
+
+    conn = connections.get(db_file)
+    if conn is None:
+        os.makedirs(os.path.dirname(db_file), exist_ok=True)
+        conn = sqlite3.connect(db_file, timeout=60)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        connections[db_file] = conn
+
+    return conn
+
+
+# このスレッドの接続を全て閉じる（スレッドの処理が終わったら呼ぶ。次に使うときはまた接続する）
+def close():
+    connections = getattr(local, "connections", None)
+    if connections is None:
+        return
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
+
+
+# トラックを開く。音声のhash値が記録と違っていたらトラックのデータを消す。消した、あるいは空だったらTrueを返す（テキストファイルからの移行が必要）
+def openTrack(input_file, hash):
+    key = getDbFile(input_file) + "|" + getTrack(input_file)
+    with lock:
+        if key in opened_tracks:
+            return False
+        opened_tracks.add(key)
+
+    conn = connect(input_file)
+    track = getTrack(input_file)
+
+    row = conn.execute(
+        "SELECT value FROM stage_state WHERE track = ? AND key = 'hash'", (track,)
+    ).fetchone()
+    if row is not None and row[0] == hash:
+        return False
+
+    with conn:
+        for table in ["segments", "split_plan", "results", "stage_state"]:
+            conn.execute("DELETE FROM {} WHERE track = ?".format(table), (track,))
+        conn.execute(
+            "INSERT INTO stage_state (track, key, value) VALUES (?, 'hash', ?)",
+            (track, hash),
+        )
+    return True
+
+
+# 無音解析結果の書き込み(segmentationは(ラベル,開始秒,終了秒)のリスト)
+def writeSegments(input_file, file_index, segmentation):
+    conn = connect(input_file)
+    track = getTrack(input_file)
+    with conn:
+        conn.execute(
+            "DELETE FROM segments WHERE track = ? AND file_index = ?",
+            (track, file_index),
+        )
+        conn.executemany(
+            "INSERT INTO segments VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (track, file_index, seq, label, start, end)
+                for seq, (label, start, end) in enumerate(segmentation)
+            ],
+        )
+
+
+# from_index番目以降の無音解析結果の削除
+def deleteSegments(input_file, from_index):
+    conn = connect(input_file)
+    with conn:
+        conn.execute(
+            "DELETE FROM segments WHERE track = ? AND file_index >= ?",
+            (getTrack(input_file), from_index),
+        )
+
+
+# 無音解析結果の読み込み（その番号の結果がなければNone）
+def readSegments(input_file, file_index):
+    rows = (
+        connect(input_file)
+        .execute(
+            "SELECT label, start_time, end_time FROM segments WHERE track = ? AND file_index = ? ORDER BY seq",
+            (getTrack(input_file), file_index),
+        )
+        .fetchall()
+    )
+    if len(rows) == 0:
+        return None
+    return rows
+
+
+# 分割結果の書き込み(rowsはID,ファイル名,開始時間,終了時間,長さ,開始時間(冒頭無音なし),終了時間(末尾無音なし)のリスト)
+def writeSplitPlan(input_file, rows):
+    conn = connect(input_file)
+    track = getTrack(input_file)
+    with conn:
+        conn.execute("DELETE FROM split_plan WHERE track = ?", (track,))
+        conn.executemany(
+            "INSERT INTO split_plan VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(track,) + tuple(row) for row in rows],
+        )
+
+
+# 分割結果の読み込み
+def readSplitPlan(input_file):
+    return (
+        connect(input_file)
+        .execute(
+            "SELECT id, filename, start_time, end_time, length, org_start_time, org_end_time FROM split_plan WHERE track = ? ORDER BY id",
+            (getTrack(input_file),),
+        )
+        .fetchall()
+    )
+
+
+# 分割結果の件数
+def countSplitPlan(input_file):
+    return (
+        connect(input_file)
+        .execute("SELECT COUNT(*) FROM split_plan WHERE track = ?", (getTrack(input_file),))
+        .fetchone()[0]
+    )
+
+
+# 認識結果の書き込み(linesは(ID,認識結果ファイル(csv)の1行)のリスト)
+def writeResults(input_file, engine, lines):
+    conn = connect(input_file)
+    track = getTrack(input_file)
+    with conn:
+        conn.execute(
+            "DELETE FROM results WHERE track = ? AND engine = ?", (track, engine)
+        )
+        conn.executemany(
+            "INSERT INTO results VALUES (?, ?, ?, ?)",
+            [(track, engine, id, line) for id, line in lines],
+        )
+
+
+# 認識結果の読み込み（認識結果ファイル(csv)の行のリスト。なければNone）
+def readResults(input_file, engine):
+    rows = (
+        connect(input_file)
+        .execute(
+            "SELECT line FROM results WHERE track = ? AND engine = ? ORDER BY id",
+            (getTrack(input_file), engine),
+        )
+        .fetchall()
+    )
+    if len(rows) == 0:
+        return None
+    return [row[0] for row in rows]
+
+
+# 進捗状況の書き込み
+def writeStageState(input_file, state):
+    conn = connect(input_file)
+    track = getTrack(input_file)
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO stage_state VALUES (?, ?, ?)",
+            [(track, key, value) for key, value in state.items()],
+        )
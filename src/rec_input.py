@@ -0,0 +1,65 @@
+import io
+import wave
+import pcm_cache
+
+# 音声認識エンジンに渡す音声
+# 分割した音声ファイル(flac)を読み直さずに、デコード済みの音声(16kHz mono 16bit)から区間を切り出して、
+# エンジンごとの形式（Google:sr.AudioData、Whisper:float32のNumPy配列、wit.ai:wavのバイト列）で渡す。
+# 分割した音声ファイルは再生用のmp3への変換にだけ使う。
+
+SAMPLE_WIDTH = 2  # 16bit
+
+
+# 音声認識の対象の音声を開く（デコードしていなければデコードする）
+def openSource(input_file):
+    return pcm_cache.openPcm(input_file)
+
+
+# 開始・終了時刻(ミリ秒)の区間のサンプル（int16のview。コピーしない）
+def getSamples(source, start_time, end_time):
+    return pcm_cache.slicePcm(source, start_time, end_time)
+
+
+# 複数の区間(開始・終了時刻(ミリ秒)のlist)を、間に無音(gap ミリ秒)を挟んでつなげる
+# (サンプル, 区間ごとのつなげた音声の中での開始・終了時刻(秒)のlist) を返す
+def joinSamples(source, ranges, gap):
+    import numpy as np
+
+    silence = np.zeros(gap * pcm_cache.SAMPLE_RATE // 1000, dtype=np.int16)
+    pieces = []
+    bounds = []
+    position = 0
+    for start_time, end_time in ranges:
+        if len(pieces) > 0:
+            pieces.append(silence)
+            position += len(silence)
+        samples = getSamples(source, start_time, end_time)
+        pieces.append(samples)
+        bounds.append((position / pcm_cache.SAMPLE_RATE, (position + len(samples)) / pcm_cache.SAMPLE_RATE))
+        position += len(samples)
+    return np.concatenate(pieces), bounds
+
+
+# Google(speech_recognition)用
+def toAudioData(samples):
+    import speech_recognition as sr
+
+    return sr.AudioData(samples.tobytes(), pcm_cache.SAMPLE_RATE, SAMPLE_WIDTH)
+
+
+# Whisper用（whisper.load_audioと同じく、-1.0～1.0のfloat32にする）
+def toFloat32(samples):
+    import numpy as np
+
+    return samples.astype(np.float32) / 32768.0
+
+
+# wit.ai用（wavファイルの中身）
+def toWavBytes(samples):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(SAMPLE_WIDTH)
+        w.setframerate(pcm_cache.SAMPLE_RATE)
+        w.writeframes(samples.tobytes())
+    return buffer.getvalue()
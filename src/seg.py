@@ -1,152 +1,618 @@
 import os
 import sys
-from inaSpeechSegmenter import Segmenter
-from inaSpeechSegmenter.export_funcs import seg2csv, seg2textgrid
+import json
+import warnings
 import common
+import pcm_cache
+import ffmpegjob
+import segmenter
+import energy_vad
+import artifact_cache
 import time
-import torch
+import threading
+import concurrent.futures
+from collections import deque
 
 logger = common.getLogger(__file__)
 
 CONFIG_WORK_KEY = "seg"
 CONFIG_WORK_PROGRESS = "seg_progress"
 CONFIG_SEG_SPLIT = "seg_split"
+CONFIG_SEG_MODE = "seg_mode"  # 無音解析の方法（途中から再開するときに、同じ方法か確認する）
+CONFIG_SEG_DONE_CHUNKS = "seg_done_chunks"  # 無音解析が完了した区切りの番号（カンマ区切り。区切りは並列に解析するので、終わる順番は決まっていない）
+CONFIG_SEG_ENGINE = "seg_engine"  # 無音解析の方法（cnn:inaSpeechSegmenter、energy:音量だけで判定）
+CONFIG_SEG_STREAM_STATE = "seg_stream_state"  # ストリーミングで無音解析したときの途中状態（結果ファイルの確定済みの大きさ、未確定の区間）
 
+SEG_MODE_CHUNK = "chunk"  # 一定時間ごとに区切って、区切りごとに結果ファイルを出す
+SEG_MODE_STREAM = "stream"  # ffmpegから音声を受け取りながら、少しずつ無音解析して1つの結果ファイルに出す
 
-def main(input_file):
+STREAM_WINDOW = 5 * 60 * 1000  # ストリーミングで一度に確定させる長さ（ミリ秒）
+STREAM_OVERLAP = 10 * 1000  # 区切りの前後に余分に解析する長さ（ミリ秒。区切りの部分で区間が切れないようにする）
+STREAM_MIN_FEATS = 68  # inaSpeechSegmenterが解析できる最小の特徴量フレーム数（これより短い場合は埋める）
+
+SEG_RESULT_HEADER = "labels\tstart\tstop\n"  # 無音解析結果ファイルのヘッダ（inaSpeechSegmenterのseg2csvと同じ）
+
+
+def main(input_file, settings=None):
     logger.info("1. 無音解析開始 - {}".format(os.path.basename(input_file)))
-    logger.info("Cuda.available:{}".format(torch.cuda.is_available()))
     func_in_time = time.time()
 
-    config = common.readConfig(input_file)
-    if config["DEFAULT"].get(CONFIG_WORK_KEY) == common.DONE:
+    if settings is None:  # 呼び出し元から渡されなかったら共通の設定を使う
+        settings = common.getSettings()
+
+    if isDone(input_file, settings):
         logger.info("完了済みのためスキップ(無音解析)")
         return
+    config = common.readConfig(input_file)
 
-    progress = config["DEFAULT"].getint(CONFIG_WORK_PROGRESS, 0)
+    # 入力の音声ファイルのパスを引数で指定
+    logger.info("音声ファイル：{}".format(os.path.basename(input_file)))
+
+    # 音声の長さを取得(ffprobeの結果はキャッシュされている)
+    logger.info("音声ファイル読み込み中…")
+    duration = common.getDuration(input_file)  # 再生時間(ミリ秒)
+    logger.info("無音解析処理中… (duration:{}sec)".format(int(duration / 1000)))
+
+    # ノイズフィルタの設定
+    filter_strength = settings.seg_filter_strength  # 0より大きければanlmdnフィルタをかける
+    logger.info(
+        "ノイズフィルタ：{}".format("なし" if filter_strength <= 0 else "anlmdn=s={}".format(filter_strength))
+    )
+
+    engine = getEngine(settings)
+    logger.info("無音解析の方法：{}".format(engine))
+
+    # 同じ音声を同じ条件で解析したことがあれば、キャッシュから結果を書き出して終わる
+    cache_params = getCacheParams(input_file, settings, engine)
+    if restoreFromCache(input_file, cache_params, settings):
+        markDone(input_file, engine, cache_params)
+        logger.info("無音解析終了！(キャッシュ) {}".format(os.path.basename(input_file)))
+        return
+
+    stats = segmenter.getStats()  # このファイルの無音解析にかかった時間を出すため
+    if engine == common.SEG_ENGINE_ENERGY:  # 音量だけで判定する（モデルは使わない）
+        finished = segmentStream(input_file, settings, config, duration, engine, energy_vad.segment)
+    else:
+        # inaSpeechSegmenter(TensorFlow), torchは重いので、実際に無音解析するときに初めてimportする
+        import torch
+
+        logger.info("Cuda.available:{}".format(torch.cuda.is_available()))
+
+        if settings.is_seg_streaming and isStreamingSupported():
+            segment_func = segmentSamplesGated if settings.is_seg_silence_gate else segmentSamples
+            finished = segmentStream(input_file, settings, config, duration, engine, segment_func)
+        else:
+            finished = segmentChunks(input_file, settings, config, duration)
+
+    if not finished:  # 他のスレッドでエラーが起きた
+        return
+
+    markDone(input_file, engine, cache_params)
+    storeToCache(input_file, cache_params, settings)
+
+    func_out_time = time.time()
+    logStats(input_file, stats)
+    logger.info(
+        "無音解析終了！ {} ({:.2f}min)".format(
+            os.path.basename(input_file), (func_out_time - func_in_time) / 60
+        )
+    )
+
+
+# 終了したことを、入力の指紋(キャッシュのキーにする条件)と一緒にiniファイルに保存
+def markDone(input_file, engine, params):
+    common.markStageDone(
+        input_file,
+        CONFIG_WORK_KEY,
+        params,
+        {
+            CONFIG_SEG_ENGINE: engine,
+            CONFIG_WORK_PROGRESS: "",
+            CONFIG_SEG_DONE_CHUNKS: "",
+            CONFIG_SEG_STREAM_STATE: "",
+        },
+    )
+
+
+# キャッシュのキー・入力の指紋にする条件（入力音声の指紋と、結果が変わる設定・バージョン）
+def getCacheParams(input_file, settings, engine):
+    params = {
+        "fingerprint": common.inputFileHash(input_file),
+        "hash_mode": settings.input_file_hash_mode,
+        "engine": engine,
+        "filter_strength": settings.seg_filter_strength,
+        "window": [STREAM_WINDOW, STREAM_OVERLAP],
+    }
+    if engine == common.SEG_ENGINE_ENERGY:
+        params["version"] = "energy_vad {}".format(energy_vad.VERSION)
+    else:
+        params["version"] = "inaSpeechSegmenter {}".format(getSegmenterVersion())
+        params["streaming"] = settings.is_seg_streaming
+        params["silence_gate"] = settings.is_seg_silence_gate
+        params["split_len"] = settings.seg_tmp_audio_length
+    return params
+
+
+# inaSpeechSegmenterのバージョン（importすると重いので、パッケージの情報から取る）
+def getSegmenterVersion():
+    import importlib.metadata
+
+    try:
+        return importlib.metadata.version("inaSpeechSegmenter")
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+
+# キャッシュに結果があれば、結果ファイルに書き出してTrueを返す
+def restoreFromCache(input_file, params, settings):
+    data = artifact_cache.get(CONFIG_WORK_KEY, params, settings)
+    if data is None:
+        return False
+
+    for index, rows in enumerate(data["files"]):
+        segmentation = [tuple(row) for row in rows]
+        writeSegResultFile(common.getSegResultFile(input_file, index), segmentation)
+        common.storeSegResult(input_file, index, segmentation)
+    common.removeSegResultFiles(input_file, len(data["files"]))
+
+    common.updateConfig(
+        input_file, {CONFIG_SEG_SPLIT: str(data["seg_split"]), CONFIG_SEG_MODE: data["mode"]}
+    )
+    return True
+
+
+# 結果をキャッシュに保存する
+def storeToCache(input_file, params, settings):
+    if not artifact_cache.isEnabled(settings):
+        return
+
+    files = []
+    while True:
+        segmentation = common.readSegResult(input_file, len(files))
+        if segmentation is None:
+            break
+        files.append([list(segment) for segment in segmentation])
+
+    config = common.readConfig(input_file)
+    data = {
+        "seg_split": config["DEFAULT"].getint(CONFIG_SEG_SPLIT),
+        "mode": config["DEFAULT"].get(CONFIG_SEG_MODE, SEG_MODE_CHUNK),
+        "files": files,
+    }
+    artifact_cache.put(CONFIG_WORK_KEY, params, data, settings)
 
+
+# 無音解析の方法（autoなら、ノイズ部分も認識対象にする場合は無音かどうかだけ分かればよいので音量だけで判定する）
+def getEngine(settings):
+    if settings.seg_engine == common.SEG_ENGINE_AUTO:
+        if settings.is_recognize_noize:
+            return common.SEG_ENGINE_ENERGY
+        return common.SEG_ENGINE_CNN
+    return settings.seg_engine
+
+
+# 無音解析が完了済みで、前回と入力音声・設定が変わっていないかどうか
+def isDone(input_file, settings=None):
+    if settings is None:  # 呼び出し元から渡されなかったら共通の設定を使う
+        settings = common.getSettings()
+
+    engine = getEngine(settings)
+    done_engine = common.readConfig(input_file)["DEFAULT"].get(CONFIG_SEG_ENGINE, common.SEG_ENGINE_CNN)
+    if done_engine != engine:
+        # autoで音量だけで判定する場合(ノイズ部分も認識対象にする)でも、CNNで解析済みならその結果を使う（無音区間は分かっている）
+        if not (
+            engine == common.SEG_ENGINE_ENERGY
+            and settings.seg_engine == common.SEG_ENGINE_AUTO
+            and done_engine == common.SEG_ENGINE_CNN
+        ):
+            return False
+        engine = done_engine
+
+    return common.isStageDone(input_file, CONFIG_WORK_KEY, lambda: getCacheParams(input_file, settings, engine))
+
+
+# 一定時間ごとに区切って無音解析する（区切りごとに結果ファイルを出す。区切りはワーカーで並列に解析する）。最後まで終わったらTrueを返す
+def segmentChunks(input_file, settings, config, duration):
+    split_len = settings.seg_tmp_audio_length
+    chunk_count = max(1, -(-int(duration) // split_len))  # 区切りの数（切り上げ）
+    done_chunks = set()  # 完了済みの区切りの番号
+
+    progress = config["DEFAULT"].getint(CONFIG_WORK_PROGRESS, 0)
     if progress > 0:
         prev_split_len = config["DEFAULT"].getint(CONFIG_SEG_SPLIT)  # ミリ秒で管理する
-        if prev_split_len != common.getSegTmpAudioLength():
+        if config["DEFAULT"].get(CONFIG_SEG_MODE, SEG_MODE_CHUNK) != SEG_MODE_CHUNK:
+            logger.info("無音解析途中のデータがあったが、解析方法が異なるため最初から")
+        elif prev_split_len != split_len:
             logger.info(
                 "無音解析途中のデータがあったが、分割単位が異なるため最初({},{},{})".format(
-                    progress, prev_split_len, common.getSegTmpAudioLength()
+                    progress, prev_split_len, split_len
                 )
-            )
-            progress = 0  # 区切り単位が異なっていたら最初からやりなおし
+            )  # 区切り単位が異なっていたら最初からやりなおし
         else:
-            logger.info("無音解析途中のデータがあったため再開({})".format(progress))
+            done = config["DEFAULT"].get(CONFIG_SEG_DONE_CHUNKS)
+            if done is None:  # 以前のバージョンは先頭から順に解析していたので、完了した数だけ記録している
+                done_chunks = set(range(progress))
+            else:
+                done_chunks = set(int(i) for i in done.split(",") if len(i) > 0)
+            done_chunks = set(
+                i for i in done_chunks if os.path.exists(common.getSegResultFile(input_file, i))
+            )
+            logger.info("無音解析途中のデータがあったため再開({}/{})".format(len(done_chunks), chunk_count))
 
-    # 音声ファイルを無音で分割して秒数とかを出力
+    logger.info("分割単位：{}min".format(int(split_len / 60 / 1000)))
 
-    # 入力の音声ファイルのパスを引数で指定
-    logger.info("音声ファイル：{}".format(os.path.basename(input_file)))
+    # 音声全体を1回だけデコード(フィルタもかける)して、区間ごとにそこから読む
+    filter_start_time = time.time()
+    pcm_file = pcm_cache.getPcmFile(input_file, settings.seg_filter_strength)
+    filter_end_time = time.time()
+    logger.debug("　デコード・フィルタ処理 {:.2f}min".format((filter_end_time - filter_start_time) / 60))
 
-    # 音声の長さを取得(ffprobe実行)
-    logger.info("音声ファイル読み込み中…")
-    res = common.runSubprocess(
-        'ffprobe -v error -show_entries format=duration -of default=noprint_wrappers=1:nokey=1 "{}"'.format(
-            input_file
-        )
-    )
-    duration = float(res.stdout.strip()) * 1000  # 再生時間(ミリ秒)
-    logger.info("無音解析処理中… (duration:{}sec)".format(int(duration / 1000)))
+    # 完了していない区切りを全てワーカーに渡す
+    futures = {}
+    for index in range(chunk_count):
+        if index not in done_chunks:
+            future = segmenter.submit(
+                segmentChunk, input_file, pcm_file, index, split_len, duration, settings.is_seg_silence_gate
+            )
+            futures[future] = index
 
-    # 一定時間ごとに分割
-    index = progress
-    split_len = common.getSegTmpAudioLength()
-    start_time = split_len * index
-    tmp_audio_file = "log/tmp.flac"  # 一時ファイル（面倒なので消さない）
+    base = os.path.splitext(os.path.basename(input_file))[0]  # 拡張子なしのファイル名（話者）
+    try:
+        # 終わった順に完了を記録する（途中で止まっても、終わった区切りはやり直さない）
+        for future in concurrent.futures.as_completed(futures):
+            index = futures[future]
+            future.result()
+            done_chunks.add(index)
 
-    logger.info("分割単位：{}min".format(int(split_len / 60 / 1000)))
+            logger.info("　無音解析処理中… {} {}/{}".format(base, len(done_chunks), chunk_count))
+            common.logForGui(logger, "seg", input_file, progress=len(done_chunks), max=chunk_count)
+            common.updateConfig(
+                input_file,
+                {
+                    CONFIG_WORK_PROGRESS: str(len(done_chunks)),
+                    CONFIG_SEG_DONE_CHUNKS: ",".join(str(i) for i in sorted(done_chunks)),
+                    CONFIG_SEG_SPLIT: str(split_len),
+                    CONFIG_SEG_MODE: SEG_MODE_CHUNK,
+                },
+                flush=True,
+            )
 
-    base = os.path.splitext(os.path.basename(input_file))[0]  # 拡張子なしのファイル名（話者）
+            if common.isErrorOccurred():  # 他のスレッドでエラーが起きていたら強制終了する
+                return False
+    finally:
+        for future in futures:  # エラーで抜けた場合、まだ始まっていない区切りは解析しない
+            future.cancel()
 
-    # ノイズフィルタの設定
-    filter = ""
-    if common.getSegFilterStrength() > 0:  # anlmdnフィルタをかける
-        filter = "-af anlmdn=s={}".format(common.getSegFilterStrength())
+    common.removeSegResultFiles(input_file, chunk_count)  # 前回の解析で作った、今回より後ろの結果ファイルは消す
+    return True
 
-    logger.info("ノイズフィルタ：{}".format("なし" if len(filter) == 0 else filter))
 
-    while start_time < duration:
-        # 分析結果ファイル
-        seg_result_file = common.getSegResultFile(input_file, index)
-        logger.info("分析結果ファイル：{}".format(os.path.basename(seg_result_file)))
-        logger.info(
-            "　無音解析処理中… {} {}/{}".format(base, index + 1, int(duration / split_len) + 1)
-        )
-        common.logForGui(
-            logger,
-            "seg",
-            input_file,
-            progress=index,
-            max=int(duration / split_len),
+# 1つの区切りを無音解析して結果ファイルに出力する（ワーカーで呼ばれる）
+def segmentChunk(input_file, pcm_file, index, split_len, duration, gate):
+    from inaSpeechSegmenter.export_funcs import seg2csv
+
+    if common.isErrorOccurred():  # 他のスレッドでエラーが起きていたら何もしない
+        return
+
+    start_time = split_len * index
+    end_time = min(start_time + split_len, duration)
+    seg_result_file = common.getSegResultFile(input_file, index)
+    logger.info("分析結果ファイル：{}".format(os.path.basename(seg_result_file)))
+
+    # 区間検出実行（デコード済みの音声から範囲を指定して読む。結果は区間の先頭からの時刻にする）
+    if gate:  # 音がある範囲だけ解析する
+        samples = pcm_cache.slicePcm(pcm_cache.openWav(pcm_file), start_time, end_time)
+        result = segmentGated(
+            samples,
+            start_time / 1000,
+            lambda start, end: segmenter.segmentFile(
+                pcm_file,
+                start_sec=start_time / 1000 + start / pcm_cache.SAMPLE_RATE,
+                stop_sec=start_time / 1000 + end / pcm_cache.SAMPLE_RATE,
+            ),
         )
+    else:
+        result = segmenter.segmentFile(pcm_file, start_sec=start_time / 1000, stop_sec=end_time / 1000)
+    segmentation = [
+        (label, round(start - start_time / 1000, 6), round(end - start_time / 1000, 6))
+        for label, start, end in result
+    ]
 
-        end_time = min(start_time + split_len, duration)
+    # csv(という名のタブ)出力（書き込み途中で落ちても壊れないように、テンポラリファイルからリネームする）
+    tmp_file = "{}.{}.tmp".format(seg_result_file, threading.get_ident())
+    seg2csv(segmentation, tmp_file)
+    os.replace(tmp_file, seg_result_file)
+    common.storeSegResult(input_file, index, segmentation)
+    common.closeProjectDb()  # ワーカースレッドはトラックをまたいで使い回すので、DBの接続を残さない
 
-        # ffmpegで分割
-        filter_start_time = time.time()
-        res = common.runSubprocess(
-            'ffmpeg -ss {} -t {} -i "{}" {} -vn -acodec flac -y {}'.format(
-                start_time / 1000,
-                (end_time - start_time) / 1000,
-                input_file,
-                filter,
-                tmp_audio_file,
-            )
+
+# モデルの読み込み時間と解析(推論)時間を出す（beforeは開始時の segmenter.getStats()）
+def logStats(input_file, before):
+    after = segmenter.getStats()
+    logger.info(
+        "　無音解析時間 {} モデル読み込み:{:.1f}sec 推論:{:.1f}sec({}回)".format(
+            os.path.basename(input_file),
+            after["load_time"] - before["load_time"],
+            after["inference_time"] - before["inference_time"],
+            after["inference_count"] - before["inference_count"],
         )
-        filter_end_time = time.time()
-        logger.debug(
-            "　フィルタ処理 {:.2f}min".format((filter_end_time - filter_start_time) / 60)
+    )
+    audio_time = after["gate_audio_time"] - before["gate_audio_time"]
+    if audio_time > 0:
+        logger.info(
+            "　無音ゲート {} モデルで解析:{:.1f}sec/{:.1f}sec".format(
+                os.path.basename(input_file),
+                after["gate_analyzed_time"] - before["gate_analyzed_time"],
+                audio_time,
+            )
         )
 
-        # 区間検出実行
-        seg_start_time = time.time()
-        seg = Segmenter(vad_engine="smn", detect_gender=False)
-        segmentation = seg(tmp_audio_file)
-        seg_end_time = time.time()
 
-        # csv(という名のタブ)出力
-        seg2csv(segmentation, seg_result_file)
-        seg2sv_end_time = time.time()
+# ストリーミングで無音解析できるかどうか（特徴量を直接渡せるバージョンのinaSpeechSegmenterが必要）
+def isStreamingSupported():
+    try:
+        from inaSpeechSegmenter import Segmenter
+        from inaSpeechSegmenter.sidekit_mfcc import mfcc
+    except ImportError:
+        return False
+    return hasattr(Segmenter, "segment_feats")
+
+
+# ffmpegでデコードした音声をパイプで受け取りながら、一定の長さごとに前後に余分をつけて segment_func(samples, start_sec) で無音解析する。
+# 結果は1つの結果ファイル(_x.txt)に、確定したところから追記していく（区切りで区間が切れない。メモリ使用量は音声の長さによらない）。
+# 先の範囲はワーカーで並列に解析しておき、結果は先頭から順に確定させる。
+# 最後まで終わったらTrueを返す
+def segmentStream(input_file, settings, config, duration, engine, segment_func):
+    import numpy as np
+
+    sample_rate = pcm_cache.SAMPLE_RATE
+    window_samples = STREAM_WINDOW * sample_rate // 1000
+    overlap_samples = STREAM_OVERLAP * sample_rate // 1000
 
-        logger.debug(
-            "　無音解析処理 {:.2f}min+{:.2f}min".format(
-                (seg_end_time - seg_start_time) / 60,
-                (seg2sv_end_time - seg_end_time) / 60,
+    seg_result_file = common.getSegResultFile(input_file, 0)
+    logger.info("分析結果ファイル：{}".format(os.path.basename(seg_result_file)))
+    logger.info("解析単位：{}min（前後{}sec）".format(STREAM_WINDOW / 60 / 1000, STREAM_OVERLAP / 1000))
+
+    # 途中から再開するかどうか
+    position = 0  # 確定済みの位置（サンプル数）
+    pending = None  # 未確定の区間（次の解析範囲と繋がるかもしれない）[ラベル, 開始秒, 終了秒]
+    offset = None  # 結果ファイルの確定済みの大きさ
+    if (
+        config["DEFAULT"].get(CONFIG_SEG_MODE) == SEG_MODE_STREAM
+        and len(config["DEFAULT"].get(CONFIG_SEG_STREAM_STATE, "")) > 0
+        and os.path.exists(seg_result_file)
+    ):
+        state = json.loads(config["DEFAULT"].get(CONFIG_SEG_STREAM_STATE))
+    else:
+        state = None
+
+    if (
+        state is not None
+        and state.get("window") == STREAM_WINDOW
+        and state.get("overlap") == STREAM_OVERLAP
+        and state.get("engine", common.SEG_ENGINE_CNN) == engine
+        and state.get("gate", False) == (segment_func is segmentSamplesGated)
+    ):
+        position = int(config["DEFAULT"].getint(CONFIG_WORK_PROGRESS, 0) * sample_rate / 1000)
+        pending = state["pending"]
+        offset = state["offset"]
+        logger.info("無音解析途中のデータがあったため再開({}sec)".format(int(position / sample_rate)))
+    else:
+        common.removeSegResultFiles(input_file, 1)  # 区切りごとに出した前回の結果ファイルは消す
+
+    # 確定済みの位置の少し前からデコードする
+    read_start = max(0, position - overlap_samples)
+    args = ["ffmpeg", "-v", "error", "-ss", str(read_start / sample_rate), "-i", input_file, "-vn"]
+    args += pcm_cache.filterArgs(settings.seg_filter_strength)
+    args += ["-acodec", "pcm_s16le", "-f", "s16le", "-"]
+    logger.debug("ffmpeg process:{}".format(args))
+    proc = ffmpegjob.openPipe(args)
+
+    base = os.path.splitext(os.path.basename(input_file))[0]  # 拡張子なしのファイル名（話者）
+    buffer = np.zeros(0, dtype="<i2")
+    buffer_start = read_start  # bufferの先頭の位置（サンプル数）
+    eof = False
+    next_position = position  # 次に解析に出す位置（サンプル数）
+    inflight = deque()  # 解析中の範囲 (Future, 確定範囲の開始, 終了)
+    workers = segmenter.getMaxWorkers(settings)  # 同時に解析に出す数（メモリ使用量は 解析範囲の長さ×この数 まで）
+
+    try:
+        if offset is None:
+            f = open(seg_result_file, "w")
+            f.write(SEG_RESULT_HEADER)
+        else:  # 確定済みのところまで切り詰めて追記する
+            f = open(seg_result_file, "r+")
+            f.truncate(offset)
+            f.seek(offset)
+
+        with f:
+            while True:
+                # ワーカーが空いている分だけ先の範囲を読み込んで、解析に出しておく
+                while len(inflight) < workers:
+                    # 解析範囲の後ろの余分まで読み込む
+                    window_end = next_position + window_samples
+                    while not eof and buffer_start + len(buffer) < window_end + overlap_samples:
+                        data = proc.stdout.read((window_end + overlap_samples - buffer_start - len(buffer)) * 2)
+                        if len(data) == 0:
+                            eof = True
+                            break
+                        buffer = np.concatenate((buffer, np.frombuffer(data[: len(data) // 2 * 2], dtype="<i2")))
+
+                    buffer_end = buffer_start + len(buffer)
+                    if next_position >= buffer_end:  # 最後まで読み込んだ
+                        break
+                    window_end = min(window_end, buffer_end)
+
+                    # 前後に余分をつけて解析して、確定範囲だけを使う
+                    segment_from = max(buffer_start, next_position - overlap_samples)
+                    segment_to = min(buffer_end, window_end + overlap_samples)
+                    future = segmenter.submit(
+                        segment_func,
+                        buffer[segment_from - buffer_start : segment_to - buffer_start],
+                        segment_from / sample_rate,
+                    )
+                    inflight.append((future, next_position, window_end))
+                    next_position = window_end
+
+                    # 解析に出した部分は捨てる（次の解析範囲の前の余分だけ残す）
+                    drop = max(0, next_position - overlap_samples - buffer_start)
+                    buffer = buffer[drop:]
+                    buffer_start += drop
+
+                if len(inflight) == 0:  # 最後まで解析した
+                    break
+
+                # 先頭から順に結果を受け取って確定させる
+                future, window_start, window_end = inflight.popleft()
+                segmentation = future.result()
+
+                common.logForGui(
+                    logger,
+                    "seg",
+                    input_file,
+                    progress=int(window_end / window_samples),
+                    max=int(duration / STREAM_WINDOW),
+                )
+                logger.info(
+                    "　無音解析処理中… {} {}/{}sec".format(
+                        base, int(window_end / sample_rate), int(duration / 1000)
+                    )
+                )
+
+                for label, start, end in segmentation:
+                    start = max(start, window_start / sample_rate)
+                    end = min(end, window_end / sample_rate)
+                    if end <= start:
+                        continue
+
+                    if pending is not None and pending[0] == label and start - pending[2] < 1e-6:
+                        pending[2] = end  # 前の区間と同じラベルで繋がっていたら伸ばす
+                    else:
+                        if pending is not None:
+                            writeSegment(f, pending)
+                        pending = [label, start, end]
+
+                position = window_end
+
+                # ここまで完了した、と記録
+                f.flush()
+                common.updateConfig(
+                    input_file,
+                    {
+                        CONFIG_WORK_PROGRESS: str(int(position * 1000 / sample_rate)),
+                        CONFIG_SEG_SPLIT: str(int(duration) + 1),  # 結果ファイルは1つなので、音声全体を1つの区切りとして扱う
+                        CONFIG_SEG_MODE: SEG_MODE_STREAM,
+                        CONFIG_SEG_STREAM_STATE: json.dumps(
+                            {
+                                "window": STREAM_WINDOW,
+                                "overlap": STREAM_OVERLAP,
+                                "engine": engine,
+                                "gate": segment_func is segmentSamplesGated,
+                                "offset": f.tell(),
+                                "pending": pending,
+                            }
+                        ),
+                    },
+                    flush=True,
+                )
+
+                if common.isErrorOccurred():  # 他のスレッドでエラーが起きていたら強制終了する
+                    return False
+
+            if pending is not None:
+                writeSegment(f, pending)
+    finally:
+        for future, _, _ in inflight:  # エラーで抜けた場合、まだ始まっていない解析はしない
+            future.cancel()
+        returncode = ffmpegjob.closePipe(proc)
+
+    if returncode != 0:
+        raise RuntimeError("音声をデコードできませんでした：{}".format(input_file))
+
+    common.storeSegResult(input_file, 0, common.readSegResultFile(seg_result_file))
+    return True
+
+
+# PCM(16kHz mono)を無音解析する（inaSpeechSegmenterと同じ特徴量を作って渡す）。start_secは先頭の時刻
+def segmentSamples(samples, start_sec):
+    import numpy as np
+    from inaSpeechSegmenter.sidekit_mfcc import mfcc
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # 無音部分でlog(0)の警告が出る
+        _, loge, _, mspec = mfcc(samples.astype(np.float32), get_mspec=True)
+
+    difflen = 0
+    if len(loge) < STREAM_MIN_FEATS:  # 短すぎる場合は埋める（inaSpeechSegmenterと同じ処理）
+        difflen = STREAM_MIN_FEATS - len(loge)
+        mspec = np.concatenate((mspec, np.ones((difflen, mspec.shape[1])) * np.min(mspec)))
+
+    return segmenter.segmentFeats(mspec, loge, difflen, start_sec)
+
+
+# 音がある範囲だけを無音解析する（segmentSamplesと同じ）
+def segmentSamplesGated(samples, start_sec):
+    return segmentGated(
+        samples,
+        start_sec,
+        lambda start, end: segmentSamples(samples[start:end], start_sec + start / pcm_cache.SAMPLE_RATE),
+    )
+
+
+# 長いデジタル無音を除いた範囲だけを segment_range(開始サンプル, 終了サンプル) で解析し、除いた部分は無音(noEnergy)で埋める。
+# start_secはsamplesの先頭の時刻
+def segmentGated(samples, start_sec, segment_range):
+    sample_rate = pcm_cache.SAMPLE_RATE
+    segmentation = []
+    position = 0
+    analyzed = 0
+    for start, end in energy_vad.findSoundSpans(samples, sample_rate):
+        if position < start:
+            appendSegment(
+                segmentation,
+                (energy_vad.LABEL_NO_ENERGY, start_sec + position / sample_rate, start_sec + start / sample_rate),
             )
+        for segment in segment_range(start, end):
+            appendSegment(segmentation, segment)
+        analyzed += end - start
+        position = end
+
+    if position < len(samples):
+        appendSegment(
+            segmentation,
+            (energy_vad.LABEL_NO_ENERGY, start_sec + position / sample_rate, start_sec + len(samples) / sample_rate),
         )
 
-        start_time += split_len
-        index = index + 1
+    segmenter.addGateStats(len(samples) / sample_rate, analyzed / sample_rate)
+    return segmentation
 
-        # ここまで完了した、と記録
-        common.updateConfig(
-            input_file,
-            {CONFIG_WORK_PROGRESS: str(index), CONFIG_SEG_SPLIT: str(split_len)},
-        )
 
-        if common.isErrorOccurred():  # 他のスレッドでエラーが起きていたら強制終了する
+# 区間をリストに追加する（直前の区間との間に隙間があれば詰め、同じラベルなら伸ばす）
+def appendSegment(segmentation, segment):
+    label, start, end = segment
+    if len(segmentation) > 0:
+        prev_label, prev_start, prev_end = segmentation[-1]
+        if prev_end < start:  # 解析した範囲の最後は特徴量のフレーム単位で切り捨てられるので、隙間ができることがある
+            start = prev_end
+        if prev_label == label and abs(start - prev_end) < 1e-6:
+            segmentation[-1] = (label, prev_start, end)
             return
-    
-    # 終了したことをiniファイルに保存
-    common.updateConfig(
-        input_file,
-        {
-            CONFIG_WORK_KEY: common.DONE,
-            CONFIG_WORK_PROGRESS: "",
-            CONFIG_SEG_SPLIT: str(split_len),
-        },
-    )
+    segmentation.append((label, start, end))
 
-    func_out_time = time.time()
-    logger.info(
-        "無音解析終了！ {} ({:.2f}min)".format(
-            os.path.basename(input_file), (func_out_time - func_in_time) / 60
-        )
-    )
+
+# 無音解析結果ファイルを書き出す（書き込み途中で落ちても壊れないように、テンポラリファイルからリネームする）
+def writeSegResultFile(seg_result_file, segmentation):
+    tmp_file = "{}.{}.tmp".format(seg_result_file, threading.get_ident())
+    with open(tmp_file, "w") as f:
+        f.write(SEG_RESULT_HEADER)
+        for label, start, end in segmentation:
+            f.write("{}\t{}\t{}\n".format(label, start, end))
+    os.replace(tmp_file, seg_result_file)
+
+
+# 無音解析結果ファイルに1区間書き込む
+def writeSegment(f, segment):
+    f.write("{}\t{}\t{}\n".format(segment[0], round(segment[1], 3), round(segment[2], 3)))
 
 
 # 直接起動した場合
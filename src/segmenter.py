@@ -0,0 +1,180 @@
+import os
+import time
+import queue
+import shutil
+import tempfile
+import threading
+import concurrent.futures
+import common
+import cpu_budget
+
+logger = common.getLogger(__file__)
+
+# 無音解析のモデル(inaSpeechSegmenterのSegmenter)の置き場
+# モデルの読み込み(TensorFlow/Kerasの初期化を含む)は重いので、プロセスで読み込んだものを全ての区間・ファイルで使い回す。
+# 区間ごとの無音解析はワーカー(スレッド)で並列に実行でき、ワーカーごとにモデルを1つずつ持つ（同じモデルで同時に推論しない）。
+# TensorFlowは推論中にGILを解放するので、スレッドでも並列に動く。
+# トラック抜き出しなどの間に prewarm() でバックグラウンドで読み込んでおける。
+# 同時に推論するモデルの数は、CPUの割り当て(cpu_budget)に合わせて減らす（Whisperと同時に動かす場合）。
+# モデルの読み込み時間と解析(推論)時間は別々に集計する（無音ゲートでモデルを使わずに済んだ長さも集計する）。
+
+WORKER_MEMORY = 1024 * 1024 * 1024  # ワーカー1つあたりに見込むメモリ（モデル・TensorFlowの作業領域・解析中の音声）
+
+lock = threading.Lock()
+idle_models = queue.SimpleQueue()  # 読み込み済みで使っていないSegmenter
+model_count = 0  # 読み込み済み(読み込み中を含む)のSegmenterの数
+executor = None  # 無音解析のワーカー（初回のsubmitで作る）
+prewarm_thread = None
+stats = {
+    "load_time": 0.0,
+    "inference_time": 0.0,
+    "inference_count": 0,
+    "gate_audio_time": 0.0,  # 無音ゲートに通した音声の長さ（秒）
+    "gate_analyzed_time": 0.0,  # そのうちモデルで解析した長さ（秒）
+}
+
+
+# 同時に無音解析する数（seg_max_workers、0ならCPUのコア数の半分と空きメモリから決める）
+def getMaxWorkers(settings=None):
+    if settings is None:  # 呼び出し元から渡されなかったら共通の設定を使う
+        settings = common.getSettings()
+    if settings.seg_max_workers > 0:
+        return settings.seg_max_workers
+
+    workers = max(1, (os.cpu_count() or 1) // 2)  # TensorFlow自体も複数スレッドで計算するので、コア数の半分まで
+    memory = common.getAvailableMemory()
+    if memory is not None:
+        workers = min(workers, max(1, memory // WORKER_MEMORY))
+    return workers
+
+
+# ワーカーのThreadPoolExecutorを返す（なければ作る）
+def getExecutor():
+    global executor
+    with lock:
+        if executor is None:
+            max_workers = getMaxWorkers()
+            logger.info("無音解析の同時実行数：{}".format(max_workers))
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="seg")
+        return executor
+
+
+# 無音解析の処理をワーカーで実行してFutureを返す（funcの中で segmentFile, segmentFeats を呼ぶ）
+def submit(func, *args):
+    return getExecutor().submit(func, *args)
+
+
+# モデル1つが推論に使うスレッド数（割り当てるスレッドの合計を、同時実行数で分ける）
+def getModelThreads():
+    return max(1, cpu_budget.getTotalThreads() // getMaxWorkers())
+
+
+# Segmenterを1つ読み込んで返す
+def loadModel():
+    start = time.perf_counter()
+    from inaSpeechSegmenter import Segmenter  # TensorFlowは重いので、実際に使うときに初めてimportする
+    import tensorflow as tf
+
+    try:  # 推論のスレッド数を揃える（TensorFlowの初期化前にしか設定できないので、最初の1回だけ）
+        tf.config.threading.set_intra_op_parallelism_threads(getModelThreads())
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError:
+        pass
+
+    model = Segmenter(vad_engine="smn", detect_gender=False)
+    load_time = time.perf_counter() - start
+    with lock:
+        stats["load_time"] += load_time
+    logger.info("無音解析モデル読み込み完了 ({:.1f}sec)".format(load_time))
+    return model
+
+
+# 使っていないSegmenterを借りる（なければ、同時実行数まで読み込む。それ以上は返されるまで待つ）
+def acquire():
+    global model_count
+    try:
+        return idle_models.get_nowait()
+    except queue.Empty:
+        pass
+
+    with lock:
+        load = model_count < getMaxWorkers()
+        if load:
+            model_count += 1
+
+    if not load:
+        return idle_models.get()
+
+    try:
+        return loadModel()
+    except Exception:
+        with lock:
+            model_count -= 1
+        raise
+
+
+# 借りたSegmenterを返す
+def release(model):
+    idle_models.put(model)
+
+
+# バックグラウンドでSegmenterを1つ読み込んでおく（失敗しても、実際に使うときにもう一度読み込んでエラーにする）
+def prewarm():
+    global prewarm_thread
+    with lock:
+        if prewarm_thread is not None:
+            return
+        prewarm_thread = threading.Thread(target=prewarmWorker, name="segmenter_prewarm", daemon=True)
+    prewarm_thread.start()
+
+
+def prewarmWorker():
+    try:
+        release(acquire())
+    except Exception as e:
+        logger.debug("無音解析モデルの事前読み込みに失敗：{}".format(e))
+
+
+# 音声ファイルの範囲を無音解析する（Segmenter.__call__と同じ。作業用のファイルはワーカーごとのフォルダに作る）
+def segmentFile(media_file, start_sec=None, stop_sec=None):
+    tmpdir = tempfile.mkdtemp(prefix="_segtmp_", dir=os.path.dirname(os.path.abspath(media_file)))
+    try:
+        return measure(lambda model: model(media_file, tmpdir=tmpdir, start_sec=start_sec, stop_sec=stop_sec))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+# 特徴量から無音解析する（Segmenter.segment_featsと同じ）
+def segmentFeats(mspec, loge, difflen, start_sec):
+    return measure(lambda model: model.segment_feats(mspec, loge, difflen, start_sec))
+
+
+# Segmenterを借りて推論し、時間を集計する（CPUの割り当てを超える場合は、他の推論が終わるまで待つ）
+def measure(func):
+    model = acquire()
+    cpu_budget.acquire(cpu_budget.SEG, getModelThreads())
+    try:
+        start = time.perf_counter()
+        result = func(model)
+        inference_time = time.perf_counter() - start
+    finally:
+        cpu_budget.release(cpu_budget.SEG)
+        release(model)
+
+    with lock:
+        stats["inference_time"] += inference_time
+        stats["inference_count"] += 1
+    return result
+
+
+# 無音ゲートに通した音声の長さと、そのうちモデルで解析した長さを集計する
+def addGateStats(audio_time, analyzed_time):
+    with lock:
+        stats["gate_audio_time"] += audio_time
+        stats["gate_analyzed_time"] += analyzed_time
+
+
+# モデルの読み込み時間、推論時間・回数の合計を返す
+def getStats():
+    with lock:
+        return dict(stats)
@@ -1,48 +1,53 @@
-import speech_recognition as sr
 import os
 import sys
 from collections import deque
 import common
+import journal
+import rec_input
 import traceback
-import codecs
 import time
 
 logger = common.getLogger(__file__)
 
 CONFIG_WORK_KEY = "speech_rec"
-CONFIG_WORK_PROGRESS = "speech_rec_progress"
+JOURNAL_ENGINE = common.RECOGNIZE_ENGINE_GOOGLE  # 進捗ジャーナルのファイル名に使う
 CONFIG_WORK_CONV_READY = "speech_rec_conv_ready"
 
 
 # 音声ファイルの認識を行うかどうか。行わないなら理由（ログに出力する文字列）を返す。行うならNoneを返す。
-def reasonNotToRecognize(input_file):
-    config = common.readConfig(input_file)
-    if config["DEFAULT"].get(CONFIG_WORK_KEY) == common.DONE:
+def reasonNotToRecognize(input_file, settings=None):
+    if settings is None:  # 呼び出し元から渡されなかったら共通の設定を使う
+        settings = common.getSettings()
+    if common.isStageDone(input_file, CONFIG_WORK_KEY, lambda: getStageParams(input_file, settings)):
         return "完了済みのためスキップ(音声認識)"
 
     return None
 
 
+# 認識結果が変わる条件（進捗ジャーナルのヘッダに入れる）
+def getRecognizeParams(settings):
+    return {"language": settings.recognize_google_language}
+
+
+# 認識の入力（分割結果のhash値と認識の条件。変わっていたら認識し直す）
+def getStageParams(input_file, settings):
+    return common.getRecognizeJournalHeader(input_file, getRecognizeParams(settings))
+
+
 # 音声ファイルをtxtファイルに出力された結果に従って分割
-def main(input_file):
+def main(input_file, settings=None):
     logger.info("3. 音声認識開始(Google) - {}".format(os.path.basename(input_file)))
     func_in_time = time.time()
 
-    reason = reasonNotToRecognize(input_file)  # 認識せずにスキップするパターン
+    if settings is None:  # 呼び出し元から渡されなかったら共通の設定を使う
+        settings = common.getSettings()
+
+    reason = reasonNotToRecognize(input_file, settings)  # 認識せずにスキップするパターン
     if reason is not None:
         logger.info(reason)
         return
 
-    config = common.readConfig(input_file)
-
-    # 中断データ
-    progress = config["DEFAULT"].get(CONFIG_WORK_PROGRESS, "")
-
-    # 中断データがあった場合は続きから、そうでない場合は最初から
-    mode = "w"
-    if len(progress) > 0:
-        logger.info("認識途中のデータがあったため再開({})".format(progress))
-        mode = "a"
+    import speech_recognition as sr  # 実際に認識するときに初めてimportする
 
     # (元々の)入力の音声ファイルのパスを指定
     logger.info("音声ファイル：{}".format(os.path.basename(input_file)))
@@ -51,7 +56,6 @@ def main(input_file):
 
     # 音声認識
     r = sr.Recognizer()
-    num = 0
 
     split_result_file = common.getSplitResultFile(input_file)
     logger.info("分割結果ファイル：{}".format(os.path.basename(split_result_file)))
@@ -59,17 +63,19 @@ def main(input_file):
     recognize_result_file = common.getRecognizeResultFile(input_file)
     logger.info("認識結果ファイル：{}".format(os.path.basename(recognize_result_file)))
 
-    split_result_queue = deque()
+    split_results = common.readSplitResult(input_file)
+
+    split_result_queue = deque(split_results)
 
-    with codecs.open(split_result_file, "r", "CP932", "ignore") as f:
-        file_data = f.readlines()
-        for line in file_data:
-            split_result_queue.append(line.split("\t"))
+    # 認識済みのセグメントはジャーナルから復元する（中断データがあった場合は続きから）
+    rec_journal, records = common.openRecognizeJournal(input_file, JOURNAL_ENGINE, getRecognizeParams(settings))
+    if len(records) > 0:
+        logger.info("認識途中のデータがあったため再開({}件認識済み)".format(len(records)))
 
-    with codecs.open(recognize_result_file, mode, "CP932", "ignore") as f:
+    try:
         logger.info("音声認識中(Google)… {}".format(base))
 
-        language = common.getRecognizeGoogleLanguage()
+        language = settings.recognize_google_language
         logger.info("認識言語：{}".format(language))
 
         queuesize = len(split_result_queue)
@@ -78,13 +84,15 @@ def main(input_file):
         # 分割して出力する音声ファイルのフォルダとプレフィックスまで指定
         audio_file_prefix = common.getSplitAudioFilePrefix(input_file)
 
+        # 分割した音声ファイルではなく、デコード済みの音声から区間を切り出して認識する
+        source = rec_input.openSource(input_file)
+
         while len(split_result_queue) > 0:
             split_result = split_result_queue.popleft()  # ID,ファイル名,開始時間,終了時間の順
             id = int(split_result[0])
             tmp_audio_file = split_result[1]
             start_time = int(float(split_result[2]))
             end_time = int(float(split_result[3]))
-            length = int(float(split_result[4]))
 
             org_start_time = start_time
             org_end_time = end_time
@@ -95,22 +103,15 @@ def main(input_file):
             except IndexError:
                 pass
 
-            num += 1
-
             audio_file = "{}{}.mp3".format(audio_file_prefix, id)
 
-            if len(progress) > 0:  # 中断データまでスキップ
-                if audio_file == progress:
-                    progress = ""  # 追いついたので、次の行から続き
+            if id in records:  # 認識済み
                 continue
 
             logger.debug("recog_start")
 
             try:
-                with sr.AudioFile(tmp_audio_file) as source:
-                    audio = r.record(source)
-            except FileNotFoundError:
-                break
+                audio = rec_input.toAudioData(rec_input.getSamples(source, start_time, end_time))
             except:
                 logger.error(
                     traceback.format_exc()
@@ -158,37 +159,36 @@ def main(input_file):
                 logger.info("　音声認識中… {} {}/{}".format(base, id, queuesize))
                 common.logForGui(logger, "rec", input_file, progress=id, max=queuesize,info={"engine":"google"})
 
-            f.write(
-                "{},{},{},{},{},{}\n".format(
-                    base,
-                    audio_file,
-                    org_start_time,
-                    org_end_time - org_start_time,
-                    int(confidence * 100),
-                    text,
-                )
-            )
-            f.flush()
-
             # ここまで完了した、と記録
-            common.updateConfig(input_file, {CONFIG_WORK_PROGRESS: audio_file})
-            
+            records[id] = {
+                "id": id,
+                "base": base,
+                "audio_file": audio_file,
+                "start_time": start_time,
+                "end_time": end_time,
+                "org_start_time": org_start_time,
+                "org_end_time": org_end_time,
+                "confidence": int(confidence * 100),
+                "text": text,
+            }
+            journal.appendJournal(rec_journal, records[id])
+
             if common.isErrorOccurred():  # 他のスレッドでエラーが起きていたら強制終了する
                 return
+    finally:
+        journal.closeJournal(rec_journal)
 
-    if len(progress) > 0:  # 中断したまま終わってしまった
-        common.updateConfig(input_file, {CONFIG_WORK_PROGRESS: ""})
-        raise RuntimeError("音声認識再開失敗。再度実行してください。")
-        return
+    # 認識結果ファイル(csv)出力
+    common.writeRecognizeResultFile(
+        input_file, JOURNAL_ENGINE, recognize_result_file, split_results, records
+    )
 
     # 終了したことをiniファイルに保存
-    common.updateConfig(
+    common.markStageDone(
         input_file,
-        {
-            CONFIG_WORK_PROGRESS: "",
-            CONFIG_WORK_KEY: common.DONE,
-            CONFIG_WORK_CONV_READY: "1",  # 再生用に変換してもOK
-        },
+        CONFIG_WORK_KEY,
+        getStageParams(input_file, settings),
+        {CONFIG_WORK_CONV_READY: "1"},  # 再生用に変換してもOK
     )
 
     func_out_time = time.time()
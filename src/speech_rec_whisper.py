@@ -2,13 +2,15 @@ import os
 import sys
 from collections import deque
 import common
+import journal
+import rec_input
 import traceback
-import codecs
 import json
 import time
-import whisper
-import torch
 import shutil
+import whisper_binary
+import whisper_pool
+import cpu_budget
 
 
 class RequestError(Exception):
@@ -18,43 +20,81 @@ class RequestError(Exception):
 logger = common.getLogger(__file__)
 
 model = None
-CONFIG_WORK_KEY = "speech_rec_whisper_" + common.getWhisperModel()  # モデルごとに進捗を記録
-CONFIG_WORK_PROGRESS = (
-    "speech_rec_progress_whisper_" + common.getWhisperModel()
-)  # モデルごとに進捗を記録
+is_word_timestamps_supported = True  # whisperが単語のタイムスタンプ(word_timestamps)に対応しているか
+torch_threads = None  # 推論のスレッド数（ワーカープロセスで、メインのプロセスから渡された数。NoneならCPUの割り当てに合わせる）
+CONFIG_WORK_KEY_PREFIX = "speech_rec_whisper_"  # モデルごとに進捗を記録
 CONFIG_WORK_CONV_READY = "speech_rec_conv_ready_whisper"
 
+PACK_GAP = 1000  # まとめるときにセグメントの間に挟む無音の長さ（ミリ秒）
+
+BATCH_MAX_LENGTH = 30 * 1000  # バッチで推論できるセグメントの最長の長さ（ミリ秒。Whisperが一度に処理する長さ）
+BATCH_MAX_SIZE = 16  # 空きメモリから決める場合の、一度に推論するセグメントの最大数
+BATCH_ITEM_MEMORY = {  # バッチの1セグメントあたりに見込むメモリ（エンコーダ・デコーダの作業領域）
+    "tiny": 64 * 1024 * 1024,
+    "base": 96 * 1024 * 1024,
+    "small": 192 * 1024 * 1024,
+    "medium": 384 * 1024 * 1024,
+    "large": 640 * 1024 * 1024,
+}
+
+# 認識に失敗したとみなす条件（whisper.transcribeの初期値と同じ）
+COMPRESSION_RATIO_THRESHOLD = 2.4  # 同じ文字列の繰り返しになっている
+LOGPROB_THRESHOLD = -1.0  # 自信がない
+NO_SPEECH_THRESHOLD = 0.6  # 自信がなく、これより無音らしければ無音とする
+
+
+# 進捗を記録するキー（モデルごとに進捗を記録）
+def getConfigWorkKey(settings):
+    return CONFIG_WORK_KEY_PREFIX + settings.whisper_model
+
 
 # 音声ファイルの認識を行うかどうか。行わないなら理由（ログに出力する文字列）を返す。行うならNoneを返す。
-def reasonNotToRecognize(input_file):
-    modelname = common.getWhisperModel()
-    config = common.readConfig(input_file)
+def reasonNotToRecognize(input_file, settings=None):
+    if settings is None:  # 呼び出し元から渡されなかったら共通の設定を使う
+        settings = common.getSettings()
+    modelname = settings.whisper_model
 
     if modelname == common.WHISPER_MODEL_NONE:
         return "Whisperを使用しない設定のためスキップ"
 
-    if config["DEFAULT"].get(CONFIG_WORK_KEY) == common.DONE:
+    if common.isStageDone(input_file, getConfigWorkKey(settings), lambda: getStageParams(input_file, settings)):
         return "完了済みのためスキップ(音声認識)"
 
     return None
 
 
+# 認識結果が変わる条件（進捗ジャーナルのヘッダに入れる）
+def getRecognizeParams(settings):
+    return {
+        "model": settings.whisper_model,
+        "language": settings.whisper_language,
+        "pack_length": settings.whisper_pack_length,
+        "binary": settings.is_use_binary_whisper,
+        "binary_duration": settings.whisper_binary_duration if settings.is_use_binary_whisper else 0,
+    }
+
+
+# 認識の入力（分割結果のhash値と認識の条件。変わっていたら認識し直す）
+def getStageParams(input_file, settings):
+    return common.getRecognizeJournalHeader(input_file, getRecognizeParams(settings))
+
+
 # 音声ファイルをtxtファイルに出力された結果に従って分割
-def main(input_file):
+def main(input_file, settings=None):
     global model
 
     logger.info("3. 音声認識開始(whisper) - {}".format(os.path.basename(input_file)))
-    logger.info("Cuda.available:{}".format(torch.cuda.is_available()))
 
     func_in_time = time.time()
 
-    modelname = common.getWhisperModel()
-    language = common.getWhisperLanguage()
-    logger.info("whisperモデル：{}".format(modelname))
+    if settings is None:  # 呼び出し元から渡されなかったら共通の設定を使う
+        settings = common.getSettings()
 
-    config = common.readConfig(input_file)
+    modelname = settings.whisper_model
+    language = settings.whisper_language
+    logger.info("whisperモデル：{}".format(modelname))
 
-    if config["DEFAULT"].get(CONFIG_WORK_KEY) == common.DONE:
+    if common.isStageDone(input_file, getConfigWorkKey(settings), lambda: getStageParams(input_file, settings)):
         logger.info("完了済みのためスキップ(音声認識)")
         return
 
@@ -69,59 +109,42 @@ def main(input_file):
             )
         )
 
-    # whisperモデル読み込み（読み込みを1回にするためにglobalに保持）
-    if model is None:
-        # pyinstallerでバイナリを作った場合、whisperのassetsが存在しないためコピーする
-        if os.path.exists("whisper/assets"):  # assetsフォルダがある場合
-            assetsdir = os.path.join(os.path.dirname(whisper.__file__), "assets")
-            logger.debug("assetsdir:{}".format(assetsdir))
-            if os.path.exists(assetsdir):  # 通常であればここにassetsディレクトリがあるはず
-                logger.debug("whisperのディレクトリにassetsディレクトリあり")
-            else:
-                logger.info("assetsディレクトリをコピー")
-                shutil.copytree("whisper/assets", assetsdir)
-        else:
-            logger.debug("currentにassetsなし")
-
-        logger.info("whisperモデル読み込み開始：{}".format(modelname))
-        model = whisper.load_model(modelname)
-        logger.info("whisperモデル読み込み完了：{}".format(modelname))
-
-    if model is None:
-        logger.info("whisperのモデルが指定されていないためスキップ(音声認識)")
+    if settings.is_use_binary_whisper:  # バイナリ版(whisper.cpp)で認識する
+        mainBinary(input_file, settings, func_in_time)
         return
 
-    # 中断データ
-    progress = config["DEFAULT"].get(CONFIG_WORK_PROGRESS, "")
-
-    # 中断データがあった場合は続きから、そうでない場合は最初から
-    mode = "w"
-    if len(progress) > 0:
-        logger.info("認識途中のデータがあったため再開({})".format(progress))
-        mode = "a"
+    workers = whisper_pool.getWorkers(settings)
+    if workers > 1:  # 複数のワーカープロセスで認識する（モデルは各プロセスで読み込む）
+        logger.info("Whisperのプロセス数：{}".format(workers))
+    elif model is None:  # whisperモデル読み込み（読み込みを1回にするためにglobalに保持）
+        model = loadModel(modelname)
+        if model is None:
+            logger.info("whisperのモデルが指定されていないためスキップ(音声認識)")
+            return
 
     # (元々の)入力の音声ファイルのパスを指定
     logger.info("音声ファイル：{}".format(os.path.basename(input_file)))
 
     base = os.path.splitext(os.path.basename(input_file))[0]  # 拡張子なしのファイル名（話者）
 
-    # 音声認識
-    num = 0
-
     split_result_file = common.getSplitResultFile(input_file)
     logger.info("分割結果ファイル：{}".format(os.path.basename(split_result_file)))
 
     recognize_result_file = common.getRecognizeResultFileWhisper(input_file)
     logger.info("認識結果ファイル(whisper)：{}".format(os.path.basename(recognize_result_file)))
 
-    split_result_queue = deque()
+    split_results = common.readSplitResult(input_file)
 
-    with codecs.open(split_result_file, "r", "CP932", "ignore") as f:
-        file_data = f.readlines()
-        for line in file_data:
-            split_result_queue.append(line.split("\t"))
+    split_result_queue = deque(split_results)
 
-    with codecs.open(recognize_result_file, mode, "CP932", "ignore") as f:
+    # 認識済みのセグメントはジャーナルから復元する（中断データがあった場合は続きから）
+    rec_journal, records = common.openRecognizeJournal(
+        input_file, common.getRecognizeEngineWhisper(modelname), getRecognizeParams(settings)
+    )
+    if len(records) > 0:
+        logger.info("認識途中のデータがあったため再開({}件認識済み)".format(len(records)))
+
+    try:
         logger.info("音声認識中(whisper)… {}".format(base))
         queuesize = len(split_result_queue)
         common.logForGui(
@@ -135,91 +158,132 @@ def main(input_file):
 
         # 分割して出力する音声ファイルのフォルダとプレフィックスまで指定
         audio_file_prefix = common.getSplitAudioFilePrefix(input_file)
-        
-        while len(split_result_queue) > 0:
-            split_result = split_result_queue.popleft()  # ID,ファイル名,開始時間,終了時間の順
-            id = int(split_result[0])
-            tmp_audio_file = split_result[1]
-            start_time = int(float(split_result[2]))
-            end_time = int(float(split_result[3]))
-            length = int(float(split_result[4]))
-
-            org_start_time = start_time
-            org_end_time = end_time
-
-            try:
-                org_start_time = int(float(split_result[5]))
-                org_end_time = int(float(split_result[6]))
-            except IndexError:
-                pass
-
-            num += 1
-
-            audio_file = "{}{}.mp3".format(audio_file_prefix, id)
-
-            if len(progress) > 0:  # 中断データまでスキップ
-                if audio_file == progress:
-                    progress = ""  # 追いついたので、次の行から続き
-                continue
 
-            logger.debug("recog_start")
-            result = model.transcribe(
-                tmp_audio_file, language=language
-            )  # , verbose=True
-
-            text = '"' + result["text"] + '"'  # ダブルクォーテーションで囲む
-            confidence = 0
-
-            logger.debug(
-                "音声認識中(whisper)… {}, {},{},{}".format(
-                    base, id, int(confidence * 100), text
+        # 未認識のセグメントを、設定によっては短いものをまとめて認識する
+        pending = []
+        while len(split_result_queue) > 0:
+            segment = toSegment(split_result_queue.popleft(), audio_file_prefix)
+            if segment["id"] not in records:  # 認識済みでなければ
+                pending.append(segment)
+        units = packSegments(pending, settings.whisper_pack_length)
+        if settings.whisper_pack_length > 0:
+            logger.info("まとめて認識：{}セグメントを{}回で認識".format(len(pending), len(units)))
+
+        batch_size = getBatchSize(settings)
+        if workers > 1 and settings.whisper_batch_size == 0:  # 空きメモリから決めた場合は、プロセスで分け合う
+            batch_size = max(1, batch_size // workers)
+        logger.info("バッチで推論するセグメント数：{}".format(batch_size))
+
+        if workers > 1:  # 終わった順に結果が返ってくる（記録はidごとなので順番は問わない）
+            results = whisper_pool.recognizeUnits(input_file, units, settings, workers, batch_size)
+        else:
+            # 分割した音声ファイルではなく、デコード済みの音声から区間を切り出して認識する（whisperがffmpegでデコードし直さなくてよい）
+            source = rec_input.openSource(input_file)
+            results = recognizeUnits(source, units, language, batch_size)
+
+        for unit, texts in results:
+            for segment, text in zip(unit, texts):
+                id = segment["id"]
+                text = '"' + text + '"'  # ダブルクォーテーションで囲む
+                confidence = 0
+
+                logger.debug(
+                    "音声認識中(whisper)… {}, {},{},{}".format(
+                        base, id, int(confidence * 100), text
+                    )
                 )
-            )
-            if (id % 3) == 0 or (len(split_result_queue) == 0):  # 3行ごとか、最後の1行に進捗を出す
-                logger.info("　音声認識中(whisper)… {} {}/{}".format(base, id, queuesize))
+
+                # ここまで完了した、と記録
+                records[id] = {
+                    "id": id,
+                    "base": base,
+                    "audio_file": segment["audio_file"],
+                    "start_time": segment["start_time"],
+                    "end_time": segment["end_time"],
+                    "org_start_time": segment["org_start_time"],
+                    "org_end_time": segment["org_end_time"],
+                    "confidence": int(confidence * 100),
+                    "text": text,
+                }
+                journal.appendJournal(rec_journal, records[id])
+
+            progress = len(records)  # 認識した順番はidの順とは限らないので、認識済みの数を進捗にする
+            if len(unit) > 1 or (progress % 3) == 0 or progress == queuesize:  # まとめて認識したか、3行ごとか、最後の1行に進捗を出す
+                logger.info("　音声認識中(whisper)… {} {}/{}".format(base, progress, queuesize))
                 common.logForGui(
                     logger,
                     "rec",
                     input_file,
-                    progress=id,
+                    progress=progress,
                     max=queuesize,
                     info={"engine": "whisper"},
                 )
 
-            f.write(
-                "{},{},{},{},{},{}\n".format(
-                    base,
-                    audio_file,
-                    org_start_time,
-                    org_end_time - org_start_time,
-                    int(confidence * 100),
-                    text,
-                )
-            )
-            f.flush()
-
-            # ここまで完了した、と記録
-            common.updateConfig(
-                input_file,
-                {CONFIG_WORK_PROGRESS: audio_file},
-            )
-            
             if common.isErrorOccurred():  # 他のスレッドでエラーが起きていたら強制終了する
                 return
 
-    if len(progress) > 0:  # 中断したまま終わってしまった
-        common.updateConfig(input_file, {CONFIG_WORK_PROGRESS: ""})
-        raise RuntimeError("音声認識再開失敗。再度実行してください。")
+        if common.isErrorOccurred():  # ワーカープロセスの結果を待っている間にエラーが起きていた
+            return
+    finally:
+        journal.closeJournal(rec_journal)
+
+    finish(input_file, settings, split_results, records, func_in_time)
+
+
+# バイナリ版Whisperで認識する
+def mainBinary(input_file, settings, func_in_time):
+    reason = whisper_binary.reasonUnavailable(settings.whisper_model)
+    if reason is not None:
+        raise ValueError("{}：バイナリ版Whisperを使わない場合はDisNOTE.iniの{}を0にしてください".format(reason, common.IS_USE_BINARY_WHISPER))
+
+    logger.info("音声ファイル：{}".format(os.path.basename(input_file)))
+    logger.info("認識中間ファイル(whisper)：{}".format(os.path.basename(common.getSegmentFileWhisper(input_file))))
+
+    base = os.path.splitext(os.path.basename(input_file))[0]  # 拡張子なしのファイル名（話者）
+    split_results = common.readSplitResult(input_file)
+    audio_file_prefix = common.getSplitAudioFilePrefix(input_file)
+    segments = [toSegment(split_result, audio_file_prefix) for split_result in split_results]
+
+    logger.info("音声認識中(whisper binary)… {}".format(base))
+    fingerprint = common.getStageFingerprint(getStageParams(input_file, settings))
+    rows = whisper_binary.recognize(input_file, settings, fingerprint)
+    if rows is None:  # 他のスレッドでエラーが起きた
         return
 
-    # 終了したことをiniファイルに保存
-    common.updateConfig(
+    # 区間ごとの認識結果をセグメントに振り分ける
+    texts = whisper_binary.alignSegments(sorted(segments, key=lambda segment: segment["start_time"]), rows)
+    records = dict()
+    for segment in segments:
+        records[segment["id"]] = {
+            "id": segment["id"],
+            "base": base,
+            "audio_file": segment["audio_file"],
+            "start_time": segment["start_time"],
+            "end_time": segment["end_time"],
+            "org_start_time": segment["org_start_time"],
+            "org_end_time": segment["org_end_time"],
+            "confidence": 0,
+            "text": '"' + texts[segment["id"]] + '"',  # ダブルクォーテーションで囲む
+        }
+
+    finish(input_file, settings, split_results, records, func_in_time)
+
+
+# 認識結果ファイル(csv)を出力して、終了したことをiniファイルに保存
+def finish(input_file, settings, split_results, records, func_in_time):
+    common.writeRecognizeResultFile(
+        input_file,
+        common.getRecognizeEngineWhisper(settings.whisper_model),
+        common.getRecognizeResultFileWhisper(input_file),
+        split_results,
+        records,
+    )
+
+    common.markStageDone(
         input_file,
-        {
-            CONFIG_WORK_PROGRESS: "",
-            CONFIG_WORK_KEY: common.DONE,
-            CONFIG_WORK_CONV_READY: "1",  # 再生用に変換してもOK
-        },
+        getConfigWorkKey(settings),
+        getStageParams(input_file, settings),
+        {CONFIG_WORK_CONV_READY: "1"},  # 再生用に変換してもOK
     )
 
     func_out_time = time.time()
@@ -230,6 +294,209 @@ def main(input_file):
     )
 
 
+# 分割結果の1行を、認識するセグメントの情報(dict)にする
+def toSegment(split_result, audio_file_prefix):
+    id = int(split_result[0])  # ID,ファイル名,開始時間,終了時間,長さ,(開始時間,終了時間)の順
+    start_time = int(float(split_result[2]))
+    end_time = int(float(split_result[3]))
+
+    org_start_time = start_time
+    org_end_time = end_time
+
+    try:
+        org_start_time = int(float(split_result[5]))
+        org_end_time = int(float(split_result[6]))
+    except IndexError:
+        pass
+
+    return {
+        "id": id,
+        "audio_file": "{}{}.mp3".format(audio_file_prefix, id),
+        "start_time": start_time,
+        "end_time": end_time,
+        "org_start_time": org_start_time,
+        "org_end_time": org_end_time,
+    }
+
+
+# 続いているセグメントを、間に無音を挟んでpack_length(ミリ秒)以内にまとめる。まとめたセグメントのlistのlistを返す（0なら1つずつ）
+def packSegments(segments, pack_length):
+    units = []
+    unit_length = 0
+    for segment in segments:
+        length = segment["end_time"] - segment["start_time"]
+        if pack_length <= 0 or len(units) == 0 or unit_length + PACK_GAP + length > pack_length:
+            units.append([])
+            unit_length = -PACK_GAP
+        units[-1].append(segment)
+        unit_length += PACK_GAP + length
+    return units
+
+
+# まとめたセグメントを1回で認識して、セグメントごとのテキストを返す
+# Whisperは入力を30秒単位で処理するので、短いセグメントを1つずつ認識すると、毎回30秒分のエンコードをすることになる。
+# 間に無音を挟んでつなげた音声を認識し、単語(なければ区間)のタイムスタンプで、どのセグメントのテキストかを決める。
+def transcribeUnit(source, unit, language):
+    global is_word_timestamps_supported
+
+    if len(unit) == 1:
+        segment = unit[0]
+        samples = rec_input.getSamples(source, segment["start_time"], segment["end_time"])
+        return [model.transcribe(rec_input.toFloat32(samples), language=language)["text"]]
+
+    samples, bounds = rec_input.joinSamples(
+        source, [(segment["start_time"], segment["end_time"]) for segment in unit], PACK_GAP
+    )
+    audio = rec_input.toFloat32(samples)
+
+    result = None
+    if is_word_timestamps_supported:
+        try:
+            result = model.transcribe(
+                audio, language=language, condition_on_previous_text=False, word_timestamps=True
+            )
+        except TypeError:  # 単語のタイムスタンプに対応していないバージョン
+            logger.info("whisperが単語のタイムスタンプに対応していないため、区間のタイムスタンプで振り分けます")
+            is_word_timestamps_supported = False
+    if result is None:
+        result = model.transcribe(audio, language=language, condition_on_previous_text=False)
+
+    texts = [""] * len(unit)
+    for whisper_segment in result["segments"]:
+        for word in whisper_segment.get("words") or [whisper_segment]:
+            text = word["word"] if "word" in word else word["text"]
+            texts[findUnitIndex(bounds, (word["start"] + word["end"]) / 2)] += text
+    return [text.strip() for text in texts]
+
+
+# 一度に推論するセグメントの数（whisper_batch_size、0ならモデルの大きさと空きメモリから決める）
+def getBatchSize(settings):
+    if settings.whisper_batch_size > 0:
+        return settings.whisper_batch_size
+
+    memory = common.getAvailableMemory()
+    if memory is None:
+        return 1
+    item_memory = BATCH_ITEM_MEMORY.get(settings.whisper_model.split(".")[0].split("-")[0], BATCH_ITEM_MEMORY["large"])
+    return max(1, min(BATCH_MAX_SIZE, memory // 2 // item_memory))  # 空きメモリの半分まで
+
+
+# まとめたセグメント(packSegmentsの結果)を順に認識して、(セグメントのlist, テキストのlist) を返していく
+# 1つだけのセグメントは、batch_size個ずつまとめてバッチで推論する
+def recognizeUnits(source, units, language, batch_size):
+    for group in groupUnits(units, batch_size):
+        logger.debug("recog_start")
+        setTorchThreads()
+        if len(group) == 1:
+            yield group[0], transcribeUnit(source, group[0], language)
+        else:
+            batch = [unit[0] for unit in group]
+            yield batch, transcribeBatch(source, batch, language)
+
+
+# まとめたセグメントを、一度に推論する単位(まとめたセグメントのlist)に分ける
+# 1つだけの短いセグメントはbatch_size個ずつ1つにし、それ以外は1つずつにする
+def groupUnits(units, batch_size):
+    groups = []
+    batch = []
+    for unit in units:
+        if batch_size > 1 and len(unit) == 1 and unit[0]["end_time"] - unit[0]["start_time"] <= BATCH_MAX_LENGTH:
+            batch.append(unit)
+            if len(batch) >= batch_size:
+                groups.append(batch)
+                batch = []
+            continue
+
+        if len(batch) > 0:
+            groups.append(batch)
+            batch = []
+        groups.append([unit])
+
+    if len(batch) > 0:
+        groups.append(batch)
+    return groups
+
+
+# 推論のスレッド数をCPUの割り当てに合わせる（無音解析が終わって割り当てが増えたら増やす。ワーカープロセスでは渡された数にする）
+def setTorchThreads():
+    import torch
+
+    threads = torch_threads
+    if threads is None:
+        threads = cpu_budget.getThreads(cpu_budget.WHISPER)
+    if torch.get_num_threads() != threads:
+        logger.debug("whisperのスレッド数：{}".format(threads))
+        torch.set_num_threads(threads)
+
+
+# 30秒以内のセグメントをまとめてバッチで推論して、セグメントごとのテキストを返す
+# transcribeはセグメントを1つずつエンコード・デコードするので、バッチの大きさが1になりCPUの行列演算を活かせない。
+# メルスペクトログラムを並べてエンコーダにかけ、デコードもまとめて行う（終わった系列から止まる）。
+def transcribeBatch(source, segments, language):
+    if len(segments) == 1:
+        return transcribeUnit(source, segments, language)
+
+    import torch
+    import whisper
+
+    n_mels = getattr(model.dims, "n_mels", 80)
+    mels = []
+    for segment in segments:
+        samples = rec_input.getSamples(source, segment["start_time"], segment["end_time"])
+        audio = whisper.pad_or_trim(torch.from_numpy(rec_input.toFloat32(samples)))
+        if n_mels == 80:
+            mels.append(whisper.log_mel_spectrogram(audio))
+        else:  # large-v3など（古いwhisperはn_melsを指定できない）
+            mels.append(whisper.log_mel_spectrogram(audio, n_mels))
+
+    options = whisper.DecodingOptions(
+        language=language, without_timestamps=True, fp16=model.device.type == "cuda"
+    )
+    results = whisper.decode(model, torch.stack(mels).to(model.device), options)
+
+    texts = []
+    for segment, result in zip(segments, results):
+        if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:  # 無音
+            texts.append("")
+        elif result.compression_ratio > COMPRESSION_RATIO_THRESHOLD or result.avg_logprob < LOGPROB_THRESHOLD:
+            # 失敗していたら、温度を変えながらやり直すtranscribeで認識し直す
+            texts += transcribeUnit(source, [segment], language)
+        else:
+            texts.append(result.text)
+    return texts
+
+
+# まとめた音声の中の時刻(秒)が、どのセグメントのものか（間の無音なら近い方）
+def findUnitIndex(bounds, time):
+    return min(range(len(bounds)), key=lambda i: max(bounds[i][0] - time, time - bounds[i][1], 0))
+
+
+# whisperモデル読み込み（torch, whisperは重いので、実際に認識するときに初めてimportする）
+def loadModel(modelname):
+    import torch
+    import whisper
+
+    logger.info("Cuda.available:{}".format(torch.cuda.is_available()))
+
+    # pyinstallerでバイナリを作った場合、whisperのassetsが存在しないためコピーする
+    if os.path.exists("whisper/assets"):  # assetsフォルダがある場合
+        assetsdir = os.path.join(os.path.dirname(whisper.__file__), "assets")
+        logger.debug("assetsdir:{}".format(assetsdir))
+        if os.path.exists(assetsdir):  # 通常であればここにassetsディレクトリがあるはず
+            logger.debug("whisperのディレクトリにassetsディレクトリあり")
+        else:
+            logger.info("assetsディレクトリをコピー")
+            shutil.copytree("whisper/assets", assetsdir)
+    else:
+        logger.debug("currentにassetsなし")
+
+    logger.info("whisperモデル読み込み開始：{}".format(modelname))
+    ret = whisper.load_model(modelname)
+    logger.info("whisperモデル読み込み完了：{}".format(modelname))
+
+    return ret
+
+
 # 直接起動した場合
 if __name__ == "__main__":
     if len(sys.argv) < 2:
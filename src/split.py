@@ -1,23 +1,32 @@
 import os
 import sys
-from inaSpeechSegmenter import Segmenter
-from inaSpeechSegmenter.export_funcs import seg2csv, seg2textgrid
 from collections import deque
 import common
 import seg
+import artifact_cache
+import energy_vad
 import codecs
 
 logger = common.getLogger(__file__)
 
 CONFIG_WORK_KEY = "split"
+VERSION = 1  # 分割の方法を変えたら上げる（処理結果のキャッシュのキーに使う）
 
 
-def main(input_file):
+def main(input_file, settings=None):
     # txtファイルに出力された無音検出結果から、音声ファイルをどのように分割するかを決定する（実際に分割はしない）
     logger.info("2-1. 音声分割設定開始 - {}".format(os.path.basename(input_file)))
 
+    if settings is None:  # 呼び出し元から渡されなかったら共通の設定を使う
+        settings = common.getSettings()
+
     config = common.readConfig(input_file)
-    if config["DEFAULT"].get(CONFIG_WORK_KEY) == common.DONE:
+    split_len = config["DEFAULT"].getint(
+        seg.CONFIG_SEG_SPLIT, settings.seg_tmp_audio_length
+    )  # 分割単位(バージョンによっては音声のiniに書いていないので、commonから取得)
+
+    # 無音解析結果と分割の条件が前回と同じなら、やり直さない
+    if common.isStageDone(input_file, CONFIG_WORK_KEY, lambda: getCacheParams(input_file, settings, split_len)):
         logger.info("完了済みのためスキップ(音声分割設定)")
         return
 
@@ -37,19 +46,28 @@ def main(input_file):
 
     logger.info("分析結果ファイル読み込み中…")
 
-    isRecognizeNoize = common.isRecognizeNoize()
+    isRecognizeNoize = settings.is_recognize_noize
     logger.info("ノイズ部分も認識対象にするかどうか：{}".format(isRecognizeNoize))
 
-    split_len = config["DEFAULT"].getint(
-        seg.CONFIG_SEG_SPLIT, common.getSegTmpAudioLength()
-    )  # 分割単位(バージョンによっては音声のiniに書いていないので、commonから取得)
     logger.info("分割単位：{}min".format(int(split_len / 60 / 1000)))
 
+    # 同じ無音解析結果から同じ条件で分割設定したことがあれば、キャッシュから結果を書き出して終わる
+    audio_file_prefix = common.getSplitAudioFilePrefix(input_file)  # 分割して出力する音声ファイルのフォルダとプレフィックス
+    cache_params = getCacheParams(input_file, settings, split_len)
+    cached_rows = artifact_cache.get(CONFIG_WORK_KEY, cache_params, settings)
+    if cached_rows is not None:
+        # キャッシュにはファイル名をプレフィックスからの相対で入れている
+        common.writeSplitResult(input_file, [[row[0], audio_file_prefix + row[1]] + row[2:] for row in cached_rows])
+        common.markStageDone(input_file, CONFIG_WORK_KEY, cache_params)
+        logger.info("音声分割設定終了！(キャッシュ) {}".format(os.path.basename(input_file)))
+        return
+
     while True:
         seg_result_file = common.getSegResultFile(input_file, seg_resultfile_index)
 
-        # 分析結果ファイルがなければ終了
-        if os.path.exists(seg_result_file) == False:
+        # 分析結果がなければ終了
+        file_data = common.readSegResult(input_file, seg_resultfile_index)
+        if file_data is None:
             break
 
         logger.info(
@@ -58,105 +76,100 @@ def main(input_file):
             )
         )
 
-        # 分析結果ファイル（タブ区切り）を開く
-        with open(seg_result_file, "r") as f:
-            segment_label = ""
-
-            f.readline()  # ヘッダを読み捨て
-
-            file_data = f.readlines()
-            for line in file_data:
-                segment = line.split("\t")
-
-                index += 1
-                # logger.info ("分析結果ファイル読み込み中… {}".format(index))
-
-                segment_label = segment[0]
-
-                # 区間の開始時刻の単位を秒からミリ秒に変換 + ファイル番号によって補正
-                start_time = float(segment[1]) * 1000 + float(
-                    split_len * seg_resultfile_index
-                )
-                end_time = float(segment[2]) * 1000 + float(
-                    split_len * seg_resultfile_index
-                )
-                org_start_time = start_time
-                org_end_time = end_time
-
-                # 認識対象とするかどうか
-                is_target = False
-                if isRecognizeNoize:  # 無音区間以外を認識対象とする
-                    if segment_label != "noEnergy":  # 無音区間以外なら認識対象とする（noiseなども対象）
-                        is_target = True
-                else:
-                    if segment_label == "speech":  #  'speech' のみ認識対象とする
-                        is_target = True
-
-                if is_target:
-                    if connect:  # 1つ前と連結させる
-                        prev = segmentation.pop()
-                        start_time = prev["start_time"]
-                        org_start_time = prev["org_start_time"]
-                    else:  # 今回が音がある部分の先頭
-                        start_time -= min(
-                            prev_noEnergy_length, 500
-                        )  # 前回の無音部分の0.5秒を頭に入れる
-
-                    connect = False
-                    prev_fixed = False
-                    prev_length = end_time - start_time
-
-                    mlength = 2 * 60 * 1000  # N分ごとに区切る(これ以上長いと音声認識がエラーを返す可能性がある)
-                    while True:
-                        length = end_time - start_time
-
-                        if length < mlength:
-                            segmentation.append(
-                                {
-                                    "segment_label": segment_label,
-                                    "start_time": start_time,
-                                    "end_time": end_time,
-                                    "org_start_time": org_start_time,
-                                    "org_end_time": org_end_time,
-                                }
-                            )  # push(音声の末尾部分)
-                            break
-                        else:
-                            segmentation.append(
-                                {
-                                    "segment_label": segment_label,
-                                    "start_time": start_time,
-                                    "end_time": start_time + mlength,
-                                    "org_start_time": org_start_time,
-                                    "org_end_time": start_time + mlength,
-                                }
-                            )  # push(N分)
-                            start_time += mlength
-                            org_start_time = start_time
-                            logger.debug("length > mlength: length={}".format(length))
-
-                else:  # 無音区間
+        segment_label = ""
+
+        for segment in file_data:
+            index += 1
+            # logger.info ("分析結果ファイル読み込み中… {}".format(index))
+
+            segment_label = segment[0]
+
+            # 区間の開始時刻の単位を秒からミリ秒に変換 + ファイル番号によって補正
+            start_time = float(segment[1]) * 1000 + float(
+                split_len * seg_resultfile_index
+            )
+            end_time = float(segment[2]) * 1000 + float(
+                split_len * seg_resultfile_index
+            )
+            org_start_time = start_time
+            org_end_time = end_time
+
+            # 認識対象とするかどうか
+            is_target = False
+            if isRecognizeNoize:  # 無音区間以外を認識対象とする
+                if segment_label != "noEnergy":  # 無音区間以外なら認識対象とする（noiseなども対象）
+                    is_target = True
+            else:
+                if segment_label == "speech":  #  'speech' のみ認識対象とする
+                    is_target = True
+                elif segment_label == energy_vad.LABEL_ENERGY:  # 音量だけで判定した場合は音声かどうか分からないので対象とする
+                    is_target = True
+
+            if is_target:
+                if connect:  # 1つ前と連結させる
+                    prev = segmentation.pop()
+                    start_time = prev["start_time"]
+                    org_start_time = prev["org_start_time"]
+                else:  # 今回が音がある部分の先頭
+                    start_time -= min(
+                        prev_noEnergy_length, 500
+                    )  # 前回の無音部分の0.5秒を頭に入れる
+
+                connect = False
+                prev_fixed = False
+                prev_length = end_time - start_time
+
+                mlength = 2 * 60 * 1000  # N分ごとに区切る(これ以上長いと音声認識がエラーを返す可能性がある)
+                while True:
                     length = end_time - start_time
-                    prev_noEnergy_length = length
-                    connect = False
-                    if len(segmentation) > 0:
-                        if (
-                            length < 1 * 1000 and length + prev_length < 5 * 1000
-                        ):  # 無音がX秒未満(息継ぎとかを無視したい)、Y秒未満の場合(長すぎにならないようにする)は、次の音声と接続させる
-                            connect = True
-                            logger.debug("connect. len:{}".format(length))
-                        elif prev_fixed == False:
-                            prev = (
-                                segmentation.pop()
-                            )  # 無音がX秒以上の場合は、前の音声が確定する。前の音声の終了時間を伸ばす（最後に無音がつく。最大5秒とする。5秒でいいかは微妙）⇒認識が遅くなるが、こっちの方が精度がいい
-                            prev["end_time"] += min(length, 5000)
-                            segmentation.append(prev)  # push
-                            prev_fixed = True  # 何度も連結しないようにする
-                            logger.debug(
-                                "prev_fixed. {},{}".format(
-                                    prev["start_time"], prev["end_time"]
-                                )
+
+                    if length < mlength:
+                        segmentation.append(
+                            {
+                                "segment_label": segment_label,
+                                "start_time": start_time,
+                                "end_time": end_time,
+                                "org_start_time": org_start_time,
+                                "org_end_time": org_end_time,
+                            }
+                        )  # push(音声の末尾部分)
+                        break
+                    else:
+                        segmentation.append(
+                            {
+                                "segment_label": segment_label,
+                                "start_time": start_time,
+                                "end_time": start_time + mlength,
+                                "org_start_time": org_start_time,
+                                "org_end_time": start_time + mlength,
+                            }
+                        )  # push(N分)
+                        start_time += mlength
+                        org_start_time = start_time
+                        logger.debug("length > mlength: length={}".format(length))
+
+            else:  # 無音区間
+                length = end_time - start_time
+                prev_noEnergy_length = length
+                connect = False
+                if len(segmentation) > 0:
+                    if (
+                        length < 1 * 1000 and length + prev_length < 5 * 1000
+                    ):  # 無音がX秒未満(息継ぎとかを無視したい)、Y秒未満の場合(長すぎにならないようにする)は、次の音声と接続させる
+                        connect = True
+                        logger.debug("connect. len:{}".format(length))
+                    elif prev_fixed == False:
+                        prev = (
+                            segmentation.pop()
+                        )  # 無音がX秒以上の場合は、前の音声が確定する。前の音声の終了時間を伸ばす（最後に無音がつく。最大5秒とする。5秒でいいかは微妙）⇒認識が遅くなるが、こっちの方が精度がいい
+                        prev["end_time"] += min(length, 5000)
+                        segmentation.append(prev)  # push
+                        prev_fixed = True  # 何度も連結しないようにする
+                        logger.debug(
+                            "prev_fixed. {},{}".format(
+                                prev["start_time"], prev["end_time"]
                             )
+                        )
 
         seg_resultfile_index += 1  # 次のファイルへ
         if segment_label != "noEnergy":  # 音声ありの状態でファイルが閉じた場合、次のファイルと連結させるために長さ0の無音区間を作る
@@ -177,60 +190,83 @@ def main(input_file):
     logger.info("分割結果ファイル：{}".format(os.path.basename(split_result_file)))
     base = os.path.splitext(os.path.basename(input_file))[0]  # 拡張子なしのファイル名（話者）
 
-    with open(split_result_file, "w", encoding="CP932") as f:  # 分割結果ファイルに結果書き込み+音声書き込み
-        speech_segment_index = 1
-        index = 0
-
-        # 分割して出力する音声ファイルのフォルダとプレフィックスまで指定
-        audio_file_prefix = common.getSplitAudioFilePrefix(input_file)
-
-        logger.debug("音声分割設定中… {}".format(base))
-
-        for segment in segmentation:
-            # segmentはタプル
-            # タプルの第1要素が区間のラベル
-            segment_label = segment["segment_label"]
-
-            index = index + 1
-            # logger.debug ("音声分割中… {}/{}".format(index, len(segmentation)))
-
-            if (index % 100) == 0 or (
-                len(segmentation) == index
-            ):  # 100行ごとか、最後の1行で進捗を出す
-                logger.debug(
-                    "　音声分割設定中… {} {}/{}".format(base, index, len(segmentation))
-                )
-
-            if segment_label != "noEnergy":  # 無音区間以外の部分だけを出力する
-                start_time = segment["start_time"]
-                end_time = segment["end_time"]
-                org_start_time = segment["org_start_time"]
-                org_end_time = segment["org_end_time"]
-
-                filename = "{}{}.flac".format(audio_file_prefix, speech_segment_index)
-
-                # 分割結果の時間やファイル名など
-                # ID,分割した音声ファイル名(flac),開始時間(冒頭無音あり),終了時間(末尾無音あり),長さ(無音あり),開始時間(冒頭無音なし),長さ(末尾無音なし)の順
-                f.write(
-                    "{}	{}	{}	{}	{}	{}	{}\n".format(
-                        speech_segment_index,
-                        filename,
-                        start_time,
-                        end_time,
-                        end_time - start_time,
-                        org_start_time,
-                        org_end_time,
-                    )
-                )
-
-                speech_segment_index += 1
-
-    # 終了したことをiniファイルに保存
-    common.updateConfig(input_file, {CONFIG_WORK_KEY: common.DONE})
+    split_rows = list()  # 分割結果ファイルに書き込む行
+    speech_segment_index = 1
+    index = 0
+
+    logger.debug("音声分割設定中… {}".format(base))
+
+    for segment in segmentation:
+        # segmentはタプル
+        # タプルの第1要素が区間のラベル
+        segment_label = segment["segment_label"]
+
+        index = index + 1
+        # logger.debug ("音声分割中… {}/{}".format(index, len(segmentation)))
+
+        if (index % 100) == 0 or (
+            len(segmentation) == index
+        ):  # 100行ごとか、最後の1行で進捗を出す
+            logger.debug(
+                "　音声分割設定中… {} {}/{}".format(base, index, len(segmentation))
+            )
+
+        if segment_label != "noEnergy":  # 無音区間以外の部分だけを出力する
+            start_time = segment["start_time"]
+            end_time = segment["end_time"]
+            org_start_time = segment["org_start_time"]
+            org_end_time = segment["org_end_time"]
+
+            filename = "{}{}.flac".format(audio_file_prefix, speech_segment_index)
+
+            # 分割結果の時間やファイル名など
+            # ID,分割した音声ファイル名(flac),開始時間(冒頭無音あり),終了時間(末尾無音あり),長さ(無音あり),開始時間(冒頭無音なし),長さ(末尾無音なし)の順
+            split_rows.append(
+                [
+                    speech_segment_index,
+                    filename,
+                    start_time,
+                    end_time,
+                    end_time - start_time,
+                    org_start_time,
+                    org_end_time,
+                ]
+            )
+
+            speech_segment_index += 1
+
+    # 分割結果ファイルに結果書き込み
+    common.writeSplitResult(input_file, split_rows)
+    artifact_cache.put(
+        CONFIG_WORK_KEY,
+        cache_params,
+        [[row[0], row[1][len(audio_file_prefix) :]] + row[2:] for row in split_rows],
+        settings,
+    )
+
+    # 終了したことを、入力の指紋と一緒にiniファイルに保存
+    common.markStageDone(input_file, CONFIG_WORK_KEY, cache_params)
 
     logger.info("音声分割設定終了！ {}".format(os.path.basename(input_file)))
 
 
+# キャッシュのキー・入力の指紋にする条件（無音解析結果の内容と、分割の条件）
+def getCacheParams(input_file, settings, split_len):
+    seg_results = []
+    while True:
+        segmentation = common.readSegResult(input_file, len(seg_results))
+        if segmentation is None:
+            break
+        seg_results.append([list(segment) for segment in segmentation])
+
+    return {
+        "seg": artifact_cache.contentHash(seg_results),
+        "split_len": split_len,
+        "is_recognize_noize": settings.is_recognize_noize,
+        "version": VERSION,
+    }
+
+
 # 直接起動した場合
 if __name__ == "__main__":
     if len(sys.argv) < 2:
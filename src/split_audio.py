@@ -4,33 +4,39 @@ import common
 import speech_rec
 import speech_rec_wit
 import speech_rec_whisper
-import shutil
-import codecs
+import ffmpegjob
+import pcm_cache
 
 logger = common.getLogger(__file__)
 
 CONFIG_WORK_KEY = "split_audio"
 
+BATCH_SIZE = 50  # 1回のffmpegで切り出す分割ファイルの最大数
+BATCH_DURATION = 10 * 60 * 1000  # 1回のffmpegで切り出す範囲の最大の長さ（ミリ秒）
 
-def main(input_file):
+
+def main(input_file, settings=None):
     # 音声ファイルをtxtファイルに出力された結果に従って分割
     logger.info("2-2. 音声分割開始 - {}".format(os.path.basename(input_file)))
 
+    if settings is None:  # 呼び出し元から渡されなかったら共通の設定を使う
+        settings = common.getSettings()
+
     # 音声認識済みなら音声分割をスキップする
     needSplitFiles = False
 
-    if speech_rec.reasonNotToRecognize(input_file) is None:  # 音声認識(Google) が未完了なら分割する
+    if speech_rec.reasonNotToRecognize(input_file, settings) is None:  # 音声認識(Google) が未完了なら分割する
         logger.info("　進捗確認：音声認識(Google) 未完了")
         needSplitFiles = True
 
     if (
-        speech_rec_wit.reasonNotToRecognize(input_file) is None
+        speech_rec_wit.reasonNotToRecognize(input_file, settings) is None
     ):  # 音声認識(wit.ai) が未完了なら分割する
         logger.info("　進捗確認：音声認識(wit.ai) 未完了")
         needSplitFiles = True
 
     if (
-        speech_rec_whisper.reasonNotToRecognize(input_file) is None
+        speech_rec_whisper.reasonNotToRecognize(input_file, settings) is None
     ):  # 音声認識(whisper) が未完了なら分割する
         logger.info("　進捗確認：音声認識(whisper) 未完了")
         needSplitFiles = True
@@ -52,51 +58,127 @@ def main(input_file):
     # 実際に音声を分割する
     base = os.path.splitext(os.path.basename(input_file))[0]  # 拡張子なしのファイル名（話者）
 
-    with codecs.open(split_result_file, "r", "CP932") as f:
-        logger.info("音声分割中… {}".format(base))
-        index = 0
-
-        file_data = f.readlines()
-        for line in file_data:
-            # ID,分割した音声ファイル名(flac),開始時間(冒頭無音あり),終了時間(末尾無音あり),長さ(無音あり),開始時間(冒頭無音なし),長さ(末尾無音なし)の順 _split.txt
-            data = line.split("\t")
-            filename = data[1]
-            start_time = float(data[2])
-            end_time = float(data[3])
-
-            index += 1
-
-            if (index % 100) == 0 or (len(file_data) == index):  # 100行ごとか、最後の1行で進捗を出す
-                logger.info("　音声分割中… {} {}/{}".format(base, index, len(file_data)))
-                common.logForGui(logger, "split_audio", input_file, progress=index, max=len(file_data))
-
-            if os.path.exists(filename):  # 分割した音声ファイル(flac)が存在する場合
-                split_audio_file_mttime = os.stat(filename).st_mtime
-                if (
-                    split_audio_file_mttime > split_result_file_mttime
-                ):  # 音声分割結果ファイルより後に作られた音声ファイルならOK
-                    logger.debug("変換後のファイルが存在しているためスキップ:{}".format(filename))
-                    continue
-
-                logger.debug("変換後のファイルが存在しているが、古いので作り直す:{}".format(filename))
-
-            # いったんテンポラリファイルに吐く（ffmpegの処理中にプロセスが落ちると中途半端なファイルが残ってしまうのを防ぐ）
-            tmp_audio_file = common.getTemporaryFile(input_file, __file__, "flac")
-            process_str = 'ffmpeg -ss {} -t {} -i "{}" -vn -acodec flac -y "{}"'.format(
-                    start_time / 1000,
-                    (end_time - start_time) / 1000,
-                    input_file,
-                    tmp_audio_file,
+    logger.info("音声分割中… {}".format(base))
+
+    # 分割元の音声（設定によっては、元のサンプリングレートのままデコードしたwavから切り出す。圧縮音声のデコードとシークを繰り返さなくてよい）
+    source_file = input_file
+    if settings.is_use_full_rate_pcm:
+        source_file = pcm_cache.getFullRatePcmFile(input_file)
+    logger.info("分割元：{}".format(os.path.basename(source_file)))
+
+    # 作り直しが必要なファイルを集める。近くにある分割ファイルは1回のffmpegで（音声を1回だけデコードして）まとめて切り出す
+    file_data = common.readSplitResult(input_file)
+    batches = []  # 1回のffmpegで切り出す分割ファイル [(ファイル名, 開始時間, 終了時間), ...] のリスト
+    skipped = 0
+    for data in file_data:
+        # ID,分割した音声ファイル名(flac),開始時間(冒頭無音あり),終了時間(末尾無音あり),長さ(無音あり),開始時間(冒頭無音なし),長さ(末尾無音なし)の順 _split.txt
+        filename = data[1]
+        start_time = float(data[2])
+        end_time = float(data[3])
+
+        if os.path.exists(filename):  # 分割した音声ファイル(flac)が存在する場合
+            split_audio_file_mttime = os.stat(filename).st_mtime
+            if (
+                split_audio_file_mttime > split_result_file_mttime
+            ):  # 音声分割結果ファイルより後に作られた音声ファイルならOK
+                logger.debug("変換後のファイルが存在しているためスキップ:{}".format(filename))
+                skipped += 1
+                continue
+
+            logger.debug("変換後のファイルが存在しているが、古いので作り直す:{}".format(filename))
+
+        if (
+            len(batches) == 0
+            or len(batches[-1]) >= BATCH_SIZE
+            or start_time < batches[-1][0][1]
+            or end_time - batches[-1][0][1] > BATCH_DURATION
+        ):  # 数が多すぎたり、離れすぎていたら別のffmpegで切り出す
+            batches.append([])
+        batches[-1].append((filename, start_time, end_time))
+
+    logger.info("ffmpeg実行回数：{} (分割ファイル数：{} 作成済み：{})".format(len(batches), len(file_data), skipped))
+
+    # テンポラリファイルに吐いてからリネームするのは実行エンジンが行う（ffmpegの処理中にプロセスが落ちると中途半端なファイルが残ってしまうのを防ぐ）
+    jobs = [(batch, submitBatch(source_file, batch)) for batch in batches]
+    done = skipped
+    try:
+        for batch, job in jobs:
+            try:
+                job.result()
+            except Exception as e:  # まとめて切り出せなかったら、1つずつ並列に切り出す
+                common.isErrorOccurred()  # キャンセルされていたら例外
+                logger.info("まとめて分割できなかったため1つずつ分割します({}件)：{}".format(len(batch), e))
+                single_jobs = [submitSingle(source_file, *item) for item in batch]
+                try:
+                    for single_job in single_jobs:
+                        single_job.result()  # 失敗していたら例外
+                finally:
+                    for single_job in single_jobs:
+                        single_job.cancel()
+
+            # 100件ごとか、最後に進捗を出す
+            if done // 100 != (done + len(batch)) // 100 or done + len(batch) == len(file_data):
+                logger.info("　音声分割中… {} {}/{}".format(base, done + len(batch), len(file_data)))
+                common.logForGui(
+                    logger, "split_audio", input_file, progress=done + len(batch), max=len(file_data)
                 )
-            logger.debug("ffmpeg process:{}".format(process_str))
-            res = common.runSubprocess(process_str)
-
-            # テンポラリファイルからリネーム、上書き
-            shutil.move(tmp_audio_file, filename)
+            done += len(batch)
+    finally:
+        for batch, job in jobs:  # 失敗したら残りは実行しない
+            job.cancel()
 
     logger.info("音声分割終了！ {}".format(os.path.basename(input_file)))
 
 
+# 複数の分割ファイルを1回のffmpegで切り出すジョブを登録する（まとめた範囲だけをシーク・デコードし、出力ごとに範囲を指定する）
+def submitBatch(source_file, batch):
+    batch_start_time = batch[0][1]
+    batch_end_time = max(end_time for filename, start_time, end_time in batch)
+
+    process_args = [
+        "ffmpeg",
+        "-y",
+        "-ss",
+        str(batch_start_time / 1000),
+        "-t",
+        str((batch_end_time - batch_start_time) / 1000),
+        "-i",
+        source_file,
+    ]
+    for filename, start_time, end_time in batch:
+        process_args += [
+            "-ss",
+            str((start_time - batch_start_time) / 1000),
+            "-t",
+            str((end_time - start_time) / 1000),
+            "-vn",
+            "-acodec",
+            "flac",
+            ffmpegjob.OUTPUT,
+        ]
+    logger.debug("ffmpeg process:{} {}".format(process_args, [item[0] for item in batch]))
+    return ffmpegjob.submit(process_args, output_file=[item[0] for item in batch])
+
+
+# 分割ファイルを1つだけ切り出すジョブを登録する
+def submitSingle(source_file, filename, start_time, end_time):
+    process_args = [
+        "ffmpeg",
+        "-ss",
+        str(start_time / 1000),
+        "-t",
+        str((end_time - start_time) / 1000),
+        "-i",
+        source_file,
+        "-vn",
+        "-acodec",
+        "flac",
+        "-y",
+    ]
+    logger.debug("ffmpeg process:{} {}".format(process_args, filename))
+    return ffmpegjob.submit(process_args, output_file=filename)
+
+
 # 直接起動した場合
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -4,6 +4,7 @@ import threading
 from concurrent.futures import ThreadPoolExecutor, wait
 
 lock = threading.Lock()
+updated = threading.Condition(lock)  # キューに積まれたことを待っているスレッドに知らせる
 
 REC_KEY_GOOGLE = "GOOGLE"
 REC_KEY_WITAI = "WITAI"
@@ -25,6 +26,7 @@ def pushReadyRecognizeList(input_file):
     with lock:
         for key in REC_KEYS:
             ready_recognize[key].append(input_file)
+        updated.notify_all()
 
 
 # 音声認識対象のキューから取得（空の場合はNoneを返す）
@@ -58,6 +60,7 @@ def pushReadyConvertList(key, input_file):
     global ready_convert
     with lock:
         ready_convert[key].append(input_file)
+        updated.notify_all()
 
 
 # Google音声認識が完了したキューに積む
@@ -102,3 +105,15 @@ def popReadyConvertList(pop_and):
                 pass
 
         return ret
+
+
+# キューに何か積まれるか、他のスレッドの状態が変わるまで待つ（最大timeout秒）
+def waitForUpdate(timeout):
+    with updated:
+        updated.wait(timeout)
+
+
+# 待っているスレッドを起こす（スレッドが終了したときなど）
+def notifyUpdate(*args):
+    with updated:
+        updated.notify_all()
@@ -0,0 +1,163 @@
+import os
+import csv
+import json
+import bisect
+import common
+import pcm_cache
+import ffmpegjob
+import cpu_budget
+
+logger = common.getLogger(__file__)
+
+# バイナリ版Whisper(whisper.cppを改造したmain)で音声認識する
+# Windowsでは whisper/main.exe(とwhisper.dll)、Linuxなどでは whispercpp/ でビルドした whispercpp/main を使う。
+# PyTorch版より速くメモリも少なくて済むので、CPUしかない環境に向いている。
+# デコード済みの16kHz monoのwavを whisper_binary_duration ごとに区切り、区切りごとに1回mainを実行する。
+# 分割結果ファイルを有声部分として渡す(-vb)ので、セグメント以外の部分は認識しない。
+# 認識結果(区間ごとの開始・終了時間とテキスト)は _x_whisper_segment.csv に区切りごとに書き足していき、最後に分割結果のセグメントに振り分ける。
+
+BINARY_FILES = [os.path.join("whisper", "main.exe"), os.path.join("whispercpp", "main")]
+MODEL_DIR = os.path.join("whisper", "models")
+OUTPUT_SEPARATOR = "------------------------------------"  # mainが区間ごとに出力する区切りの行
+
+CONFIG_PROGRESS = "whisper_binary_progress"  # どこまで認識したか（入力の指紋と、認識済みの時間(ミリ秒)）
+
+
+# mainのパス（なければNone）
+def getBinaryFile():
+    for binary_file in BINARY_FILES:
+        if os.path.exists(binary_file):
+            return binary_file
+    return None
+
+
+# モデルファイルのパス
+def getModelFile(modelname):
+    return os.path.join(MODEL_DIR, "ggml-{}.bin".format(modelname))
+
+
+# バイナリ版Whisperが使えない理由（ログに出力する文字列）を返す。使えるならNoneを返す
+def reasonUnavailable(modelname):
+    if getBinaryFile() is None:
+        return "バイナリ版Whisperの実行ファイルがありません({})".format(", ".join(BINARY_FILES))
+    if not os.path.exists(getModelFile(modelname)):
+        return "バイナリ版Whisperのモデルがありません({})".format(getModelFile(modelname))
+    return None
+
+
+# 音声ファイルを区切りごとに認識して、区間ごとの (開始時間, 終了時間, テキスト) のリストを返す
+# fingerprintは認識の入力の指紋（変わっていたら、途中まで認識した結果は使わない）
+def recognize(input_file, settings, fingerprint):
+    segment_file = common.getSegmentFileWhisper(input_file)
+    duration = int(common.getDuration(input_file))
+    window = settings.whisper_binary_duration
+
+    # 途中まで認識していたら続きから
+    rows = []
+    progress = 0
+    config = common.readConfig(input_file)
+    try:
+        state = json.loads(config["DEFAULT"].get(CONFIG_PROGRESS, ""))
+        if state["fingerprint"] == fingerprint:
+            rows = [row for row in readSegmentFile(segment_file) if row[0] < state["progress"]]
+            progress = state["progress"]
+            logger.info("認識途中のデータがあったため再開({}sec認識済み)".format(progress // 1000))
+    except (ValueError, KeyError, TypeError, OSError):
+        pass
+
+    while progress < duration:
+        end = min(progress + window, duration)
+        rows += runWindow(input_file, settings, progress, end)
+        writeSegmentFile(segment_file, rows)
+        common.updateConfig(
+            input_file, {CONFIG_PROGRESS: json.dumps({"fingerprint": fingerprint, "progress": end})}, flush=True
+        )
+        progress = end
+
+        logger.info(
+            "　音声認識中(whisper binary)… {} {}/{}min".format(
+                os.path.basename(input_file), progress // 60000, duration // 60000
+            )
+        )
+        common.logForGui(
+            logger, "rec", input_file, progress=progress, max=duration, info={"engine": "whisper"}
+        )
+
+        if common.isErrorOccurred():  # 他のスレッドでエラーが起きていたら強制終了する
+            return None
+
+    return rows
+
+
+# start～end(ミリ秒)の範囲を認識して、区間ごとの (開始時間, 終了時間, テキスト) のリストを返す
+def runWindow(input_file, settings, start, end):
+    args = [
+        getBinaryFile(),
+        "-m", getModelFile(settings.whisper_model),
+        "-l", settings.whisper_language,
+        "-t", str(cpu_budget.getThreads(cpu_budget.WHISPER)),  # 無音解析と同時に動かす場合は、割り当てられた分だけ
+        "-ot", str(start),
+        "-d", str(end - start),
+        "-vb", common.getSplitResultFile(input_file),
+        pcm_cache.getPcmFile(input_file),
+    ]
+    logger.debug("whisper binary:{}".format(args))
+
+    # キャンセル時にkillされるように、ffmpegと同じ方法で実行する
+    result = ffmpegjob.execute(args, None)
+    if result["returncode"] != 0:
+        raise RuntimeError(
+            "バイナリ版Whisperの実行に失敗しました(終了コード{})：{}".format(result["returncode"], result["stderr"][-1000:])
+        )
+
+    return [row for row in parseOutput(result["stdout"]) if start <= row[0] < end]
+
+
+# mainの標準出力から、区間ごとの (開始時間, 終了時間, テキスト) のリストを取り出す
+# 区間ごとに「開始時間(ミリ秒)、終了時間(ミリ秒)、テキスト、トークン、トークンID」の行を出し、区切りの行で終わる
+def parseOutput(stdout):
+    rows = []
+    for block in stdout.replace("\r\n", "\n").split(OUTPUT_SEPARATOR):
+        lines = block.lstrip("\n").split("\n")
+        if len(lines) < 3:
+            continue
+        try:
+            rows.append((int(lines[0]), int(lines[1]), lines[2].strip()))
+        except ValueError:  # 区間以外の出力
+            continue
+    return rows
+
+
+# 認識中間ファイルを読む
+def readSegmentFile(segment_file):
+    with open(segment_file, "r", encoding="utf-8", newline="") as f:
+        return [(int(row[0]), int(row[1]), row[2]) for row in csv.reader(f) if len(row) >= 3]
+
+
+# 認識中間ファイルを書く（書き込み途中で落ちても壊れないように、テンポラリファイルからリネームする）
+def writeSegmentFile(segment_file, rows):
+    tmp_file = segment_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8", newline="") as f:
+        csv.writer(f).writerows(rows)
+    os.replace(tmp_file, segment_file)
+
+
+# 区間ごとの認識結果を、重なりが一番大きい(なければ一番近い)セグメントに振り分けて、テキストのdict(key=id)を返す
+# segmentsは開始時間順の {"id", "start_time", "end_time"} のリスト
+def alignSegments(segments, rows):
+    starts = [segment["start_time"] for segment in segments]
+    texts = {segment["id"]: "" for segment in segments}
+    if len(segments) == 0:
+        return texts
+
+    for start, end, text in rows:
+        index = bisect.bisect_right(starts, (start + end) / 2) - 1
+        candidates = segments[max(0, index - 1) : index + 2]
+
+        def score(segment):
+            overlap = min(end, segment["end_time"]) - max(start, segment["start_time"])
+            distance = abs((start + end) / 2 - (segment["start_time"] + segment["end_time"]) / 2)
+            return (overlap, -distance)
+
+        texts[max(candidates, key=score)["id"]] += text
+    return texts
@@ -0,0 +1,160 @@
+import queue
+import threading
+import traceback
+import multiprocessing
+import common
+import cpu_budget
+import pcm_cache
+
+logger = common.getLogger(__file__)
+
+# Whisper(python版)の推論を複数のワーカープロセスで行う
+# PyTorchのCPU推論は短い音声ではスレッドを増やしてもあまり速くならないので、1プロセスのスレッド数を絞ってプロセスを並べる。
+# 各プロセスがモデルを読み込み(重みはプロセスごとに持つ)、デコード済みのwavは各プロセスでmemmapする(OSのキャッシュを共有する)。
+# メインのプロセスは分割結果のセグメントを仕事(まとめたセグメントかバッチ)に分けて渡し、終わった順に結果を受け取る。
+# 結果の記録(ジャーナル)と認識結果ファイルの出力はメインのプロセスで行うので、途中からの再開や出力の順番は1プロセスの場合と変わらない。
+
+WORKER_THREADS = 4  # 自動で決める場合の、1プロセスあたりのスレッド数の目安
+WORKER_MEMORY = {  # 1プロセスあたりに見込むメモリ（モデルの重みとPyTorch本体）
+    "tiny": 512 * 1024 * 1024,
+    "base": 768 * 1024 * 1024,
+    "small": 1536 * 1024 * 1024,
+    "medium": 4 * 1024 * 1024 * 1024,
+    "large": 8 * 1024 * 1024 * 1024,
+}
+
+lock = threading.Lock()
+pool = None  # 起動中のワーカープロセス {"modelname", "processes", "tasks", "results"}
+
+
+# Whisperで認識するプロセスの数（whisper_workers、0ならCPUのコア数とメモリから決める。1なら別プロセスにしない）
+def getWorkers(settings):
+    if settings.is_use_binary_whisper:  # バイナリ版はwhisper.cpp自体がスレッドで並列に動く
+        return 1
+    if settings.whisper_workers > 0:
+        return settings.whisper_workers
+
+    import torch
+
+    if torch.cuda.is_available():  # GPUはプロセスを分けても速くならない
+        return 1
+
+    workers = cpu_budget.getTotalThreads(settings) // WORKER_THREADS
+    memory = common.getAvailableMemory()
+    if memory is not None:
+        model_memory = WORKER_MEMORY.get(settings.whisper_model.split(".")[0].split("-")[0], WORKER_MEMORY["large"])
+        workers = min(workers, memory // 2 // model_memory)  # 空きメモリの半分まで
+    return max(1, workers)
+
+
+# ワーカープロセスを起動する（同じモデル・プロセス数で起動済みならそのまま使う）
+def start(modelname, workers):
+    global pool
+
+    with lock:
+        if pool is not None and pool["modelname"] == modelname and len(pool["processes"]) == workers:
+            return pool
+        stopPool()
+
+        logger.info("Whisperのワーカープロセス起動：{}プロセス".format(workers))
+        context = multiprocessing.get_context("spawn")  # torchを読み込んだプロセスをforkすると固まることがある
+        tasks = context.Queue()
+        results = context.Queue()
+        logs = common.getWorkerLogQueue(context)  # ログはメインのプロセスが書く
+        processes = []
+        for _ in range(workers):
+            process = context.Process(target=workerMain, args=(modelname, tasks, results, logs), daemon=True)
+            process.start()
+            processes.append(process)
+
+        pool = {"modelname": modelname, "processes": processes, "tasks": tasks, "results": results}
+        return pool
+
+
+# ワーカープロセスを止める（認識が全部終わったら、モデルのメモリを解放するために呼ぶ）
+def stop():
+    with lock:
+        stopPool()
+
+
+# ワーカープロセスを止める（lockを取ってから呼ぶ）
+def stopPool():
+    global pool
+
+    if pool is None:
+        return
+    for process in pool["processes"]:  # 認識中でも待たずに止める（途中の結果は捨てる）
+        process.terminate()
+    for process in pool["processes"]:
+        process.join()
+    pool = None
+    logger.debug("Whisperのワーカープロセス停止")
+
+
+# まとめたセグメント(packSegmentsの結果)をワーカープロセスで認識して、(セグメントのlist, テキストのlist) を終わった順に返していく
+# 同時に渡す仕事の数とスレッド数は、CPUの割り当て(cpu_budget)に合わせて仕事を渡すたびに決める
+def recognizeUnits(input_file, units, settings, workers, batch_size):
+    import speech_rec_whisper
+
+    current = start(settings.whisper_model, workers)
+    wav_file = pcm_cache.getPcmFile(input_file)
+    waiting = speech_rec_whisper.groupUnits(units, batch_size)
+    waiting.reverse()  # 先頭から取り出す
+    running = set()
+    task_id = 0
+
+    try:
+        while len(waiting) > 0 or len(running) > 0:
+            budget = cpu_budget.getThreads(cpu_budget.WHISPER)
+            active = max(1, min(workers, budget))  # 割り当てがプロセス数より少なければ、一部のプロセスだけを動かす
+            threads = max(1, budget // active)
+            while len(waiting) > 0 and len(running) < active:
+                task_id += 1
+                current["tasks"].put((task_id, wav_file, waiting.pop(), settings.whisper_language, batch_size, threads))
+                running.add(task_id)
+
+            try:
+                done_id, result, error = current["results"].get(timeout=1)
+            except queue.Empty:
+                if common.isErrorOccurred():  # 他のスレッドでエラーが起きていたら強制終了する
+                    return
+                for process in current["processes"]:
+                    if not process.is_alive():
+                        raise RuntimeError("Whisperのワーカープロセスが終了しました(終了コード{})".format(process.exitcode))
+                continue
+
+            if error is not None:
+                raise RuntimeError("Whisperのワーカープロセスでエラーが発生しました：\n{}".format(error))
+            running.discard(done_id)
+            for segments, texts in result:
+                yield segments, texts
+    finally:
+        if len(running) > 0:  # 途中でやめた場合、渡した仕事の結果が後から届かないように止める
+            stop()
+
+
+# ワーカープロセスの処理（モデルを読み込んで、仕事がなくなるまで認識する）
+def workerMain(modelname, tasks, results, logs):
+    common.sendLogsToWorkerParent(logs)
+
+    import speech_rec_whisper
+
+    try:
+        speech_rec_whisper.model = speech_rec_whisper.loadModel(modelname)
+    except Exception:
+        results.put((None, None, traceback.format_exc()))
+        return
+
+    while True:
+        task_id, wav_file, units, language, batch_size, threads = tasks.get()
+        try:
+            speech_rec_whisper.torch_threads = threads
+            # wavは仕事ごとに開いて、終わったら閉じる（トラックの認識が終わった後、変換時にwavを消せるように。Windowsではmemmap中のファイルは消せない）
+            source = pcm_cache.openWav(wav_file)
+            try:
+                result = list(speech_rec_whisper.recognizeUnits(source, units, language, batch_size))
+            finally:
+                del source
+            results.put((task_id, result, None))
+        except Exception:
+            results.put((task_id, None, traceback.format_exc()))
@@ -8,6 +8,7 @@
 #include <cmath>
 #include <fstream>
 #include <cstdio>
+#include <cstring>
 #include <string>
 #include <thread>
 #include <vector>
@@ -81,7 +82,7 @@ void whisper_print_usage(int argc, char ** argv, const whisper_params & params);
 // 音声ファイルの有声部分を書いたファイルを読み込む
 void whisper_init_voice_block_list(char* filename) {
     FILE* fp;
-    fopen_s(&fp, filename, "r");
+    fp = fopen(filename, "r"); // fopen_sはMSVCにしかないため
 
     fprintf(stderr, "voice block file: %s\n", filename);
 